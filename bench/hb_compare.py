@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+#
+###############################################################################
+#   Copyright (C) 2018 Cortney T. Buffington, N0MJS <n0mjs@me.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software Foundation,
+#   Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+###############################################################################
+
+'''
+Benchmarks of the operations HBlink does for every frame (or every check)
+that have been rewritten to go faster, each timed against the code it
+replaced. That code is kept here, as it was before the rewrite, so the two
+can be compared again on any host or Python:
+
+    acl     ACL check: scan of every (start, end) entry vs hb_config's set
+            and bisect over merged ranges
+    lc      Rewriting the LC in each burst of a call forwarded to a target:
+            bitarray slicing vs hb_confbridge's byte splices
+    slot    Contention checks and TX state update for an HBP target slot in
+            hb_confbridge: dicts of dicts vs SlotState
+    dmrd    DMRD header decode: slices and branches vs hblink.decode_dmrd()
+    hmac    Checking an OpenBridge frame's HMAC: keyed for every frame vs a
+            copy of the object OPENBRIDGE keys once
+    log     What logging costs the reactor thread: a file handler and IDs
+            formatted up front vs hb_log's LogID and queued handler
+
+Each case is run over a range of whatever parameters it depends on. Every
+variant is first run over the same inputs and has to give the same results
+as the old code -- so the comparison is of two ways of doing the same thing
+-- then timed over those inputs, best of --repeat passes with the garbage
+collector off, in ns per operation.
+'''
+
+from __future__ import print_function, division
+
+import os
+import gc
+import sys
+import atexit
+import logging
+import argparse
+from collections import OrderedDict
+from hashlib import sha1
+from hmac import new as hmac_new, compare_digest
+from itertools import product
+from platform import node, python_version
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import strftime
+from timeit import default_timer
+
+from bitarray import bitarray
+
+from hb_loadtest import SUB_ID, PEER_ID, NETWORK_ID, PASSPHRASE, GROUP_HANGTIME, voice_call, dmrd, describe_tree, save_results
+
+import hb_config
+import hb_confbridge
+import hb_const as const
+from hb_log import LogID, QueueHandler
+from hblink import SlotState, decode_dmrd
+from dmr_utils import bptc
+from dmr_utils.const import LC_OPT
+from dmr_utils.utils import hex_str_3, hex_str_4, int_id
+
+__author__     = 'Cortney T. Buffington, N0MJS'
+__copyright__  = 'Copyright (c) 2018 Cortney T. Buffington, N0MJS and the K0USY Group'
+__license__    = 'GNU GPLv3'
+__maintainer__ = 'Cort Buffington, N0MJS'
+__email__      = 'n0mjs@me.com'
+
+
+# ACL entries are built from IDs starting here
+ACL_BASE = 1000000
+# Calls are on this TGID, and forwarded to TARGET_TGID
+TGID = 9
+TARGET_TGID = 3100
+
+
+#************************************************
+#     THE OLD CODE
+#************************************************
+
+# hb_config.acl_build() and hblink.acl_check() before ACLs were compiled: a
+# set of (start, end) tuples, every one of them looked at by every check that
+# doesn't match
+def old_acl_build(_acl, _max):
+    if not _acl:
+        return (True, set([(const.ID_MIN, _max)]))
+    acl = set()
+    sections = _acl.split(':')
+    action = sections[0] == 'PERMIT'
+    for entry in sections[1].split(','):
+        if entry == 'ALL':
+            acl.add((const.ID_MIN, _max))
+            break
+        elif '-' in entry:
+            start, end = entry.split('-')
+            acl.add((int(start), int(end)))
+        else:
+            acl.add((int(entry), int(entry)))
+    return (action, acl)
+
+def old_acl_check(_id, _acl):
+    id = int_id(_id)
+    for entry in _acl[1]:
+        if entry[0] <= id <= entry[1]:
+            return _acl[0]
+    return not _acl[0]
+
+# The routers' LC rewrite before it was done a byte at a time: the burst
+# through a bitarray and back, whether it was changed or not
+def old_rewrite_lc(_frame_type, _dtype_vseq, dmrpkt, _h_lc, _t_lc, _emb_lc):
+    dmrbits = bitarray(endian='big')
+    dmrbits.frombytes(dmrpkt)
+    if _frame_type == const.HBPF_DATA_SYNC and _dtype_vseq == const.HBPF_SLT_VHEAD:
+        dmrbits = _h_lc[0:98] + dmrbits[98:166] + _h_lc[98:197]
+    elif _frame_type == const.HBPF_DATA_SYNC and _dtype_vseq == const.HBPF_SLT_VTERM:
+        dmrbits = _t_lc[0:98] + dmrbits[98:166] + _t_lc[98:197]
+    elif _dtype_vseq in [1,2,3,4]:
+        dmrbits = dmrbits[0:116] + _emb_lc[_dtype_vseq] + dmrbits[148:264]
+    return dmrbits.tobytes()
+
+# routerHBP's contention checks and TX state update for an HBP target, when
+# the slots were dicts of dicts (logging and reports left out)
+def old_hbp_target(_self_status, _slot, _target_status, _target, _target_system, _rf_src, _peer_id, _stream_id, _dtype_vseq, pkt_time):
+    if ((_target['TGID'] != _target_status[_target['TS']]['RX_TGID']) and ((pkt_time - _target_status[_target['TS']]['RX_TIME']) < _target_system['GROUP_HANGTIME'])):
+        return False
+    if ((_target['TGID'] != _target_status[_target['TS']]['TX_TGID']) and ((pkt_time - _target_status[_target['TS']]['TX_TIME']) < _target_system['GROUP_HANGTIME'])):
+        return False
+    if (_target['TGID'] == _target_status[_target['TS']]['RX_TGID']) and ((pkt_time - _target_status[_target['TS']]['RX_TIME']) < const.STREAM_TO):
+        return False
+    if (_target['TGID'] == _target_status[_target['TS']]['TX_TGID']) and (_rf_src != _target_status[_target['TS']]['TX_RFS']) and ((pkt_time - _target_status[_target['TS']]['TX_TIME']) < const.STREAM_TO):
+        return False
+
+    if (_stream_id != _self_status[_slot]['RX_STREAM_ID']) or (_target_status[_target['TS']]['TX_RFS'] != _rf_src) or (_target_status[_target['TS']]['TX_TGID'] != _target['TGID']):
+        _target_status[_target['TS']]['TX_START'] = pkt_time
+        _target_status[_target['TS']]['TX_TGID'] = _target['TGID']
+        _target_status[_target['TS']]['TX_STREAM_ID'] = _stream_id
+        _target_status[_target['TS']]['TX_RFS'] = _rf_src
+        _target_status[_target['TS']]['TX_PEER'] = _peer_id
+
+    _target_status[_target['TS']]['TX_TIME'] = pkt_time
+    _target_status[_target['TS']]['TX_TYPE'] = _dtype_vseq
+    return True
+
+# The header decode each of hblink's DMRD receive paths had inline
+def old_decode_dmrd(_data):
+    _peer_id = _data[11:15]
+    _seq = _data[4]
+    _rf_src = _data[5:8]
+    _dst_id = _data[8:11]
+    _bits = int_id(_data[15])
+    _slot = 2 if (_bits & 0x80) else 1
+    if _bits & 0x40:
+        _call_type = 'unit'
+    elif (_bits & 0x23) == 0x23:
+        _call_type = 'vcsbk'
+    else:
+        _call_type = 'group'
+    _frame_type = (_bits & 0x30) >> 4
+    _dtype_vseq = (_bits & 0xF)
+    _stream_id = _data[16:20]
+    return _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id
+
+# OPENBRIDGE's HMAC check when the key went into a new HMAC for every frame
+def old_check_hmac(_packet, _key):
+    _data = _packet[:53]
+    _hash = _packet[53:]
+    _ckhs = hmac_new(_key, _data, sha1).digest()
+    return compare_digest(_hash, _ckhs)
+
+
+#************************************************
+#     THE NEW CODE
+#************************************************
+
+# The same rewrite as the routers do it now
+def new_rewrite_lc(_frame_type, _dtype_vseq, dmrpkt, _lc):
+    if _frame_type == const.HBPF_DATA_SYNC and _dtype_vseq == const.HBPF_SLT_VHEAD:
+        return hb_confbridge.splice_full_lc(dmrpkt, _lc[0])
+    elif _frame_type == const.HBPF_DATA_SYNC and _dtype_vseq == const.HBPF_SLT_VTERM:
+        return hb_confbridge.splice_full_lc(dmrpkt, _lc[1])
+    elif _dtype_vseq in [1,2,3,4]:
+        return hb_confbridge.splice_emb_lc(dmrpkt, _lc[2][_dtype_vseq])
+    return dmrpkt
+
+# The same checks and update with SlotState, as routerHBP does them now
+def new_hbp_target(_self_status, _slot, _target_status, _target, _target_system, _rf_src, _peer_id, _stream_id, _dtype_vseq, pkt_time):
+    _tgt_slot = _target_status[_target['TS']]
+    if ((_target['TGID'] != _tgt_slot.RX_TGID) and ((pkt_time - _tgt_slot.RX_TIME) < _target_system['GROUP_HANGTIME'])):
+        return False
+    if ((_target['TGID'] != _tgt_slot.TX_TGID) and ((pkt_time - _tgt_slot.TX_TIME) < _target_system['GROUP_HANGTIME'])):
+        return False
+    if (_target['TGID'] == _tgt_slot.RX_TGID) and ((pkt_time - _tgt_slot.RX_TIME) < const.STREAM_TO):
+        return False
+    if (_target['TGID'] == _tgt_slot.TX_TGID) and (_rf_src != _tgt_slot.TX_RFS) and ((pkt_time - _tgt_slot.TX_TIME) < const.STREAM_TO):
+        return False
+
+    if (_stream_id != _self_status[_slot].RX_STREAM_ID) or (_tgt_slot.TX_RFS != _rf_src) or (_tgt_slot.TX_TGID != _target['TGID']):
+        _tgt_slot.TX_START = pkt_time
+        _tgt_slot.TX_TGID = _target['TGID']
+        _tgt_slot.TX_STREAM_ID = _stream_id
+        _tgt_slot.TX_RFS = _rf_src
+        _tgt_slot.TX_PEER = _peer_id
+
+    _tgt_slot.TX_TIME = pkt_time
+    _tgt_slot.TX_TYPE = _dtype_vseq
+    return True
+
+# The check as OPENBRIDGE does it now, from the HMAC it keyed at startup
+def new_check_hmac(_packet, _keyed):
+    _data = _packet[:53]
+    _hash = _packet[53:]
+    _hmac = _keyed.copy()
+    _hmac.update(_data)
+    return compare_digest(_hash, _hmac.digest())
+
+
+#************************************************
+#     THE CASES
+#************************************************
+
+# Each returns (inputs as argument tuples, variants as an OrderedDict of name:
+# function, the old code first)
+
+# A DENY ACL of _params['ENTRIES'] entries, half single IDs and half ranges,
+# checked against subscriber IDs spread over (and a little past) the IDs it
+# covers, so some are found as single IDs, some in ranges and some not at all
+def case_acl(_params, _args, _random):
+    _entries = _params['ENTRIES']
+    _ids = [ACL_BASE + 3 * _n for _n in range(_entries // 2)]
+    _ranges = [(ACL_BASE + 3 * _entries + 10 * _n, ACL_BASE + 3 * _entries + 10 * _n + 4) for _n in range(_entries - _entries // 2)]
+    _acl = 'DENY:' + ','.join([str(_id) for _id in _ids] + ['{}-{}'.format(*_range) for _range in _ranges])
+    _span = ACL_BASE + 3 * _entries + 10 * len(_ranges) + 100
+
+    _old = old_acl_build(_acl, const.ID_MAX)
+    _new = hb_config.acl_build(_acl, const.ID_MAX)
+    _inputs = [(hex_str_3(_random.randint(ACL_BASE, _span)),) for _ in range(_args.OPS)]
+    return _inputs, OrderedDict([
+        ('scan', lambda _id: old_acl_check(_id, _old)),
+        ('compiled', lambda _id: hb_config.acl_check(_id, _new))
+    ])
+
+# The bursts of voice calls from _args.CALLS subscribers (_args.SUPERFRAMES
+# superframes each), rewritten with the LC for another TGID. Each variant has
+# the target's LC encoded already, as the routers do at the start of a stream.
+def case_lc(_params, _args, _random):
+    _inputs = []
+    _lcs = []
+    for _n in range(_args.CALLS):
+        _rf_src = hex_str_3(SUB_ID + _n)
+        _lc = LC_OPT + hex_str_3(TARGET_TGID) + _rf_src
+        _encoded = (bptc.encode_header_lc(_lc), bptc.encode_terminator_lc(_lc), bptc.encode_emblc(_lc))
+        _lcs.append((_encoded, hb_confbridge.encode_lc(_lc)))
+        _inputs.extend([(_bits >> 4, _bits & 0xF, _burst, _n) for _bits, _burst in voice_call(_rf_src, hex_str_3(TGID), _args.SUPERFRAMES)])
+    return _inputs, OrderedDict([
+        ('bitarray', lambda _frame_type, _dtype_vseq, _burst, _n: old_rewrite_lc(_frame_type, _dtype_vseq, _burst, *_lcs[_n][0])),
+        ('byte splice', lambda _frame_type, _dtype_vseq, _burst, _n: new_rewrite_lc(_frame_type, _dtype_vseq, _burst, _lcs[_n][1]))
+    ])
+
+# Calls from _args.CALLS subscribers on TS1 of a master, bridged to TS2 of
+# _params['TARGETS'] other masters, one frame every 60ms and a second between
+# calls. Every fourth call is on another TGID, and is held off the targets
+# until their group hangtime runs out. The slots start out idle at the start
+# of every pass.
+def case_slot(_params, _args, _random):
+    _inputs = []
+    _time = 100.0
+    for _n in range(_args.CALLS):
+        _tgid = hex_str_3(TARGET_TGID + 1 if _n % 4 == 3 else TARGET_TGID)
+        _stream_id = hex_str_4(_random.getrandbits(32))
+        for _bits, _burst in voice_call(hex_str_3(SUB_ID + _n), _tgid, _args.SUPERFRAMES):
+            _inputs.append((not _inputs, _tgid, hex_str_3(SUB_ID + _n), _stream_id, _bits & 0xF, _time))
+            _time += 0.06
+        _time += 1
+    _peer_id = hex_str_4(PEER_ID)
+    _target_system = {'GROUP_HANGTIME': GROUP_HANGTIME}
+    _rules = dict((_tgid, {'SYSTEM': 'MASTER-1', 'TS': 2, 'TGID': _tgid}) for _tgid in set([_input[1] for _input in _inputs]))
+
+    def idle(_slot):
+        _slot.RX_TIME = _slot.TX_TIME = 0
+        return _slot
+
+    def variant(_hbp_target, _make_status, _set_stream):
+        _state = {}
+        def forward(_first, _tgid, _rf_src, _stream_id, _dtype_vseq, _time):
+            if _first:
+                _state['SOURCE'] = _make_status()
+                _state['TARGETS'] = [_make_status() for _ in range(_params['TARGETS'])]
+            _sent = tuple([_hbp_target(_state['SOURCE'], 1, _target_status, _rules[_tgid], _target_system, _rf_src, _peer_id, _stream_id, _dtype_vseq, _time) for _target_status in _state['TARGETS']])
+            _set_stream(_state['SOURCE'][1], _stream_id)
+            return _sent
+        return forward
+
+    def dict_status():
+        return dict((_ts, dict((_key, getattr(idle(SlotState()), _key)) for _key in SlotState.__slots__)) for _ts in (1, 2))
+
+    def slot_status():
+        return dict((_ts, idle(SlotState())) for _ts in (1, 2))
+
+    def set_dict(_slot, _stream_id):
+        _slot['RX_STREAM_ID'] = _stream_id
+
+    def set_slot(_slot, _stream_id):
+        _slot.RX_STREAM_ID = _stream_id
+
+    return _inputs, OrderedDict([
+        ('dicts', variant(old_hbp_target, dict_status, set_dict)),
+        ('SlotState', variant(new_hbp_target, slot_status, set_slot))
+    ])
+
+# The DMRD packets of voice calls from _args.CALLS subscribers, on either slot,
+# every fifth one a unit (private) call
+def case_dmrd(_params, _args, _random):
+    _inputs = []
+    for _n in range(_args.CALLS):
+        _rf_src = hex_str_3(SUB_ID + _n)
+        _stream_id = hex_str_4(_random.getrandbits(32))
+        _flags = (0x80 if _n % 2 else 0) | (0x40 if _n % 5 == 4 else 0)
+        _inputs.extend([(dmrd(_seq & 0xFF, _rf_src, hex_str_3(TGID), hex_str_4(PEER_ID), _bits | _flags, _stream_id, _burst) + '\x00\x00',)
+                        for _seq, (_bits, _burst) in enumerate(voice_call(_rf_src, hex_str_3(TGID), _args.SUPERFRAMES))])
+    return _inputs, OrderedDict([
+        ('slices', old_decode_dmrd),
+        ('decode_dmrd', decode_dmrd)
+    ])
+
+# The frames of voice calls from _args.CALLS subscribers as an OpenBridge
+# partner signs them, every tenth one with a bad signature
+def case_hmac(_params, _args, _random):
+    _key = PASSPHRASE.ljust(20, '\x00')[:20]
+    _keyed = hmac_new(_key, digestmod=sha1)
+    _inputs = []
+    for _n in range(_args.CALLS):
+        _rf_src = hex_str_3(SUB_ID + _n)
+        _stream_id = hex_str_4(_random.getrandbits(32))
+        for _seq, (_bits, _burst) in enumerate(voice_call(_rf_src, hex_str_3(TGID), _args.SUPERFRAMES)):
+            _data = dmrd(_seq & 0xFF, _rf_src, hex_str_3(TGID), hex_str_4(NETWORK_ID), _bits, _stream_id, _burst)
+            _hash = hmac_new(_key, _data, sha1).digest()
+            if len(_inputs) % 10 == 9:
+                _hash = _hash[::-1]
+            _inputs.append((_data + _hash,))
+    return _inputs, OrderedDict([
+        ('keyed per frame', lambda _packet: old_check_hmac(_packet, _key)),
+        ('keyed once', lambda _packet: new_check_hmac(_packet, _keyed))
+    ])
+
+# The log lines a conference bridge writes as it forwards calls from
+# _args.CALLS subscribers: a DEBUG line for every frame and an INFO line as
+# each call starts, with the logger set to _params['LEVEL']. Each variant
+# logs to a file of its own; the queued one is only timed for handing records
+# over, not for the listener thread writing them. Run unpaced like this, the
+# queue soon has more waiting than LOG_QUEUE_PRESSURE and sheds DEBUG records,
+# as it would in a burst. Nothing is returned, so there is nothing to compare.
+def case_log(_params, _args, _random):
+    _workdir = mkdtemp(prefix='hb_compare.')
+    atexit.register(rmtree, _workdir, True)
+    _formatter = logging.Formatter('%(levelname)s %(message)s')
+
+    def make_logger(_name, _queued):
+        _handler = logging.FileHandler(os.path.join(_workdir, _name + '.log'))
+        _handler.setFormatter(_formatter)
+        if _queued:
+            _handler = QueueHandler([_handler])
+            atexit.register(_handler.stop)
+        _logger = logging.getLogger('hb_compare.' + _name)
+        _logger.handlers = [_handler]
+        _logger.propagate = False
+        _logger.setLevel(_params['LEVEL'])
+        return _logger
+
+    _inputs = []
+    for _n in range(_args.CALLS):
+        _rf_src = hex_str_3(SUB_ID + _n)
+        for _bits, _burst in voice_call(_rf_src, hex_str_3(TGID), _args.SUPERFRAMES):
+            _inputs.append(((_bits >> 4, _bits & 0xF) == (const.HBPF_DATA_SYNC, const.HBPF_SLT_VHEAD), _rf_src, hex_str_3(TARGET_TGID)))
+
+    def eager(_logger):
+        def log(_start, _rf_src, _tgid):
+            if _start:
+                _logger.info('(%s) Conference Bridge: %s, Call Bridged to HBP System: %s TS: %s, TGID: %s, SUB: %s', 'MASTER-0', 'BENCH', 'MASTER-1', 2, int_id(_tgid), int_id(_rf_src))
+            _logger.debug('(%s) Forwarding to HBP System: %s TS: %s, TGID: %s, SUB: %s', 'MASTER-0', 'MASTER-1', 2, int_id(_tgid), int_id(_rf_src))
+        return log
+
+    def lazy(_logger):
+        def log(_start, _rf_src, _tgid):
+            if _start:
+                _logger.info('(%s) Conference Bridge: %s, Call Bridged to HBP System: %s TS: %s, TGID: %s, SUB: %s', 'MASTER-0', 'BENCH', 'MASTER-1', 2, LogID(_tgid), LogID(_rf_src))
+            _logger.debug('(%s) Forwarding to HBP System: %s TS: %s, TGID: %s, SUB: %s', 'MASTER-0', 'MASTER-1', 2, LogID(_tgid), LogID(_rf_src))
+        return log
+
+    return _inputs, OrderedDict([
+        ('sync, int_id', eager(make_logger('sync-int_id', False))),
+        ('sync, LogID', lazy(make_logger('sync-LogID', False))),
+        ('queued, LogID', lazy(make_logger('queued-LogID', True)))
+    ])
+
+# name: (function, the parameters it depends on)
+CASES = OrderedDict([
+    ('acl', (case_acl, ('ENTRIES',))),
+    ('lc',  (case_lc,  ())),
+    ('slot', (case_slot, ('TARGETS',))),
+    ('dmrd', (case_dmrd, ())),
+    ('hmac', (case_hmac, ())),
+    ('log',  (case_log,  ('LEVEL',)))
+])
+
+
+#************************************************
+#     MEASUREMENT
+#************************************************
+
+# The inputs every variant gives a different result for than the first does
+def check_variants(_inputs, _variants):
+    _names = list(_variants)
+    _expected = [_variants[_names[0]](*_input) for _input in _inputs]
+    _wrong = {}
+    for _name in _names[1:]:
+        _results = [_variants[_name](*_input) for _input in _inputs]
+        _count = sum([_result != _want for _result, _want in zip(_results, _expected)])
+        if _count:
+            _wrong[_name] = _count
+    return _wrong
+
+# Best time for a pass over every input, in ns per operation
+def time_variant(_func, _inputs, _repeat):
+    _best = None
+    _gc = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(_repeat):
+            _start = default_timer()
+            for _input in _inputs:
+                _func(*_input)
+            _elapsed = default_timer() - _start
+            _best = _elapsed if _best is None else min(_best, _elapsed)
+    finally:
+        if _gc:
+            gc.enable()
+    return _best / len(_inputs) * 1e9
+
+def run_case(_name, _params, _args):
+    _inputs, _variants = CASES[_name][0](_params, _args, Random(_args.SEED))
+    _wrong = check_variants(_inputs, _variants)
+    if _wrong:
+        sys.exit('{} {}: results differ from the old code for {}'.format(_name, _params, ', '.join(['{} ({} of {})'.format(_variant, _wrong[_variant], len(_inputs)) for _variant in _wrong])))
+    return OrderedDict([(_variant, time_variant(_variants[_variant], _inputs, _args.REPEAT)) for _variant in _variants])
+
+def print_result(_name, _params, _result):
+    _params = ' '.join(['{}={}'.format(_param.lower(), _params[_param]) for _param in sorted(_params)]) or '-'
+    _old = list(_result.values())[0]
+    for _variant in _result:
+        print('{:8} {:20} {:16} {:12.0f} {:8.2f}x'.format(_name, _params, _variant, _result[_variant], _old / _result[_variant]))
+
+
+def int_list(_value):
+    return [int(_item) for _item in _value.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time rewritten per-frame operations against the code they replaced.')
+    parser.add_argument('-c', '--case', dest='CASE', default=','.join(CASES), help='Comma separated cases to run: ' + ', '.join(CASES))
+    parser.add_argument('--entries', dest='ENTRIES', type=int_list, default=[10, 1000, 10000], help='Entries in the ACL (comma separated list to run each).')
+    parser.add_argument('--targets', dest='TARGETS', type=int_list, default=[1, 4], help='Systems each frame is forwarded to.')
+    parser.add_argument('--level', dest='LEVEL', type=lambda _value: _value.split(','), default=['WARNING', 'INFO', 'DEBUG'], help='Logger levels for the log case.')
+    parser.add_argument('--ops', dest='OPS', type=int, default=2000, help='Operations (different inputs) in a pass, for the cases that don\'t work on voice calls.')
+    parser.add_argument('--calls', dest='CALLS', type=int, default=20, help='Calls, each from a different subscriber, for the cases that work on voice calls.')
+    parser.add_argument('--superframes', dest='SUPERFRAMES', type=int, default=10, help='Superframes in each call.')
+    parser.add_argument('--repeat', dest='REPEAT', type=int, default=5, help='Passes to time; the best is reported.')
+    parser.add_argument('--seed', dest='SEED', type=int, default=0, help='Random seed for the inputs.')
+    parser.add_argument('-r', '--results', dest='RESULTS', help='Also append the results to this JSON lines file.')
+    cli_args = parser.parse_args()
+
+    _commit, _dirty = describe_tree(None)
+
+    print('{:8} {:20} {:16} {:>12} {:>9}'.format('case', 'params', 'variant', 'ns/op', 'speedup'))
+    for _name in cli_args.CASE.split(','):
+        if _name not in CASES:
+            sys.exit('Unknown case {}, choose from {}'.format(_name, ', '.join(CASES)))
+        _depends = CASES[_name][1]
+        for _values in product(*[getattr(cli_args, _param) for _param in _depends]):
+            _params = dict(zip(_depends, _values))
+            _result = run_case(_name, _params, cli_args)
+            print_result(_name, _params, _result)
+            if cli_args.RESULTS:
+                save_results(cli_args.RESULTS, {
+                    'COMMIT': _commit,
+                    'DIRTY': _dirty,
+                    'TIME': strftime('%Y-%m-%d %H:%M:%S'),
+                    'HOST': node(),
+                    'PYTHON': python_version(),
+                    'CASE': _name,
+                    'PARAMS': _params,
+                    'OPS': cli_args.OPS,
+                    'RESULTS': _result
+                })
@@ -0,0 +1,973 @@
+#!/usr/bin/env python
+#
+###############################################################################
+#   Copyright (C) 2018 Cortney T. Buffington, N0MJS <n0mjs@me.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software Foundation,
+#   Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+###############################################################################
+
+'''
+End to end load test for hb_confbridge.py and hblink.py. A copy of the tree
+(or of any commit, with --rev) is started on loopback with a generated
+hblink.cfg and bridge rules, and driven by emulated MMDVM repeaters -- each
+one logs in with RPTL/RPTK/RPTC and keeps itself alive with RPTPING -- and
+OpenBridge partners that sign every frame they send and check every frame
+they get. Each stream is a voice call the way a repeater sends it: a voice
+header, superframes of bursts A-F one burst every 60ms, and a terminator.
+
+Every forwarded frame is matched to the frame that caused it by stream ID and
+sequence number. That gives frames forwarded per second, the latency through
+the application for each kind of hop (HBP>HBP, HBP>OBP, OBP>OBP), loss, and
+the CPU the application used per stream. Results are appended to a JSON lines
+file along with the commit they were measured at, and --history shows how a
+scenario has moved from commit to commit.
+
+With --flood, spoofed RPTLs and RPTKs -- logins from sources that will never
+finish them -- go to the masters at a steady rate from the start of the login
+to the end of the run, while the repeaters log in and carry their traffic as
+usual. The summary then shows how many repeaters made it in and how long it
+took them, next to the latencies they saw.
+
+Latencies include the load generator's own scheduling. The summary says so if
+the generator used most of a CPU itself or fell behind its 60ms schedule, as
+the numbers are then more about it than about HBlink.
+'''
+
+from __future__ import print_function, division
+
+import os
+import sys
+import json
+import shutil
+import signal
+import socket
+import argparse
+import subprocess
+from hashlib import sha256, sha1
+from hmac import new as hmac_new, compare_digest
+from heapq import heappush, heappop
+from select import poll, POLLIN
+from tempfile import mkdtemp
+from platform import node
+from random import Random
+from time import time, strftime
+
+from bitarray import bitarray
+from dmr_utils import bptc
+from dmr_utils.const import BS_VOICE_SYNC, BS_DATA_SYNC, EMB, SLOT_TYPE, LC_OPT
+from dmr_utils.utils import hex_str_3, hex_str_4
+
+# The tree under test -- this script lives in bench/
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+import hb_const as const
+
+__author__     = 'Cortney T. Buffington, N0MJS'
+__copyright__  = 'Copyright (c) 2018 Cortney T. Buffington, N0MJS and the K0USY Group'
+__license__    = 'GNU GPLv3'
+__maintainer__ = 'Cort Buffington, N0MJS'
+__email__      = 'n0mjs@me.com'
+
+
+APPS = {'confbridge': 'hb_confbridge.py', 'hblink': 'hblink.py'}
+
+# One voice burst every 60ms
+FRAME_TIME = 0.060
+# A send this far behind schedule counts as late
+LATE_TIME = 0.010
+# How long to wait for forwarded frames after the last send
+DRAIN_TIME = 1.0
+# Seconds between login attempts for a peer that isn't connected
+LOGIN_RETRY = 2.0
+# GROUP_HANGTIME for the masters. Their slots start out in hangtime, so calls
+# to them are held off for this long after the application starts -- the
+# warmup is never shorter.
+GROUP_HANGTIME = 5
+
+PASSPHRASE = 'loadtest'
+PEER_ID = 310000            # peer n is PEER_ID + n
+SUB_ID = 3100000            # the subscriber calling from peer or partner n is SUB_ID + n
+NETWORK_ID = 3129000        # OpenBridge network IDs, HBlink's side
+HBP_TGID = 100              # TGID for stream n from a repeater is HBP_TGID + n
+OBP_TGID = 5000             # and from an OpenBridge partner, OBP_TGID + n
+FLOOD_ID = 900000           # spoofed logins are for peer IDs from FLOOD_ID up
+
+CLK_TCK = float(os.sysconf('SC_CLK_TCK')) if hasattr(os, 'sysconf') else 100.0
+
+
+#************************************************
+#     FRAMES
+#************************************************
+
+# 216 bits of AMBE for every burst -- nothing looks inside them
+AMBE = bitarray()
+AMBE.frombytes(os.urandom(27))
+
+# A voice header or terminator: the BPTC encoded full LC with the slot type and
+# data sync in the middle
+def full_lc_burst(_encoded_lc, _slot_type):
+    return (_encoded_lc[0:98] + _slot_type[:10] + BS_DATA_SYNC + _slot_type[10:] + _encoded_lc[98:196]).tobytes()
+
+# The DMR payloads of a group voice call, as (HBP frame type/voice sequence bits,
+# payload): voice header, _superframes of bursts A-F, voice terminator. The LC
+# goes in the header and terminator and is embedded in bursts B-E.
+def voice_call(_rf_src, _dst_id, _superframes):
+    _lc = LC_OPT + _dst_id + _rf_src
+    _emb_lc = bptc.encode_emblc(_lc)
+    _bursts = [(const.HBPF_VOICE_SYNC << 4, (AMBE[:108] + BS_VOICE_SYNC + AMBE[108:]).tobytes())]
+    for _vseq, _emb in enumerate(('BURST_B', 'BURST_C', 'BURST_D', 'BURST_E'), 1):
+        _bursts.append((_vseq, (AMBE[:108] + EMB[_emb][:8] + _emb_lc[_vseq] + EMB[_emb][8:] + AMBE[108:]).tobytes()))
+    _bursts.append((5, (AMBE[:108] + EMB['BURST_F'][:8] + bitarray(32 * '0') + EMB['BURST_F'][8:] + AMBE[108:]).tobytes()))
+
+    return [(const.HBPF_DATA_SYNC << 4 | const.HBPF_SLT_VHEAD, full_lc_burst(bptc.encode_header_lc(_lc), SLOT_TYPE['VOICE_LC_HEAD']))] + \
+           _bursts * _superframes + \
+           [(const.HBPF_DATA_SYNC << 4 | const.HBPF_SLT_VTERM, full_lc_burst(bptc.encode_terminator_lc(_lc), SLOT_TYPE['VOICE_LC_TERM']))]
+
+def dmrd(_seq, _rf_src, _dst_id, _peer_id, _bits, _stream_id, _payload):
+    return ''.join(('DMRD', chr(_seq), _rf_src, _dst_id, _peer_id, chr(_bits), _stream_id, _payload))
+
+
+#************************************************
+#     EMULATED REPEATERS AND OPENBRIDGE PARTNERS
+#************************************************
+
+# What a repeater sends after RPTC: its ID and its configuration
+def repeater_config(_radio_id, _name):
+    return ''.join((
+        _radio_id,
+        'LOADTEST'.ljust(8)[:8],            # CALLSIGN
+        '449000000',                        # RX_FREQ
+        '444000000',                        # TX_FREQ
+        '25',                               # TX_POWER
+        '01',                               # COLORCODE
+        '38.0000'.ljust(8)[:8],             # LATITUDE
+        '-095.0000'.ljust(9)[:9],           # LONGITUDE
+        '075',                              # HEIGHT
+        'Loopback'.ljust(20)[:20],          # LOCATION
+        _name.ljust(19)[:19],               # DESCRIPTION
+        '3',                                # SLOTS
+        ''.ljust(124),                      # URL
+        'hb_loadtest'.ljust(40),            # SOFTWARE_ID
+        'hb_loadtest'.ljust(40)             # PACKAGE_ID
+    ))
+
+
+class Endpoint(object):
+    def __init__(self, _name, _bind, _target, _meter):
+        self.NAME = _name
+        self.TARGET = _target
+        self.METER = _meter
+        self.SOCK = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.SOCK.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 21)
+        self.SOCK.bind(_bind)
+        self.SOCK.setblocking(False)
+
+    def send(self, _packet):
+        self.SOCK.sendto(_packet, self.TARGET)
+
+    def close(self):
+        self.SOCK.close()
+
+
+# An MMDVM repeater logged in to one of HBlink's masters
+class Repeater(Endpoint):
+    KIND = 'HBP'
+
+    def __init__(self, _index, _bind, _master, _meter):
+        Endpoint.__init__(self, 'REPEATER-{}'.format(_index), _bind, _master, _meter)
+        self.RADIO_ID = hex_str_4(PEER_ID + _index)
+        self.STATE = 'NO'
+        self.TIME = 0
+        self.PONGS = 0
+        self.NAKS = 0
+        self.CONFIG = repeater_config(self.RADIO_ID, self.NAME)
+
+    def login(self, _now):
+        self.STATE = 'RPTL_SENT'
+        self.TIME = _now
+        self.send('RPTL' + self.RADIO_ID)
+
+    def ping(self):
+        self.send('RPTPING' + self.RADIO_ID)
+
+    def frame(self, _seq, _rf_src, _dst_id, _bits, _stream_id, _payload):
+        # BER and RSSI after the DMR payload, as an MMDVM sends them
+        return dmrd(_seq, _rf_src, _dst_id, self.RADIO_ID, _bits, _stream_id, _payload) + '\x00\x00'
+
+    def received(self, _data, _now):
+        _command = _data[:4]
+        if _command == 'DMRD':
+            self.METER.received(self, _data, _now)
+        elif _command == 'MSTP':
+            self.PONGS += 1
+        elif _command == 'RPTA':
+            # What an RPTACK means depends on where we are in the login. The
+            # master's send_peer() tacks the peer ID on after the salt, so
+            # don't go by the length.
+            if self.STATE == 'RPTL_SENT':
+                self.STATE = 'AUTHENTICATED'
+                self.send('RPTK' + self.RADIO_ID + sha256(_data[6:10] + PASSPHRASE).digest())
+            elif self.STATE == 'AUTHENTICATED' and _data[6:10] == self.RADIO_ID:
+                self.STATE = 'CONFIG_SENT'
+                self.send('RPTC' + self.CONFIG)
+            elif self.STATE == 'CONFIG_SENT' and _data[6:10] == self.RADIO_ID:
+                self.STATE = 'YES'
+                self.ping()
+        elif _command == 'MSTN':
+            self.NAKS += 1
+            self.STATE = 'NO'
+
+
+# An OpenBridge partner -- HBlink's OPENBRIDGE system talks to our socket
+class Partner(Endpoint):
+    KIND = 'OBP'
+    STATE = 'YES'
+
+    def __init__(self, _index, _bind, _target, _meter):
+        Endpoint.__init__(self, 'PARTNER-{}'.format(_index), _bind, _target, _meter)
+        self.NETWORK_ID = hex_str_4(NETWORK_ID + 500 + _index)
+        # Keyed the same way HBlink keys it: the passphrase, NUL padded to 20 bytes
+        self.HMAC = hmac_new(PASSPHRASE.ljust(20, '\x00')[:20], digestmod=sha1)
+        self.HMAC_FAILED = 0
+
+    def sign(self, _packet):
+        _hmac = self.HMAC.copy()
+        _hmac.update(_packet)
+        return _packet + _hmac.digest()
+
+    def frame(self, _seq, _rf_src, _dst_id, _bits, _stream_id, _payload):
+        return self.sign(dmrd(_seq, _rf_src, _dst_id, self.NETWORK_ID, _bits, _stream_id, _payload))
+
+    def received(self, _data, _now):
+        if _data[:4] == 'DMRD' and compare_digest(self.sign(_data[:53])[53:], _data[53:]):
+            self.METER.received(self, _data, _now)
+        else:
+            self.HMAC_FAILED += 1
+
+
+# A source of spoofed control traffic: RPTLs for peer IDs it never finishes
+# logging in, and RPTKs answering challenges it was never sent. Replies are
+# only counted.
+class Spoofer(Endpoint):
+    KIND = 'FLOOD'
+
+    def __init__(self, _index, _bind, _master, _meter):
+        Endpoint.__init__(self, 'SPOOFER-{}'.format(_index), _bind, _master, _meter)
+        self.SENT = 0
+        self.REPLIES = 0
+
+    def spoof(self, _random):
+        _peer_id = hex_str_4(FLOOD_ID + _random.randrange(100000))
+        if _random.random() < 0.5:
+            self.send('RPTL' + _peer_id)
+        else:
+            self.send('RPTK' + _peer_id + os.urandom(32))
+        self.SENT += 1
+
+    def received(self, _data, _now):
+        self.REPLIES += 1
+
+
+# A voice stream: one call after another from the same source on the same
+# slot and TGID, each with a new stream ID
+class Stream(object):
+    __slots__ = ('SOURCE', 'SLOT', 'RF_SRC', 'DST_ID', 'RECEIVERS', 'FRAMES', 'GAP', 'RANDOM', 'STREAM_ID', 'SEQ', 'INDEX')
+
+    def __init__(self, _source, _slot, _rf_src, _dst_id, _receivers, _superframes, _gap, _random):
+        self.SOURCE = _source
+        self.SLOT = _slot
+        self.RF_SRC = hex_str_3(_rf_src)
+        self.DST_ID = hex_str_3(_dst_id)
+        self.RECEIVERS = _receivers
+        _slot_bit = 0x80 if _slot == 2 else 0
+        self.FRAMES = [(_bits | _slot_bit, _payload) for _bits, _payload in voice_call(self.RF_SRC, self.DST_ID, _superframes)]
+        self.GAP = _gap
+        self.RANDOM = _random
+        self.SEQ = 0
+        self.INDEX = 0
+        self.new_call()
+
+    def new_call(self):
+        self.STREAM_ID = hex_str_4(self.RANDOM.getrandbits(32))
+        self.INDEX = 0
+
+    # Send the next frame; returns how long until the one after it is due
+    def send(self, _now):
+        _bits, _payload = self.FRAMES[self.INDEX]
+        _packet = self.SOURCE.frame(self.SEQ, self.RF_SRC, self.DST_ID, _bits, self.STREAM_ID, _payload)
+        self.SOURCE.METER.sent((self.STREAM_ID, _packet[4]), _now, self.SOURCE.KIND, len(self.RECEIVERS))
+        self.SOURCE.send(_packet)
+        self.SEQ = (self.SEQ + 1) & 0xFF
+        self.INDEX += 1
+        if self.INDEX < len(self.FRAMES):
+            return FRAME_TIME
+        self.new_call()
+        return FRAME_TIME + self.GAP
+
+
+#************************************************
+#     MEASUREMENT
+#************************************************
+
+class Meter(object):
+    def __init__(self):
+        self.SENT = {}
+        self.START = None
+        self.END = None
+        self.FRAMES_SENT = 0
+        self.EXPECTED = 0
+        self.RECEIVED = 0
+        self.LATE = 0
+        self.LATENCY = {}
+        self.LAST = {}
+        self.JITTER = []
+
+    # Measure frames sent from now until stop()
+    def start(self, _now):
+        self.START = _now
+
+    def stop(self, _now):
+        self.END = _now
+
+    def measuring(self, _sent):
+        return self.START is not None and self.START <= _sent and (self.END is None or _sent < self.END)
+
+    def sent(self, _key, _now, _kind, _expected):
+        self.SENT[_key] = (_now, _kind)
+        if self.measuring(_now):
+            self.FRAMES_SENT += 1
+            self.EXPECTED += _expected
+
+    def received(self, _endpoint, _data, _now):
+        _sent = self.SENT.get((_data[16:20], _data[4]))
+        if _sent is None or not self.measuring(_sent[0]):
+            return
+        _latency = _now - _sent[0]
+        self.RECEIVED += 1
+        self.LATENCY.setdefault(_sent[1] + '>' + _endpoint.KIND, []).append(_latency)
+        # Jitter is the change in latency from one frame of a stream to the next
+        _stream = (_endpoint, _data[16:20])
+        _last = self.LAST.get(_stream)
+        if _last is not None:
+            self.JITTER.append(abs(_latency - _last))
+        self.LAST[_stream] = _latency
+
+
+def percentile(_sorted, _pct):
+    return _sorted[int(round(_pct / 100 * (len(_sorted) - 1)))]
+
+def latency_stats(_latencies):
+    _sorted = sorted(_latencies)
+    return {
+        'COUNT': len(_sorted),
+        'P50': percentile(_sorted, 50) * 1000,
+        'P90': percentile(_sorted, 90) * 1000,
+        'P99': percentile(_sorted, 99) * 1000,
+        'MAX': _sorted[-1] * 1000
+    }
+
+# User + system CPU seconds used by a process and each of its children (the
+# workers), as {pid: seconds}, or None where there's no /proc to read them from
+def process_cpu(_pid):
+    try:
+        with open('/proc/{}/stat'.format(_pid)) as _stat:
+            _fields = _stat.read().rsplit(')', 1)[1].split()
+    except (IOError, OSError):
+        return None
+    _cpu = {_pid: (int(_fields[11]) + int(_fields[12])) / CLK_TCK}
+    try:
+        for _task in os.listdir('/proc/{}/task'.format(_pid)):
+            with open('/proc/{}/task/{}/children'.format(_pid, _task)) as _children:
+                for _child in _children.read().split():
+                    _cpu.update(process_cpu(int(_child)) or {})
+    except (IOError, OSError):
+        pass
+    return _cpu
+
+# CPU seconds each process used between two process_cpu() readings
+def cpu_used(_before, _after):
+    if _before is None or _after is None:
+        return None
+    return dict((_pid, _after[_pid] - _before.get(_pid, 0)) for _pid in _after)
+
+
+#************************************************
+#     THE APPLICATION UNDER TEST
+#************************************************
+
+def git(*_args):
+    return subprocess.check_output(('git', '-C', REPO) + _args).strip()
+
+# The commit being tested, and whether the working tree differs from it
+def describe_tree(_rev):
+    try:
+        if _rev:
+            return git('rev-parse', _rev + '^{commit}'), False
+        return git('rev-parse', 'HEAD'), bool(git('status', '--porcelain', '--untracked-files=no'))
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+# Put the application in _workdir: the working tree's modules, or a commit's
+def copy_tree(_rev, _workdir):
+    if _rev:
+        _archive = subprocess.Popen(('git', '-C', REPO, 'archive', '--format=tar', _rev), stdout=subprocess.PIPE)
+        subprocess.check_call(('tar', '-x', '-C', _workdir), stdin=_archive.stdout)
+        if _archive.wait():
+            sys.exit('git archive of {} failed'.format(_rev))
+    else:
+        for _file in os.listdir(REPO):
+            if _file.endswith('.py'):
+                shutil.copy(os.path.join(REPO, _file), _workdir)
+
+# Bind address for repeater (_net 1) or spoofer (_net 2) _index. The masters
+# rate limit logins per source address, so each gets one of its own (all of
+# 127/8 is loopback on Linux); elsewhere they share 127.0.0.1 and logging in
+# takes longer.
+def loopback_address(_net, _index):
+    _address = '127.{}.{}.{}'.format(_net, _index // 250, _index % 250 + 1)
+    _sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        _sock.bind((_address, 0))
+    except socket.error:
+        _address = '127.0.0.1'
+    _sock.close()
+    return _address
+
+# ACLs for every stanza of the generated hblink.cfg
+ACLS = {'SUB_ACL': 'DENY:1', 'TG_ACL': 'PERMIT:ALL'}
+
+CONFIG_TEMPLATE = '''
+[GLOBAL]
+PATH: {WORKDIR}/
+PING_TIME: {PING_TIME}
+MAX_MISSED: 3
+USE_ACL: True
+REG_ACL: PERMIT:ALL
+SUB_ACL: {SUB_ACL}
+TGID_TS1_ACL: {TG_ACL}
+TGID_TS2_ACL: {TG_ACL}
+BATCH_TX: {BATCH_TX}
+
+[REPORTS]
+REPORT: True
+REPORT_INTERVAL: 60
+REPORT_PORT: {REPORT_PORT}
+REPORT_CLIENTS: 127.0.0.1
+
+[LOGGER]
+LOG_FILE: {WORKDIR}/hblink.log
+LOG_HANDLERS: {LOG_HANDLERS}
+LOG_LEVEL: {LOG_LEVEL}
+LOG_NAME: HBlink
+LOG_QUEUE: {LOG_QUEUE}
+
+[ALIASES]
+TRY_DOWNLOAD: False
+PATH: {WORKDIR}/
+PEER_FILE: peer_ids.json
+SUBSCRIBER_FILE: subscriber_ids.json
+TGID_FILE: talkgroup_ids.json
+PEER_URL: https://www.radioid.net/static/rptrs.json
+SUBSCRIBER_URL: https://www.radioid.net/static/users.json
+STALE_DAYS: 7
+'''
+
+MASTER_TEMPLATE = '''
+[{NAME}]
+MODE: MASTER
+ENABLED: True
+REPEAT: {REPEAT}
+MAX_PEERS: {MAX_PEERS}
+EXPORT_AMBE: False
+IP: 127.0.0.1
+PORT: {PORT}
+PASSPHRASE: {PASSPHRASE}
+GROUP_HANGTIME: {GROUP_HANGTIME}
+USE_ACL: True
+REG_ACL: PERMIT:ALL
+SUB_ACL: {SUB_ACL}
+TGID_TS1_ACL: {TG_ACL}
+TGID_TS2_ACL: {TG_ACL}
+'''
+
+OPENBRIDGE_TEMPLATE = '''
+[{NAME}]
+MODE: OPENBRIDGE
+ENABLED: True
+IP: 127.0.0.1
+PORT: {PORT}
+NETWORK_ID: {NETWORK_ID}
+PASSPHRASE: {PASSPHRASE}
+TARGET_IP: 127.0.0.1
+TARGET_PORT: {TARGET_PORT}
+USE_ACL: True
+SUB_ACL: {SUB_ACL}
+TGID_ACL: {TG_ACL}
+'''
+
+RULE_TEMPLATE = "        {{'SYSTEM': '{}', 'TS': {}, 'TGID': {}, 'ACTIVE': True, 'TIMEOUT': 2, 'TO_TYPE': 'NONE', 'ON': [], 'OFF': [], 'RESET': []}},\n"
+
+# Ports: masters from --port up, OpenBridge systems from --port + 2000 and the
+# partners they talk to from --port + 3000
+def master_port(_args, _index):
+    return _args.PORT + _index
+
+def obp_port(_args, _index):
+    return _args.PORT + 2000 + _index
+
+def partner_port(_args, _index):
+    return _args.PORT + 3000 + _index
+
+# The systems, the bridges between them and the streams they will carry.
+#
+# hblink: every repeater is on one master that repeats everything to all the
+#   others. OpenBridge traffic goes nowhere, but is still checked and counted.
+# confbridge: repeater n is alone on MASTER-n. Its stream, on TS1, is bridged
+#   to TS2 of the next repeater along and to one of the OpenBridge partners. A
+#   stream from a partner is bridged to the next partner along. With --groups
+#   G, repeater and partner n are in group n % G, and "along" means within the
+#   group, so no bridge joins two groups and --workers can split them.
+#
+# Returns the hblink.cfg and bridge rules text, and a function that makes the
+# streams once the endpoints exist.
+def scenario(_args, _workdir, _streams):
+    _config = CONFIG_TEMPLATE.format(
+        WORKDIR = _workdir, PING_TIME = _args.PING_TIME, BATCH_TX = _args.BATCH_TX,
+        REPORT_PORT = _args.PORT + 4000, LOG_HANDLERS = _args.LOG_HANDLERS,
+        LOG_LEVEL = _args.LOG_LEVEL, LOG_QUEUE = _args.LOG_QUEUE, **ACLS)
+    _bridges = {}
+
+    if _args.APP == 'hblink':
+        _config += MASTER_TEMPLATE.format(NAME = 'MASTER-0', REPEAT = True, MAX_PEERS = _args.PEERS + 1, PORT = master_port(_args, 0), PASSPHRASE = PASSPHRASE, GROUP_HANGTIME = GROUP_HANGTIME, **ACLS)
+    else:
+        for _index in range(_args.PEERS):
+            _config += MASTER_TEMPLATE.format(NAME = 'MASTER-{}'.format(_index), REPEAT = False, MAX_PEERS = 2, PORT = master_port(_args, _index), PASSPHRASE = PASSPHRASE, GROUP_HANGTIME = GROUP_HANGTIME, **ACLS)
+    for _index in range(_args.OBP):
+        _config += OPENBRIDGE_TEMPLATE.format(NAME = 'OBP-{}'.format(_index), PORT = obp_port(_args, _index), NETWORK_ID = NETWORK_ID + _index,
+                                              PASSPHRASE = PASSPHRASE, TARGET_PORT = partner_port(_args, _index), **ACLS)
+
+    _groups = _args.GROUPS
+    _routes = []
+    for _index in range(_streams):
+        _tgid = HBP_TGID + _index
+        if _args.APP == 'hblink':
+            _routes.append(('HBP', _index, 1, _tgid, [('HBP', _peer) for _peer in range(_args.PEERS) if _peer != _index]))
+            continue
+        _rules = [('MASTER-{}'.format(_index), 1)]
+        _receivers = []
+        if _args.PEERS > _groups:
+            _rules.append(('MASTER-{}'.format((_index + _groups) % _args.PEERS), 2))
+            _receivers.append(('HBP', (_index + _groups) % _args.PEERS))
+        if _args.OBP:
+            _partner = _index // _groups % (_args.OBP // _groups) * _groups + _index % _groups
+            _rules.append(('OBP-{}'.format(_partner), 1))
+            _receivers.append(('OBP', _partner))
+        _bridges['HBP-{}'.format(_index)] = [(_system, _ts, _tgid) for _system, _ts in _rules]
+        _routes.append(('HBP', _index, 1, _tgid, _receivers))
+
+    for _index in range(_args.OBP_STREAMS):
+        _tgid = OBP_TGID + _index
+        _source = _index % _args.OBP
+        _receivers = []
+        if _args.APP == 'confbridge' and _args.OBP > _groups:
+            _bridges['OBP-{}'.format(_index)] = [('OBP-{}'.format(_source), 1, _tgid), ('OBP-{}'.format((_source + _groups) % _args.OBP), 1, _tgid)]
+            _receivers.append(('OBP', (_source + _groups) % _args.OBP))
+        _routes.append(('OBP', _source, 1, _tgid, _receivers))
+
+    _rules = 'BRIDGES = {\n'
+    for _bridge in sorted(_bridges):
+        _rules += "    '{}': [\n".format(_bridge) + ''.join([RULE_TEMPLATE.format(*_rule) for _rule in _bridges[_bridge]]) + '    ],\n'
+    _rules += '}\n'
+
+    def make_streams(_endpoints, _random):
+        _streams = []
+        for _n, (_kind, _source, _slot, _tgid, _receivers) in enumerate(_routes):
+            _streams.append(Stream(_endpoints[_kind][_source], _slot, SUB_ID + _n, _tgid,
+                                   [_endpoints[_k][_i] for _k, _i in _receivers], _args.SUPERFRAMES, _args.GAP, _random))
+        return _streams
+
+    return _config, _rules, make_streams
+
+
+#************************************************
+#     RUNNING A TEST
+#************************************************
+
+class LoadTest(object):
+    def __init__(self, _args, _streams):
+        self.ARGS = _args
+        self.STREAMS = _streams
+        self.RANDOM = Random(_args.SEED)
+        self.METER = Meter()
+        self.WORKDIR = mkdtemp(prefix='hb_loadtest.')
+        self.PROCESS = None
+        self.ENDPOINTS = {'HBP': [], 'OBP': [], 'FLOOD': []}
+        self.POLL = poll()
+        self.FDS = {}
+        self.NEXT_PING = 0
+        self.NEXT_SPOOF = None
+        self.LOGIN_TIME = None
+
+    def start_app(self):
+        _args = self.ARGS
+        copy_tree(_args.REV, self.WORKDIR)
+        _config, _rules, self.make_streams = scenario(_args, self.WORKDIR, self.STREAMS)
+        with open(os.path.join(self.WORKDIR, 'hblink.cfg'), 'w') as _file:
+            _file.write(_config)
+        with open(os.path.join(self.WORKDIR, 'hb_confbridge_rules.py'), 'w') as _file:
+            _file.write(_rules)
+
+        _command = [_args.PYTHON, os.path.join(self.WORKDIR, APPS[_args.APP]), '-c', os.path.join(self.WORKDIR, 'hblink.cfg'), '-l', _args.LOG_LEVEL]
+        if _args.WORKERS > 1:
+            _command += ['-w', str(_args.WORKERS)]
+        self.OUTPUT = open(os.path.join(self.WORKDIR, 'output.txt'), 'w')
+        self.PROCESS = subprocess.Popen(_command, cwd=self.WORKDIR, stdout=self.OUTPUT, stderr=subprocess.STDOUT)
+
+    def add_endpoint(self, _endpoint):
+        self.ENDPOINTS[_endpoint.KIND].append(_endpoint)
+        self.FDS[_endpoint.SOCK.fileno()] = _endpoint
+        self.POLL.register(_endpoint.SOCK, POLLIN)
+
+    def make_endpoints(self):
+        _args = self.ARGS
+        for _index in range(_args.PEERS):
+            _master = master_port(_args, 0 if _args.APP == 'hblink' else _index)
+            self.add_endpoint(Repeater(_index, (loopback_address(1, _index), 0), ('127.0.0.1', _master), self.METER))
+        for _index in range(_args.OBP):
+            self.add_endpoint(Partner(_index, ('127.0.0.1', partner_port(_args, _index)), ('127.0.0.1', obp_port(_args, _index)), self.METER))
+        # Spoofers take turns at the masters, so each master sees all of them
+        if _args.FLOOD:
+            _masters = 1 if _args.APP == 'hblink' else _args.PEERS
+            for _index in range(_args.FLOOD_SOURCES):
+                self.add_endpoint(Spoofer(_index, (loopback_address(2, _index), 0), ('127.0.0.1', master_port(_args, _index % _masters)), self.METER))
+
+    def check_app(self):
+        if self.PROCESS.poll() is not None:
+            self.OUTPUT.flush()
+            with open(self.OUTPUT.name) as _output:
+                _tail = _output.readlines()[-20:]
+            sys.exit('{} exited with status {}:\n{}'.format(APPS[self.ARGS.APP], self.PROCESS.returncode, ''.join(_tail)))
+
+    # Hand everything waiting on the sockets to the endpoints, waiting up to
+    # _timeout seconds for something to arrive
+    def receive(self, _timeout):
+        for _fd, _event in self.POLL.poll(max(_timeout, 0) * 1000):
+            _endpoint = self.FDS[_fd]
+            while True:
+                try:
+                    _data = _endpoint.SOCK.recv(1024)
+                except socket.error:
+                    break
+                _endpoint.received(_data, time())
+
+    # Send the spoofed control packets due by _now, spread at random over the
+    # spoofers. Returns when the next one is due.
+    def flood(self, _now):
+        if not self.ARGS.FLOOD:
+            return float('inf')
+        if self.NEXT_SPOOF is None or _now - self.NEXT_SPOOF > 1:
+            self.NEXT_SPOOF = _now
+        while self.NEXT_SPOOF <= _now:
+            self.RANDOM.choice(self.ENDPOINTS['FLOOD']).spoof(self.RANDOM)
+            self.NEXT_SPOOF += 1 / self.ARGS.FLOOD
+        return self.NEXT_SPOOF
+
+    def keepalive(self, _now):
+        if _now >= self.NEXT_PING:
+            self.NEXT_PING = _now + self.ARGS.PING_TIME
+            for _repeater in self.ENDPOINTS['HBP']:
+                if _repeater.STATE == 'YES':
+                    _repeater.ping()
+        for _repeater in self.ENDPOINTS['HBP']:
+            if _repeater.STATE != 'YES' and _now - _repeater.TIME > LOGIN_RETRY:
+                _repeater.login(_now)
+
+    # Log every repeater in, retrying any that get no answer (the application
+    # may not be listening yet, or may be rate limiting us). Under a flood,
+    # repeaters that don't make it in time are a result rather than an error:
+    # the test goes on without them, and they keep trying.
+    def login(self):
+        _start = time()
+        _deadline = _start + self.ARGS.LOGIN_TIMEOUT
+        _repeaters = self.ENDPOINTS['HBP']
+        for _repeater in _repeaters:
+            _repeater.TIME = _start - LOGIN_RETRY
+        while any([_repeater.STATE != 'YES' for _repeater in _repeaters]):
+            self.check_app()
+            if time() > _deadline:
+                _logged_in = len([_r for _r in _repeaters if _r.STATE == 'YES'])
+                if not self.ARGS.FLOOD:
+                    sys.exit('{} of {} repeaters logged in after {}s'.format(_logged_in, len(_repeaters), self.ARGS.LOGIN_TIMEOUT))
+                return _logged_in
+            self.keepalive(time())
+            self.receive(min(self.flood(time()), time() + 0.1) - time())
+        self.LOGIN_TIME = time() - _start
+        return len(_repeaters)
+
+    # Send the streams' frames on schedule until _until, answering whatever comes back
+    def traffic(self, _queue, _until):
+        _meter = self.METER
+        while True:
+            _now = time()
+            while _queue[0][0] <= _now:
+                _due, _n, _stream = heappop(_queue)
+                if _now - _due > LATE_TIME:
+                    _meter.LATE += 1
+                heappush(_queue, (_due + _stream.send(_now), _n, _stream))
+                _now = time()
+            if _now >= _until:
+                return
+            self.keepalive(_now)
+            self.receive(min(_queue[0][0], _until, self.flood(_now)) - time())
+
+    def run(self):
+        _args = self.ARGS
+        self.start_app()
+        try:
+            self.make_endpoints()
+            _logged_in = self.login()
+            _streams = self.make_streams(self.ENDPOINTS, self.RANDOM)
+
+            # Start each stream somewhere in its first call, so they don't all move in step
+            _now = time()
+            _queue = []
+            for _n, _stream in enumerate(_streams):
+                _stream.INDEX = self.RANDOM.randrange(len(_stream.FRAMES))
+                heappush(_queue, (_now + self.RANDOM.random() * FRAME_TIME, _n, _stream))
+
+            # Don't start measuring until the masters' slots are out of hangtime
+            self.traffic(_queue, _now + max(_args.WARMUP, GROUP_HANGTIME))
+            self.check_app()
+            _start = time()
+            _cpu = process_cpu(self.PROCESS.pid)
+            _own_cpu = sum(os.times()[:2])
+            self.METER.start(_start)
+            self.traffic(_queue, _start + _args.DURATION)
+            _end = time()
+            self.METER.stop(_end)
+            _cpu = cpu_used(_cpu, process_cpu(self.PROCESS.pid))
+            _own_cpu = sum(os.times()[:2]) - _own_cpu
+            _drain = _end + DRAIN_TIME
+            while time() < _drain:
+                self.receive(_drain - time())
+            self.check_app()
+        finally:
+            self.stop_app()
+
+        return self.results(_end - _start, _cpu, _own_cpu, len(_streams), _logged_in)
+
+    def stop_app(self):
+        if self.PROCESS.poll() is None:
+            self.PROCESS.send_signal(signal.SIGTERM)
+            _deadline = time() + 10
+            while self.PROCESS.poll() is None and time() < _deadline:
+                self.receive(0.1)
+            if self.PROCESS.poll() is None:
+                self.PROCESS.kill()
+                self.PROCESS.wait()
+        for _endpoint in self.ENDPOINTS['HBP'] + self.ENDPOINTS['OBP'] + self.ENDPOINTS['FLOOD']:
+            _endpoint.close()
+        self.OUTPUT.close()
+        if self.ARGS.KEEP:
+            print('Application, configuration and logs kept in {}'.format(self.WORKDIR))
+        else:
+            shutil.rmtree(self.WORKDIR, ignore_errors=True)
+
+    def results(self, _duration, _cpu, _own_cpu, _streams, _logged_in):
+        _meter = self.METER
+        _results = {
+            'DURATION': _duration,
+            'STREAMS': _streams,
+            'SENT': _meter.FRAMES_SENT,
+            'EXPECTED': _meter.EXPECTED,
+            'RECEIVED': _meter.RECEIVED,
+            'LOSS': (1 - _meter.RECEIVED / _meter.EXPECTED) * 100 if _meter.EXPECTED else 0.0,
+            'INGRESS_FPS': _meter.FRAMES_SENT / _duration,
+            'FORWARDED_FPS': _meter.RECEIVED / _duration,
+            'LATENCY': {_hop: latency_stats(_latencies) for _hop, _latencies in _meter.LATENCY.items()},
+            'JITTER': sum(_meter.JITTER) / len(_meter.JITTER) * 1000 if _meter.JITTER else None,
+            'CPU': sum(_cpu.values()) / _duration * 100 if _cpu is not None else None,
+            'CPU_PER_STREAM': sum(_cpu.values()) / _duration * 100 / _streams if _cpu is not None and _streams else None,
+            # With --workers, each worker's share, busiest first (the supervisor only waits)
+            'WORKER_CPU': sorted([_used / _duration * 100 for _pid, _used in _cpu.items() if _pid != self.PROCESS.pid], reverse=True) if _cpu is not None and len(_cpu) > 1 else None,
+            'GENERATOR_CPU': _own_cpu / _duration * 100,
+            'LATE_SENDS': _meter.LATE,
+            'HMAC_FAILED': sum([_partner.HMAC_FAILED for _partner in self.ENDPOINTS['OBP']]),
+            'NAKS': sum([_repeater.NAKS for _repeater in self.ENDPOINTS['HBP']]),
+            'PONGS': sum([_repeater.PONGS for _repeater in self.ENDPOINTS['HBP']]),
+            'LOGGED_IN': _logged_in,
+            'LOGIN_TIME': self.LOGIN_TIME,
+            'SPOOFED': sum([_spoofer.SENT for _spoofer in self.ENDPOINTS['FLOOD']]),
+            'SPOOF_REPLIES': sum([_spoofer.REPLIES for _spoofer in self.ENDPOINTS['FLOOD']])
+        }
+        return _results
+
+
+#************************************************
+#     RESULTS
+#************************************************
+
+# Flood and --groups runs are scenarios of their own. Others leave them out,
+# so they still match runs stored before there were any.
+def scenario_key(_args, _streams):
+    _key = {
+        'APP': _args.APP,
+        'PEERS': _args.PEERS,
+        'OBP': _args.OBP,
+        'STREAMS': _streams,
+        'OBP_STREAMS': _args.OBP_STREAMS,
+        'SUPERFRAMES': _args.SUPERFRAMES,
+        'GAP': _args.GAP,
+        'WORKERS': _args.WORKERS,
+        'BATCH_TX': _args.BATCH_TX,
+        'LOG_LEVEL': _args.LOG_LEVEL,
+        'LOG_HANDLERS': _args.LOG_HANDLERS,
+        'LOG_QUEUE': _args.LOG_QUEUE
+    }
+    if _args.GROUPS > 1:
+        _key['GROUPS'] = _args.GROUPS
+    if _args.FLOOD:
+        _key['FLOOD'] = _args.FLOOD
+        _key['FLOOD_SOURCES'] = _args.FLOOD_SOURCES
+    return _key
+
+def worst_p99(_results):
+    return max([_hop['P99'] for _hop in _results['LATENCY'].values()] or [0])
+
+def print_results(_record):
+    _scenario, _results = _record['SCENARIO'], _record['RESULTS']
+    print('{} at {}{}: {} streams ({} from repeaters, {} from OpenBridge), {} repeaters, {} OpenBridge partners'.format(
+        APPS[_scenario['APP']], (_record['COMMIT'] or 'unknown')[:10], ' (modified)' if _record['DIRTY'] else '',
+        _results['STREAMS'], _scenario['STREAMS'], _scenario['OBP_STREAMS'], _scenario['PEERS'], _scenario['OBP']))
+    print('  frames: {SENT} sent, {EXPECTED} expected, {RECEIVED} received, {LOSS:.3f}% lost'.format(**_results))
+    print('  {INGRESS_FPS:.1f} frames/s in, {FORWARDED_FPS:.1f} frames/s forwarded'.format(**_results))
+    print('  latency ms      p50      p90      p99      max    frames')
+    for _hop in sorted(_results['LATENCY']):
+        print('    {:8} {P50:8.3f} {P90:8.3f} {P99:8.3f} {MAX:8.3f} {COUNT:9}'.format(_hop, **_results['LATENCY'][_hop]))
+    if _results['JITTER'] is not None:
+        print('  jitter {:.3f} ms'.format(_results['JITTER']))
+    if _results['CPU'] is not None:
+        print('  cpu {CPU:.1f}% of a core, {CPU_PER_STREAM:.2f}% per stream'.format(**_results))
+    if _results.get('WORKER_CPU'):
+        print('  cpu by worker: {}'.format(', '.join(['{:.1f}%'.format(_cpu) for _cpu in _results['WORKER_CPU']])))
+    print('  load generator cpu {GENERATOR_CPU:.1f}%, {LATE_SENDS} late sends'.format(**_results))
+    if _scenario.get('FLOOD'):
+        print('  flood: {} spoofed RPTL/RPTK per second from {} addresses, {SPOOFED} sent, {SPOOF_REPLIES} answered'.format(_scenario['FLOOD'], _scenario['FLOOD_SOURCES'], **_results))
+        if _results['LOGIN_TIME'] is not None:
+            print('  login: all {} repeaters in {:.2f}s'.format(_scenario['PEERS'], _results['LOGIN_TIME']))
+        else:
+            print('  login: only {} of {} repeaters in the time allowed'.format(_results['LOGGED_IN'], _scenario['PEERS']))
+    if _results['HMAC_FAILED'] or _results['NAKS']:
+        print('  {HMAC_FAILED} OpenBridge frames failed HMAC, {NAKS} MSTNAKs'.format(**_results))
+    if _results['GENERATOR_CPU'] > 80 or _results['LATE_SENDS'] > _results['SENT'] / 100:
+        print('  WARNING: the load generator could not keep up -- these numbers measure it as much as HBlink')
+
+def save_results(_file, _record):
+    with open(_file, 'a') as _results:
+        _results.write(json.dumps(_record, sort_keys=True) + '\n')
+
+def load_results(_file):
+    if not os.path.isfile(_file):
+        return []
+    with open(_file) as _results:
+        return [json.loads(_line) for _line in _results if _line.strip()]
+
+# Every stored run of a scenario, oldest first, with the change from the run before
+def print_history(_file, _scenario):
+    _records = [_record for _record in load_results(_file) if _record['SCENARIO'] == _scenario]
+    print('{} streams: {} stored runs'.format(_scenario['STREAMS'], len(_records)))
+    if not _records:
+        return
+    print('  commit        date                 fwd fps   p99 ms   loss %   cpu/stream %')
+    _last = None
+    for _record in _records:
+        _results = _record['RESULTS']
+        _row = '  {:12}  {:19} {:9.1f} {:8.3f} {:8.3f} {:>14}'.format(
+            (_record['COMMIT'] or 'unknown')[:10] + ('+' if _record['DIRTY'] else ''), _record['TIME'],
+            _results['FORWARDED_FPS'], worst_p99(_results), _results['LOSS'],
+            '{:.2f}'.format(_results['CPU_PER_STREAM']) if _results['CPU_PER_STREAM'] is not None else '-')
+        if _last is not None:
+            _row += '   p99 {:+.1f}%'.format((worst_p99(_results) / worst_p99(_last) - 1) * 100 if worst_p99(_last) else 0)
+            if _results['CPU_PER_STREAM'] and _last['CPU_PER_STREAM']:
+                _row += ' cpu {:+.1f}%'.format((_results['CPU_PER_STREAM'] / _last['CPU_PER_STREAM'] - 1) * 100)
+        print(_row)
+        _last = _results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test hb_confbridge.py or hblink.py on loopback with emulated repeaters and OpenBridge partners.')
+    parser.add_argument('-a', '--app', dest='APP', choices=sorted(APPS), default='confbridge', help='Application to test.')
+    parser.add_argument('-s', '--streams', dest='STREAMS', default='10', help='Concurrent streams from repeaters; a comma separated list runs each in turn.')
+    parser.add_argument('-p', '--peers', dest='PEERS', type=int, help='Emulated repeaters (default: as many as the most streams).')
+    parser.add_argument('-o', '--obp', dest='OBP', type=int, default=2, help='Emulated OpenBridge partners.')
+    parser.add_argument('--obp-streams', dest='OBP_STREAMS', type=int, default=0, help='Concurrent streams from the OpenBridge partners.')
+    parser.add_argument('-d', '--duration', dest='DURATION', type=float, default=30, help='Seconds to measure for.')
+    parser.add_argument('--warmup', dest='WARMUP', type=float, default=3, help='Seconds of traffic before measuring (at least the masters\' GROUP_HANGTIME).')
+    parser.add_argument('--superframes', dest='SUPERFRAMES', type=int, default=10, help='Superframes (6 bursts, 360ms) in each call.')
+    parser.add_argument('--gap', dest='GAP', type=float, default=0, help='Seconds between one call and the next on a stream.')
+    parser.add_argument('-w', '--workers', dest='WORKERS', type=int, default=1, help='Worker processes for the application.')
+    parser.add_argument('-g', '--groups', dest='GROUPS', type=int, default=1, help='Split the repeaters and partners into this many groups no bridge joins (confbridge only).')
+    parser.add_argument('--batch-tx', dest='BATCH_TX', action='store_true', help='Set BATCH_TX in the generated hblink.cfg.')
+    parser.add_argument('-l', '--log-level', dest='LOG_LEVEL', default='INFO', help='Application log level.')
+    parser.add_argument('--log-handlers', dest='LOG_HANDLERS', default='file', help='Application log handlers.')
+    parser.add_argument('--log-queue', dest='LOG_QUEUE', action='store_true', help='Set LOG_QUEUE in the generated hblink.cfg.')
+    parser.add_argument('--port', dest='PORT', type=int, default=50000, help='First UDP port to use.')
+    parser.add_argument('--ping-time', dest='PING_TIME', type=int, default=5, help='PING_TIME for the generated hblink.cfg.')
+    parser.add_argument('--flood', dest='FLOOD', type=float, default=0, help='Spoofed RPTL/RPTK per second to send the masters throughout the test.')
+    parser.add_argument('--flood-sources', dest='FLOOD_SOURCES', type=int, default=200, help='Addresses the spoofed control packets come from.')
+    parser.add_argument('--login-timeout', dest='LOGIN_TIMEOUT', type=float, help='Seconds to wait for the repeaters to log in.')
+    parser.add_argument('--rev', dest='REV', help='Test this commit instead of the working tree.')
+    parser.add_argument('--python', dest='PYTHON', default=sys.executable, help='Interpreter to run the application with.')
+    parser.add_argument('--seed', dest='SEED', type=int, help='Random seed for stream IDs and timing.')
+    parser.add_argument('-r', '--results', dest='RESULTS', default=os.path.join(REPO, 'bench', 'results.jsonl'), help='File results are appended to.')
+    parser.add_argument('--no-save', dest='SAVE', action='store_false', help='Don\'t store the results.')
+    parser.add_argument('--history', dest='HISTORY', action='store_true', help='Show stored results for this scenario instead of running it.')
+    parser.add_argument('--keep', dest='KEEP', action='store_true', help='Keep the application\'s directory, configuration and logs.')
+    cli_args = parser.parse_args()
+
+    _levels = [int(_streams) for _streams in cli_args.STREAMS.split(',')]
+    if cli_args.PEERS is None:
+        cli_args.PEERS = max(max(_levels), 2)
+    if cli_args.LOGIN_TIMEOUT is None:
+        cli_args.LOGIN_TIMEOUT = 10 + cli_args.PEERS / const.CTRL_RATE
+    if max(_levels) > cli_args.PEERS:
+        sys.exit('Each stream from a repeater needs a repeater of its own: --peers must be at least {}'.format(max(_levels)))
+    if cli_args.PEERS > 1000 or cli_args.OBP > 1000:
+        sys.exit('At most 1000 repeaters and 1000 OpenBridge partners')
+    if cli_args.FLOOD and not 0 < cli_args.FLOOD_SOURCES <= 1000:
+        sys.exit('--flood-sources must be from 1 to 1000')
+    if cli_args.GROUPS > 1 and (cli_args.APP != 'confbridge' or cli_args.PEERS % cli_args.GROUPS or cli_args.OBP % cli_args.GROUPS):
+        sys.exit('--groups is for confbridge, and must divide both --peers and --obp')
+    if cli_args.OBP_STREAMS and not cli_args.OBP:
+        sys.exit('--obp-streams needs at least one OpenBridge partner')
+
+    if cli_args.HISTORY:
+        for _streams in _levels:
+            print_history(cli_args.RESULTS, scenario_key(cli_args, _streams))
+        sys.exit(0)
+
+    _commit, _dirty = describe_tree(cli_args.REV)
+    for _streams in _levels:
+        _record = {
+            'COMMIT': _commit,
+            'DIRTY': _dirty,
+            'TIME': strftime('%Y-%m-%d %H:%M:%S'),
+            'HOST': node(),
+            'SCENARIO': scenario_key(cli_args, _streams),
+            'RESULTS': LoadTest(cli_args, _streams).run()
+        }
+        print_results(_record)
+        if cli_args.SAVE:
+            save_results(cli_args.RESULTS, _record)
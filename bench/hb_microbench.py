@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+#
+###############################################################################
+#   Copyright (C) 2018 Cortney T. Buffington, N0MJS <n0mjs@me.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software Foundation,
+#   Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+###############################################################################
+
+'''
+In-process benchmarks of the per-frame handlers, without sockets or a running
+reactor. Systems are built from a generated hblink.cfg and bridge rules and
+given a transport that only counts what is written to it, and prebuilt voice
+calls are fed straight to:
+
+    hbp        hb_confbridge routerHBP.dmrd_received
+    obp        hb_confbridge routerOBP.dmrd_received
+    bridgeall  hb_bridge_all bridgeallSYSTEM.dmrd_received
+    master     hblink HBSYSTEM.master_datagramReceived (REPEAT on)
+
+Each handler is run over a range of bridges, targets, peers per master and ACL
+entries -- whichever of those it depends on -- and reports ns per frame (best
+of --repeat passes) and the memory each frame leaves allocated. With
+tracemalloc that is blocks still allocated per frame and the peak bytes a
+frame allocates; without it (Python 2, unless built with pytracemalloc) it is
+the number of garbage collected objects left behind per frame. Between calls
+streams are timed out and slots let out of hangtime, as time passing would
+do, so a steady state should leave nothing behind -- anything that is, is
+growing.
+'''
+
+from __future__ import print_function, division
+
+import os
+import gc
+import sys
+import argparse
+from collections import OrderedDict
+from hashlib import sha256
+from itertools import product
+from platform import node, python_version
+from random import Random
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep, strftime
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from hb_loadtest import CONFIG_TEMPLATE, MASTER_TEMPLATE, OPENBRIDGE_TEMPLATE, RULE_TEMPLATE, PASSPHRASE, GROUP_HANGTIME, PEER_ID, SUB_ID, NETWORK_ID, voice_call, dmrd, repeater_config, describe_tree, save_results
+
+import hblink
+import hb_confbridge
+import hb_bridge_all
+import hb_config
+import hb_log
+import hb_const as const
+from hblink import systems, decode_dmrd
+from dmr_utils.utils import hex_str_3, hex_str_4
+
+__author__     = 'Cortney T. Buffington, N0MJS'
+__copyright__  = 'Copyright (c) 2018 Cortney T. Buffington, N0MJS and the K0USY Group'
+__license__    = 'GNU GPLv3'
+__maintainer__ = 'Cort Buffington, N0MJS'
+__email__      = 'n0mjs@me.com'
+
+
+# Bridged calls are on this TGID; the other bridges use EXTRA_TGID + n
+TGID = 9
+EXTRA_TGID = 1000
+# ACL entries are built from IDs well away from the ones the calls use
+ACL_SUB_BASE = 1000000
+ACL_TGID_BASE = 20000
+
+
+# Stands in for a UDP transport. Counts what is written to it, and keeps it
+# while CAPTURE is a list (for logging peers in).
+class FakeTransport(object):
+    def __init__(self):
+        self.WRITES = 0
+        self.CAPTURE = None
+
+    def write(self, _packet, _sockaddr):
+        self.WRITES += 1
+        if self.CAPTURE is not None:
+            self.CAPTURE.append(_packet)
+
+    def fileno(self):
+        return -1
+
+
+# An ACL string with _entries entries, half single IDs and half ranges, none of
+# which match the IDs the calls use -- so every check goes all the way through
+def make_acl(_entries, _base):
+    if not _entries:
+        return 'PERMIT:ALL'
+    _ids = [str(_base + 3 * _n) for _n in range(_entries // 2)]
+    _ranges = ['{}-{}'.format(_base + 500000 + 10 * _n, _base + 500000 + 10 * _n + 4) for _n in range(_entries - _entries // 2)]
+    return 'DENY:' + ','.join(_ids + _ranges)
+
+# Build CONFIG from a generated hblink.cfg. _systems is a list of (name, mode, REPEAT)
+def make_config(_workdir, _systems, _params):
+    _acls = {'SUB_ACL': make_acl(_params['ACL'], ACL_SUB_BASE), 'TG_ACL': make_acl(_params['ACL'], ACL_TGID_BASE)}
+    _config = CONFIG_TEMPLATE.format(WORKDIR = _workdir, PING_TIME = 5, BATCH_TX = False, REPORT_PORT = 4321,
+                                     LOG_HANDLERS = 'null', LOG_LEVEL = 'INFO', LOG_QUEUE = False, **_acls)
+    for _index, (_name, _mode, _repeat) in enumerate(_systems):
+        if _mode == 'MASTER':
+            _config += MASTER_TEMPLATE.format(NAME = _name, REPEAT = _repeat, MAX_PEERS = _params['PEERS'] + 2, PORT = 50000 + _index, PASSPHRASE = PASSPHRASE, GROUP_HANGTIME = GROUP_HANGTIME, **_acls)
+        else:
+            _config += OPENBRIDGE_TEMPLATE.format(NAME = _name, PORT = 50000 + _index, NETWORK_ID = NETWORK_ID + _index, PASSPHRASE = PASSPHRASE, TARGET_PORT = 53000 + _index, **_acls)
+    _file = os.path.join(_workdir, 'hblink.cfg')
+    with open(_file, 'w') as _cfg:
+        _cfg.write(_config)
+    return hb_config.build_config(_file)
+
+# Make the systems and "start" them on fake transports
+def start_systems(_config, _classes, _report):
+    for _name in _config['SYSTEMS']:
+        systems[_name] = _classes[_config['SYSTEMS'][_name]['MODE']](_name, _config, _report)
+        systems[_name].makeConnection(FakeTransport())
+
+def stop_systems():
+    for _system in systems.values():
+        _system.doStop()
+    systems.clear()
+
+# Log _peers peers in to a master through the real RPTL/RPTK/RPTC exchange.
+# Each comes from an address of its own; logins the control traffic rate
+# limit turns away are tried again shortly.
+def login_peers(_system, _peers):
+    _transport = _system.transport
+    _transport.CAPTURE = []
+    for _index in range(_peers):
+        _peer_id = hex_str_4(PEER_ID + _index)
+        _sockaddr = ('127.1.{}.{}'.format(_index // 250, _index % 250 + 1), 62031)
+        while True:
+            del _transport.CAPTURE[:]
+            _system.master_datagramReceived('RPTL' + _peer_id, _sockaddr)
+            if _transport.CAPTURE:
+                break
+            sleep(0.01)
+        _salt = _transport.CAPTURE[-1][6:10]
+        _system.master_datagramReceived('RPTK' + _peer_id + sha256(_salt + PASSPHRASE).digest(), _sockaddr)
+        _system.master_datagramReceived('RPTC' + repeater_config(_peer_id, 'PEER-{}'.format(_index)), _sockaddr)
+        if _system._peers[_peer_id].CONNECTION != const.PEER_CONNECTED:
+            sys.exit('({}) peer {} did not log in'.format(_system._system, PEER_ID + _index))
+    _transport.CAPTURE = None
+
+# _calls voice calls from _peer_id, each from a different subscriber and with
+# its own stream ID, as lists of frames
+def make_calls(_calls, _peer_id, _slot, _tgid, _superframes, _random, _ber_rssi):
+    _slot_bit = 0x80 if _slot == 2 else 0
+    _frames = []
+    for _n in range(_calls):
+        _rf_src = hex_str_3(SUB_ID + _n)
+        _stream_id = hex_str_4(_random.getrandbits(32))
+        _frames.append([dmrd(_seq & 0xFF, _rf_src, hex_str_3(_tgid), _peer_id, _bits | _slot_bit, _stream_id, _payload) + _ber_rssi
+                        for _seq, (_bits, _payload) in enumerate(voice_call(_rf_src, hex_str_3(_tgid), _superframes))])
+    return _frames
+
+# Arguments for dmrd_received() for each frame, as datagramReceived() passes them
+def dmrd_args(_calls):
+    return [[decode_dmrd(_data) + (_data,) for _data in _call] for _call in _calls]
+
+
+#************************************************
+#     THE BENCHMARKS
+#************************************************
+
+# Each returns (handler, calls as lists of argument tuples, cleanup run after
+# each call, systems that were written to)
+
+# Conference bridge: one bridge from the source to _params['TARGETS'] targets,
+# alternately HBP masters (each with _params['PEERS'] peers) and OpenBridge
+# systems, plus more bridges for the source on other TGIDs, so there are
+# _params['BRIDGES'] in all for the in-band signalling to look through
+def confbridge(_source_mode, _workdir, _params, _args, _random):
+    _source = 'MASTER-0' if _source_mode == 'MASTER' else 'OBP-0'
+    _targets = [('MASTER-{}'.format(_n), 'MASTER') if _n % 2 else ('OBP-{}'.format(_n), 'OPENBRIDGE') for _n in range(1, _params['TARGETS'] + 1)]
+    _config = make_config(_workdir, [(_source, _source_mode, False)] + [(_name, _mode, False) for _name, _mode in _targets], _params)
+
+    _rules = [(_source, 1, TGID)] + [(_name, 1, TGID) for _name, _mode in _targets]
+    _bridges = {'BENCH': _rules}
+    for _n in range(1, _params['BRIDGES']):
+        _bridges['EXTRA-{}'.format(_n)] = [(_source, 1, EXTRA_TGID + _n), (_targets[_n % len(_targets)][0], 1, EXTRA_TGID + _n)]
+    with open(os.path.join(_workdir, 'hb_microbench_rules.py'), 'w') as _file:
+        _file.write('BRIDGES = {\n' + ''.join(["    '{}': [\n".format(_bridge) + ''.join([RULE_TEMPLATE.format(*_rule) for _rule in _bridges[_bridge]]) + '    ],\n' for _bridge in _bridges]) + '}\n')
+
+    hb_confbridge.CONFIG = _config
+    hb_confbridge.ALIASES = hb_confbridge.peer_ids, hb_confbridge.subscriber_ids, hb_confbridge.talkgroup_ids = ({}, {}, {})
+    _report = hb_confbridge.confbridgeReportFactory(_config)
+    _report.clients = []
+    start_systems(_config, {'MASTER': hb_confbridge.routerHBP, 'OPENBRIDGE': hb_confbridge.routerOBP}, _report)
+    for _name, _mode in _targets:
+        if _mode == 'MASTER':
+            login_peers(systems[_name], _params['PEERS'])
+    hb_confbridge.BRIDGES = hb_confbridge.make_bridges('hb_microbench_rules')
+    hb_confbridge.ROUTES = hb_confbridge.make_routes(hb_confbridge.BRIDGES)
+
+    _peer_id = hex_str_4(PEER_ID) if _source_mode == 'MASTER' else _config['SYSTEMS'][_source]['NETWORK_ID']
+    _ber_rssi = '\x00\x00' if _source_mode == 'MASTER' else ''
+    _calls = dmrd_args(make_calls(_args.CALLS, _peer_id, 1, TGID, _args.SUPERFRAMES, _random, _ber_rssi))
+    expire_streams()
+    return systems[_source].dmrd_received, _calls, expire_streams, [systems[_name] for _name, _mode in _targets]
+
+# What time would do once each call has ended: the stream timers forget
+# OpenBridge streams, and the slots on the masters come out of group hangtime
+# (otherwise the next call, from another subscriber, would be held off)
+def expire_streams():
+    for _key, _timer in hb_confbridge.STREAM_TIMERS.items():
+        if _timer.active():
+            _timer.cancel()
+        if len(_key) == 2:
+            systems[_key[0]].STATUS.pop(_key[1], None)
+    hb_confbridge.STREAM_TIMERS.clear()
+    for _system in systems.values():
+        if _system._config['MODE'] == 'MASTER':
+            for _slot in _system.STATUS.values():
+                _slot.RX_TIME = _slot.TX_TIME = 0
+
+def bench_hbp(_workdir, _params, _args, _random):
+    return confbridge('MASTER', _workdir, _params, _args, _random)
+
+def bench_obp(_workdir, _params, _args, _random):
+    return confbridge('OPENBRIDGE', _workdir, _params, _args, _random)
+
+# Bridge all: the source and _params['TARGETS'] other masters, each with
+# _params['PEERS'] peers. Every frame goes through the ACLs for every target.
+def bench_bridgeall(_workdir, _params, _args, _random):
+    _names = ['MASTER-{}'.format(_n) for _n in range(_params['TARGETS'] + 1)]
+    _config = make_config(_workdir, [(_name, 'MASTER', False) for _name in _names], _params)
+    hb_bridge_all.ALIASES = ({}, {}, {})
+    _report = hblink.reportFactory(_config)
+    _report.clients = []
+    start_systems(_config, {'MASTER': hb_bridge_all.bridgeallSYSTEM}, _report)
+    for _name in _names[1:]:
+        login_peers(systems[_name], _params['PEERS'])
+    _calls = dmrd_args(make_calls(_args.CALLS, hex_str_4(PEER_ID), 1, TGID, _args.SUPERFRAMES, _random, '\x00\x00'))
+    return systems[_names[0]].dmrd_received, _calls, None, [systems[_name] for _name in _names[1:]]
+
+# A master repeating one peer's traffic to _params['PEERS'] others, from the
+# datagram in: peer checks, the per-stream ACL cache and the fan out
+def bench_master(_workdir, _params, _args, _random):
+    _config = make_config(_workdir, [('MASTER-0', 'MASTER', True)], _params)
+    _report = hblink.reportFactory(_config)
+    _report.clients = []
+    start_systems(_config, {'MASTER': hblink.HBSYSTEM}, _report)
+    _system = systems['MASTER-0']
+    login_peers(_system, _params['PEERS'] + 1)
+    _sockaddr = _system._peers[hex_str_4(PEER_ID)].SOCKADDR
+    _calls = [[(_data, _sockaddr) for _data in _call] for _call in make_calls(_args.CALLS, hex_str_4(PEER_ID), 1, TGID, _args.SUPERFRAMES, _random, '\x00\x00')]
+    return _system.master_datagramReceived, _calls, None, [_system]
+
+# name: (function, the parameters it depends on)
+BENCHMARKS = OrderedDict([
+    ('hbp',       (bench_hbp,       ('BRIDGES', 'TARGETS', 'PEERS'))),
+    ('obp',       (bench_obp,       ('BRIDGES', 'TARGETS', 'PEERS'))),
+    ('bridgeall', (bench_bridgeall, ('TARGETS', 'PEERS', 'ACL'))),
+    ('master',    (bench_master,    ('PEERS', 'ACL')))
+])
+
+
+#************************************************
+#     MEASUREMENT
+#************************************************
+
+def run_pass(_handler, _calls, _cleanup):
+    for _call in _calls:
+        for _frame in _call:
+            _handler(*_frame)
+        if _cleanup:
+            _cleanup()
+
+# Best time for a pass over every call, in ns per frame. Cleanup between calls
+# isn't timed, and the garbage collector is off while timing, as timeit does.
+def time_frames(_handler, _calls, _cleanup, _repeat):
+    _best = None
+    _gc = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(_repeat):
+            _elapsed = 0
+            for _call in _calls:
+                _start = default_timer()
+                for _frame in _call:
+                    _handler(*_frame)
+                _elapsed += default_timer() - _start
+                if _cleanup:
+                    _cleanup()
+            _best = _elapsed if _best is None else min(_best, _elapsed)
+    finally:
+        if _gc:
+            gc.enable()
+    return _best / sum([len(_call) for _call in _calls]) * 1e9
+
+# Memory left allocated per frame by a pass, and where it was allocated
+def measure_allocations(_handler, _calls, _cleanup, _top):
+    _frames = sum([len(_call) for _call in _calls])
+    if tracemalloc is None:
+        gc.collect()
+        _before = len(gc.get_objects())
+        run_pass(_handler, _calls, _cleanup)
+        gc.collect()
+        return {'OBJECTS_PER_FRAME': (len(gc.get_objects()) - _before) / _frames}
+
+    tracemalloc.start(1)
+    try:
+        gc.collect()
+        _before = tracemalloc.take_snapshot()
+        run_pass(_handler, _calls, _cleanup)
+        gc.collect()
+        _after = tracemalloc.take_snapshot()
+        _result = {'PEAK_BYTES': None}
+
+        # Peak per frame needs the peak reset before each one (Python 3.9 and up)
+        if hasattr(tracemalloc, 'reset_peak'):
+            _peaks = []
+            for _frame in _calls[0]:
+                tracemalloc.reset_peak()
+                _current = tracemalloc.get_traced_memory()[0]
+                _handler(*_frame)
+                _peaks.append(tracemalloc.get_traced_memory()[1] - _current)
+            if _cleanup:
+                _cleanup()
+            _result['PEAK_BYTES'] = sum(_peaks) / len(_peaks)
+    finally:
+        tracemalloc.stop()
+
+    _stats = [_stat for _stat in _after.compare_to(_before, 'lineno') if _stat.count_diff]
+    _result['BLOCKS_PER_FRAME'] = sum([_stat.count_diff for _stat in _stats]) / _frames
+    _result['TOP'] = ['{}:{} {:+d} blocks'.format(_stat.traceback[0].filename, _stat.traceback[0].lineno, _stat.count_diff)
+                      for _stat in sorted(_stats, key=lambda _stat: -abs(_stat.count_diff))[:_top]]
+    return _result
+
+def run_benchmark(_name, _params, _args):
+    _workdir = mkdtemp(prefix='hb_microbench.')
+    sys.path.insert(0, _workdir)
+    try:
+        _handler, _calls, _cleanup, _targets = BENCHMARKS[_name][0](_workdir, _params, _args, Random(_args.SEED))
+
+        # One pass to warm the caches and check the frames are being forwarded
+        for _target in _targets:
+            _target.transport.WRITES = 0
+        run_pass(_handler, _calls, _cleanup)
+        _missed = [_target._system for _target in _targets if not _target.transport.WRITES]
+        if _missed:
+            sys.exit('{}: nothing was forwarded to {}'.format(_name, ', '.join(_missed)))
+
+        _result = {'NS_PER_FRAME': time_frames(_handler, _calls, _cleanup, _args.REPEAT)}
+        _result.update(measure_allocations(_handler, _calls, _cleanup, _args.TOP))
+        return _result
+    finally:
+        stop_systems()
+        sys.path.remove(_workdir)
+        sys.modules.pop('hb_microbench_rules', None)
+        rmtree(_workdir, ignore_errors=True)
+
+def print_result(_name, _params, _result):
+    _line = '{:10} {:>7} {:>7} {:>7} {:>7} {:12.0f}'.format(_name, *[_params.get(_param, '-') for _param in ('BRIDGES', 'TARGETS', 'PEERS', 'ACL')] + [_result['NS_PER_FRAME']])
+    if 'BLOCKS_PER_FRAME' in _result:
+        _line += ' {:14.3f} {:>12}'.format(_result['BLOCKS_PER_FRAME'], '{:.0f}'.format(_result['PEAK_BYTES']) if _result['PEAK_BYTES'] is not None else '-')
+    else:
+        _line += ' {:14.3f}'.format(_result['OBJECTS_PER_FRAME'])
+    print(_line)
+    for _top in _result.get('TOP', []):
+        print('    ' + _top)
+
+
+def int_list(_value):
+    return [int(_item) for _item in _value.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the per-frame handlers in-process, without sockets.')
+    parser.add_argument('-b', '--bench', dest='BENCH', default=','.join(BENCHMARKS), help='Comma separated benchmarks to run: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--bridges', dest='BRIDGES', type=int_list, default=[1, 100], help='Bridges in the rules (comma separated list to run each).')
+    parser.add_argument('--targets', dest='TARGETS', type=int_list, default=[1, 4, 16], help='Systems each frame is forwarded to.')
+    parser.add_argument('--peers', dest='PEERS', type=int_list, default=[1, 16], help='Peers on each master.')
+    parser.add_argument('--acl', dest='ACL', type=int_list, default=[0, 1000], help='Entries in each ACL (0 for PERMIT:ALL).')
+    parser.add_argument('--calls', dest='CALLS', type=int, default=20, help='Calls in a pass, each from a different subscriber.')
+    parser.add_argument('--superframes', dest='SUPERFRAMES', type=int, default=10, help='Superframes in each call.')
+    parser.add_argument('--repeat', dest='REPEAT', type=int, default=5, help='Passes to time; the best is reported.')
+    parser.add_argument('--top', dest='TOP', type=int, default=0, help='With tracemalloc, show the lines that left the most blocks allocated.')
+    parser.add_argument('-l', '--log-level', dest='LOG_LEVEL', default='INFO', help='Log level (messages go to a null handler).')
+    parser.add_argument('--seed', dest='SEED', type=int, default=0, help='Random seed for stream IDs.')
+    parser.add_argument('-r', '--results', dest='RESULTS', help='Also append the results to this JSON lines file.')
+    cli_args = parser.parse_args()
+
+    hb_log.config_logging({'LOG_FILE': os.devnull, 'LOG_HANDLERS': 'null', 'LOG_LEVEL': cli_args.LOG_LEVEL, 'LOG_NAME': 'HBlink', 'LOG_QUEUE': False})
+    _commit, _dirty = describe_tree(None)
+
+    print('{:10} {:>7} {:>7} {:>7} {:>7} {:>12} {}'.format('benchmark', 'bridges', 'targets', 'peers', 'acl', 'ns/frame',
+          '{:>14} {:>12}'.format('blocks/frame', 'peak B/frame') if tracemalloc else '{:>14}'.format('objects/frame')))
+    for _name in cli_args.BENCH.split(','):
+        if _name not in BENCHMARKS:
+            sys.exit('Unknown benchmark {}, choose from {}'.format(_name, ', '.join(BENCHMARKS)))
+        _depends = BENCHMARKS[_name][1]
+        for _values in product(*[getattr(cli_args, _param) for _param in _depends]):
+            _params = {'BRIDGES': 1, 'TARGETS': 1, 'PEERS': 1, 'ACL': 0}
+            _params.update(zip(_depends, _values))
+            _result = run_benchmark(_name, _params, cli_args)
+            print_result(_name, dict(zip(_depends, _values)), _result)
+            if cli_args.RESULTS:
+                save_results(cli_args.RESULTS, {
+                    'COMMIT': _commit,
+                    'DIRTY': _dirty,
+                    'TIME': strftime('%Y-%m-%d %H:%M:%S'),
+                    'HOST': node(),
+                    'PYTHON': python_version(),
+                    'BENCHMARK': _name,
+                    'PARAMS': _params,
+                    'CALLS': cli_args.CALLS,
+                    'SUPERFRAMES': cli_args.SUPERFRAMES,
+                    'RESULTS': _result
+                })
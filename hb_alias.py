@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+#
+###############################################################################
+#   Copyright (C) 2018 Cortney T. Buffington, N0MJS <n0mjs@me.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software Foundation,
+#   Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+###############################################################################
+
+'''
+ID alias lookups for HBlink applications. The radioid.net JSON files are
+indexed once into an SQLite database next to them, and an AliasStore looks
+names up from that as they're needed, through a small LRU cache. Nothing
+but the cache is held in memory, so a million-entry subscriber list costs
+nothing at startup once it has been indexed.
+
+An AliasStore answers "in" and [] like the dictionaries dmr_utils builds,
+so it can be handed to anything that expects one.
+
+Run as a program (hb_alias.py PATH FILE [URL STALE_SECONDS]) it downloads the
+file if it's stale, re-indexes it if needed and prints what it did as JSON.
+HBlink refreshes aliases that way, so the parse never touches the reactor.
+'''
+
+from __future__ import print_function
+
+import sqlite3
+from json import load as jload
+from os import rename, remove, getpid
+from os.path import isfile, getmtime, splitext
+from collections import OrderedDict
+
+import hb_const as const
+from dmr_utils.utils import int_id
+
+# The module needs logging logging, but handlers, etc. are controlled by the parent
+import logging
+logger = logging.getLogger(__name__)
+
+__author__     = 'Cortney T. Buffington, N0MJS'
+__copyright__  = 'Copyright (c) 2018 Cortney T. Buffington, N0MJS and the K0USY Group'
+__license__    = 'GNU GPLv3'
+__maintainer__ = 'Cort Buffington, N0MJS'
+__email__      = 'n0mjs@me.com'
+
+
+# The index for an alias file: same name, .db instead of .json
+def index_file(_path, _file):
+    return _path + splitext(_file)[0] + '.db'
+
+# (Re)build the index for an alias file if it's missing or older than the file.
+# Records are the same {INTEGER ID: 'CALLSIGN'} mk_id_dict makes. The index is
+# written to a temporary file and renamed into place, so a reader never sees a
+# partly built one. Returns the number of records indexed, or None if the index
+# was already current (or there's no alias file to build it from).
+def build_index(_path, _file):
+    _source = _path + _file
+    _index = index_file(_path, _file)
+    if not isfile(_source) or (isfile(_index) and getmtime(_index) >= getmtime(_source)):
+        return None
+
+    try:
+        with open(_source, 'rU') as _handle:
+            records = jload(_handle)
+    except (IOError, ValueError):
+        logger.error('ID ALIAS MAPPER: \'%s\' could not be read, not indexed', _file)
+        return None
+    if 'count' in records:
+        del records['count']
+    records = records[records.keys()[0]]
+
+    _tmp = '%s.%s.tmp' % (_index, getpid())
+    if isfile(_tmp):
+        remove(_tmp)
+    _db = sqlite3.connect(_tmp)
+    _db.execute('CREATE TABLE aliases (id INTEGER PRIMARY KEY, alias TEXT)')
+    _count = 0
+    with _db:
+        for record in records:
+            try:
+                _db.execute('INSERT OR REPLACE INTO aliases VALUES (?, ?)', (int(record['id']), record['callsign'].encode('ascii','ignore')))
+                _count += 1
+            except:
+                pass
+    _db.close()
+    rename(_tmp, _index)
+    return _count
+
+
+class AliasStore(object):
+    def __init__(self, _path, _file, _cache_size = const.ALIAS_CACHE_SIZE):
+        self._index = index_file(_path, _file)
+        self._cache = OrderedDict()
+        self._cache_size = _cache_size
+        self._db = None
+        self._lookup = None
+        self._mtime = None
+
+    # The index is opened on first lookup, so a store made before the workers
+    # fork never shares an SQLite connection between processes
+    def connect(self):
+        if self._lookup is None and isfile(self._index):
+            self._mtime = getmtime(self._index)
+            self._db = sqlite3.connect(self._index)
+            self._db.text_factory = str
+            self._lookup = self._db.cursor().execute
+        return self._lookup
+
+    # True if a new index has been renamed into place since ours was opened
+    def changed(self):
+        return isfile(self._index) and getmtime(self._index) != self._mtime
+
+    # Drop the open index and the cache -- the next lookup opens whatever index
+    # is in place then, so anything holding this store sees new aliases from then on
+    def reopen(self):
+        self.close()
+        self._cache.clear()
+
+    def __nonzero__(self):
+        return isfile(self._index)
+
+    # Alias for an integer ID, or None -- misses are cached as well as hits
+    def get(self, _id, _default = None):
+        try:
+            _alias = self._cache.pop(_id)
+        except KeyError:
+            _alias = None
+            if self.connect() is not None:
+                _row = self._lookup('SELECT alias FROM aliases WHERE id = ?', (_id,)).fetchone()
+                if _row:
+                    _alias = _row[0]
+            if len(self._cache) >= self._cache_size:
+                self._cache.popitem(last=False)
+        self._cache[_id] = _alias
+        return _default if _alias is None else _alias
+
+    def __contains__(self, _id):
+        return self.get(_id) is not None
+
+    def __getitem__(self, _id):
+        _alias = self.get(_id)
+        if _alias is None:
+            raise KeyError(_id)
+        return _alias
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+        self._db = None
+        self._lookup = None
+
+
+# Drop-in for dmr_utils.utils.get_alias: the alias for an ID (int or packed
+# string) if there is one, otherwise the integer ID. Works on an AliasStore
+# with one lookup, or on a plain dictionary as before.
+def get_alias(_id, _dict, *args):
+    if type(_id) == str:
+        _id = int_id(_id)
+    if type(_dict) is AliasStore and not args:
+        return _dict.get(_id, _id)
+    if _id in _dict:
+        if args:
+            retValue = []
+            for _item in args:
+                try:
+                    retValue.append(_dict[_id][_item])
+                except TypeError:
+                    return _dict[_id]
+            return retValue
+        else:
+            return _dict[_id]
+    return _id
+
+
+if __name__ == '__main__':
+    import sys
+    from json import dumps
+    from time import time
+    from dmr_utils.utils import try_download
+
+    logging.basicConfig()
+    _result = {'DOWNLOAD': None}
+    if len(sys.argv) == 5:
+        _result['DOWNLOAD'] = try_download(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    _start = time()
+    _result['RECORDS'] = build_index(sys.argv[1], sys.argv[2])
+    _result['INDEX_TIME'] = time() - _start
+    print(dumps(_result))
@@ -45,11 +45,13 @@ from twisted.protocols.basic import NetstringReceiver
 from twisted.internet import reactor, task
 
 # Things we import from the main hblink module
-from hblink import HBSYSTEM, OPENBRIDGE, systems, hblink_handler, reportFactory, REPORT_OPCODES, config_reports, mk_aliases
-from dmr_utils.utils import hex_str_3, int_id, get_alias
+from hblink import HBSYSTEM, OPENBRIDGE, SlotState, systems, hblink_handler, reportFactory, REPORT_OPCODES, config_reports, mk_aliases
+from dmr_utils.utils import hex_str_3
 from dmr_utils import decode, bptc, const
 import hb_config
+from hb_config import acl_check
 import hb_log
+from hb_log import LogID, log_call
 import hb_const
 
 # The module needs logging logging, but handlers, etc. are controlled by the parent
@@ -76,79 +78,34 @@ class bridgeallSYSTEM(HBSYSTEM):
         
         # Status information for the system, TS1 & TS2
         # 1 & 2 are "timeslot"
-        # In TX_EMB_LC, 2-5 are burst B-E
-        self.STATUS = {
-            1: {
-                'RX_START':     time(),
-                'RX_SEQ':       '\x00',
-                'RX_RFS':       '\x00',
-                'TX_RFS':       '\x00',
-                'RX_STREAM_ID': '\x00',
-                'TX_STREAM_ID': '\x00',
-                'RX_TGID':      '\x00\x00\x00',
-                'TX_TGID':      '\x00\x00\x00',
-                'RX_TIME':      time(),
-                'TX_TIME':      time(),
-                'RX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'RX_LC':        '\x00',
-                'TX_H_LC':      '\x00',
-                'TX_T_LC':      '\x00',
-                'TX_EMB_LC': {
-                    1: '\x00',
-                    2: '\x00',
-                    3: '\x00',
-                    4: '\x00',
-                    }
-                },
-            2: {
-                'RX_START':     time(),
-                'RX_SEQ':       '\x00',
-                'RX_RFS':       '\x00',
-                'TX_RFS':       '\x00',
-                'RX_STREAM_ID': '\x00',
-                'TX_STREAM_ID': '\x00',
-                'RX_TGID':      '\x00\x00\x00',
-                'TX_TGID':      '\x00\x00\x00',
-                'RX_TIME':      time(),
-                'TX_TIME':      time(),
-                'RX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'RX_LC':        '\x00',
-                'TX_H_LC':      '\x00',
-                'TX_T_LC':      '\x00',
-                'TX_EMB_LC': {
-                    1: '\x00',
-                    2: '\x00',
-                    3: '\x00',
-                    4: '\x00',
-                    }
-                }
-            }
+        self.STATUS = {1: SlotState(), 2: SlotState()}
+
+        # Last stream ID an egress ACL drop was logged for
+        self._laststrid = None
 
     def dmrd_received(self, _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data):
         pkt_time = time()
         dmrpkt = _data[20:53]
-        _bits = int_id(_data[15])
+        _bits = ord(_data[15])
 
         if _call_type == 'group':
             
             # Is this is a new call stream?
-            if (_stream_id != self.STATUS[_slot]['RX_STREAM_ID']):
-                self.STATUS['RX_START'] = pkt_time
-                logger.info('(%s) *CALL START* STREAM ID: %s SUB: %s (%s) PEER: %s (%s) TGID %s (%s), TS %s', \
-                        self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot)
+            if (_stream_id != self.STATUS[_slot].RX_STREAM_ID):
+                self.STATUS[_slot].RX_START = pkt_time
+                log_call(logger, 'START', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES)
             
             # Final actions - Is this a voice terminator?
-            if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM) and (self.STATUS[_slot]['RX_TYPE'] != hb_const.HBPF_SLT_VTERM):
-                call_duration = pkt_time - self.STATUS['RX_START']
-                logger.info('(%s) *CALL END*   STREAM ID: %s SUB: %s (%s) PEER: %s (%s) TGID %s (%s), TS %s, Duration: %s', \
-                        self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot, call_duration)
+            if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM) and (self.STATUS[_slot].RX_TYPE != hb_const.HBPF_SLT_VTERM):
+                call_duration = pkt_time - self.STATUS[_slot].RX_START
+                log_call(logger, 'END', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES, call_duration)
             
             # Mark status variables for use later
-            self.STATUS[_slot]['RX_RFS']       = _rf_src
-            self.STATUS[_slot]['RX_TYPE']      = _dtype_vseq
-            self.STATUS[_slot]['RX_TGID']      = _dst_id
-            self.STATUS[_slot]['RX_TIME']      = pkt_time
-            self.STATUS[_slot]['RX_STREAM_ID'] = _stream_id
+            self.STATUS[_slot].RX_RFS       = _rf_src
+            self.STATUS[_slot].RX_TYPE      = _dtype_vseq
+            self.STATUS[_slot].RX_TGID      = _dst_id
+            self.STATUS[_slot].RX_TIME      = pkt_time
+            self.STATUS[_slot].RX_STREAM_ID = _stream_id
             
             
             for _target in self._CONFIG['SYSTEMS']: 
@@ -156,39 +113,39 @@ class bridgeallSYSTEM(HBSYSTEM):
                         
                         _target_status = systems[_target].STATUS
                         _target_system = self._CONFIG['SYSTEMS'][_target]
-                        _target_status[_slot]['TX_STREAM_ID'] = _stream_id
+                        _target_status[_slot].TX_STREAM_ID = _stream_id
                             
                         # ACL Processing
                         if self._CONFIG['GLOBAL']['USE_ACL']:
                             if not acl_check(_rf_src, self._CONFIG['GLOBAL']['SUB_ACL']):
                                 if self._laststrid != _stream_id:
-                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s FROM SUBSCRIBER %s BY GLOBAL ACL', _target_system, int_id(_stream_id), int_id(_rf_src))
+                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s FROM SUBSCRIBER %s BY GLOBAL ACL', _target_system, LogID(_stream_id), LogID(_rf_src))
                                     self._laststrid = _stream_id
                                 return
                             if _slot == 1 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG1_ACL']):
                                 if self._laststrid != _stream_id:
-                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY GLOBAL TS1 ACL', _target_system, int_id(_stream_id), int_id(_dst_id))
+                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY GLOBAL TS1 ACL', _target_system, LogID(_stream_id), LogID(_dst_id))
                                     self._laststrid = _stream_id
                                 return
                             if _slot == 2 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG2_ACL']):
                                 if self._laststrid != _stream_id:
-                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY GLOBAL TS2 ACL', _target_system, int_id(_stream_id), int_id(_dst_id))
+                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY GLOBAL TS2 ACL', _target_system, LogID(_stream_id), LogID(_dst_id))
                                     self._laststrid = _stream_id
                                 return
-                        if self._target_system['USE_ACL']:
+                        if _target_system['USE_ACL']:
                             if not acl_check(_rf_src, _target_system['SUB_ACL']):
                                 if self._laststrid != _stream_id:
-                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s FROM SUBSCRIBER %s BY SYSTEM ACL', _target_system, int_id(_stream_id), int_id(_rf_src))
+                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s FROM SUBSCRIBER %s BY SYSTEM ACL', _target_system, LogID(_stream_id), LogID(_rf_src))
                                     self._laststrid = _stream_id
                                 return
                             if _slot == 1 and not acl_check(_dst_id, _target_system['TG1_ACL']):
                                 if self._laststrid != _stream_id:
-                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY SYSTEM TS1 ACL', _target_system, int_id(_stream_id), int_id(_dst_id))
+                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY SYSTEM TS1 ACL', _target_system, LogID(_stream_id), LogID(_dst_id))
                                     self._laststrid = _stream_id
                                 return
                             if _slot == 2 and not acl_check(_dst_id, _target_system['TG2_ACL']):
                                 if self._laststrid != _stream_id:
-                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY SYSTEM TS2 ACL', _target_system, int_id(_stream_id), int_id(_dst_id))
+                                    logger.debug('(%s) CALL DROPPED ON EGRESS WITH STREAM ID %s ON TGID %s BY SYSTEM TS2 ACL', _target_system, LogID(_stream_id), LogID(_dst_id))
                                     self._laststrid = _stream_id
                                 return
                         self._laststrid = _stream_id
@@ -206,7 +163,6 @@ if __name__ == '__main__':
     import sys
     import os
     import signal
-    from dmr_utils.utils import try_download, mk_id_dict
     
     # Change the current directory to the location of the application
     os.chdir(os.path.dirname(os.path.realpath(sys.argv[0])))
@@ -243,7 +199,7 @@ if __name__ == '__main__':
         signal.signal(sig, sig_handler)
 
     # Create the name-number mapping dictionaries
-    peer_ids, subscriber_ids, talkgroup_ids = mk_aliases(CONFIG)
+    ALIASES = mk_aliases(CONFIG)
 
     # INITIALIZE THE REPORTING LOOP
     report_server = config_reports(CONFIG, reportFactory)
@@ -38,6 +38,7 @@ import sys
 from bitarray import bitarray
 from time import time
 from importlib import import_module
+from collections import OrderedDict
 
 # Twisted is pretty important, so I keep it separate
 from twisted.internet.protocol import Factory, Protocol
@@ -45,11 +46,13 @@ from twisted.protocols.basic import NetstringReceiver
 from twisted.internet import reactor, task
 
 # Things we import from the main hblink module
-from hblink import HBSYSTEM, OPENBRIDGE, systems, hblink_handler, reportFactory, REPORT_OPCODES, mk_aliases
-from dmr_utils.utils import hex_str_3, int_id, get_alias
+from hblink import HBSYSTEM, OPENBRIDGE, SlotState, StreamState, systems, stats, hblink_handler, reportFactory, shadow_delta, start_workers, join_workers, REPORT_OPCODES, mk_aliases
+from hblink import start_system, reread_config, reload_config, reload_on_hup, changed_keys
+from dmr_utils.utils import hex_str_3, int_id
 from dmr_utils import decode, bptc, const
 import hb_config
 import hb_log
+from hb_log import LogID, LogAlias, log_levels, log_call
 import hb_const
 
 # Stuff for socket reporting
@@ -70,6 +73,21 @@ __email__      = 'n0mjs@me.com'
 
 # Module gobal varaibles
 
+# Encoded LCs, shared by every target on every system. Key is the 9 byte LC,
+# value is the (full header LC, full terminator LC, embedded LC) encodings
+LC_CACHE = OrderedDict()
+LC_CACHE_STATS = {'HITS': 0, 'MISSES': 0}
+
+# Filler used to position LC encodings within a 264 bit burst
+FULL_LC_GAP = bitarray('0' * 68)
+EMB_LC_GAP = bitarray('0' * 116)
+stats['LC_CACHE'] = LC_CACHE_STATS
+
+# Pending rule and stream timers (reactor DelayedCalls), see arm_rule_timer()
+# and arm_stream_timer()
+RULE_TIMERS = {}
+STREAM_TIMERS = {}
+
 # Timed loop used for reporting HBP status
 #
 # REPORT BASED ON THE TYPE SELECTED IN THE MAIN CONFIG FILE
@@ -79,6 +97,7 @@ def config_reports(_config, _factory):
             logger.debug('Periodic reporting loop started')
             _server.send_config()
             _server.send_bridge()
+            _server.send_stats()
 
         logger.info('HBlink TCP reporting server configured')
 
@@ -95,19 +114,26 @@ def config_reports(_config, _factory):
 # Import Bridging rules
 # Note: A stanza *must* exist for any MASTER or CLIENT configured in the main
 # configuration file and listed as "active". It can be empty,
-# but it has to exist.
-def make_bridges(_hb_confbridge_bridges):
+# but it has to exist. A reload checks the rules against the systems in the
+# new configuration (_systems), before it is running.
+def make_bridges(_hb_confbridge_bridges, _systems=None):
+    if _systems is None:
+        _systems = CONFIG['SYSTEMS']
     try:
-        bridge_file = import_module(_hb_confbridge_bridges)
+        # Read it again if it was imported before (a reload) -- the import is cached
+        if _hb_confbridge_bridges in sys.modules:
+            bridge_file = reload(sys.modules[_hb_confbridge_bridges])
+        else:
+            bridge_file = import_module(_hb_confbridge_bridges)
         logger.info('Routing bridges file found and bridges imported')
-    except ImportError:
+    except (ImportError, SyntaxError):
         sys.exit('Routing bridges file not found or invalid')
 
     # Convert integer GROUP ID numbers from the config into hex strings
     # we need to send in the actual data packets.
     for _bridge in bridge_file.BRIDGES:
         for _system in bridge_file.BRIDGES[_bridge]:
-            if _system['SYSTEM'] not in CONFIG['SYSTEMS']:
+            if _system['SYSTEM'] not in _systems:
                 sys.exit('ERROR: Conference bridges found for system not configured main configuration')
 
             _system['TGID']       = hex_str_3(_system['TGID'])
@@ -122,85 +148,259 @@ def make_bridges(_hb_confbridge_bridges):
                 _system['TIMER']  = time()
     return bridge_file.BRIDGES
 
+# The systems each bridge joins -- start_workers() and reload_config() keep
+# each set on one worker
+def bridge_groups(_bridges):
+    return [[_system['SYSTEM'] for _system in _bridges[_bridge]] for _bridge in _bridges]
 
-# Run this every minute for rule timer updates
-def rule_timer_loop():
-    logger.debug('(ALL HBSYSTEMS) Rule timer loop started')
-    _now = time()
-
-    for _bridge in BRIDGES:
-        for _system in BRIDGES[_bridge]:
-            if _system['TO_TYPE'] == 'ON':
-                if _system['ACTIVE'] == True:
-                    if _system['TIMER'] < _now:
-                        _system['ACTIVE'] = False
-                        logger.info('Conference Bridge TIMEOUT: DEACTIVATE System: %s, Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']))
-                    else:
-                        timeout_in = _system['TIMER'] - _now
-                        logger.info('Conference Bridge ACTIVE (ON timer running): System: %s Bridge: %s, TS: %s, TGID: %s, Timeout in: %ss,', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']),  timeout_in)
-                elif _system['ACTIVE'] == False:
-                    logger.debug('Conference Bridge INACTIVE (no change): System: %s Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']))
-            elif _system['TO_TYPE'] == 'OFF':
-                if _system['ACTIVE'] == False:
-                    if _system['TIMER'] < _now:
-                        _system['ACTIVE'] = True
-                        logger.info('Conference Bridge TIMEOUT: ACTIVATE System: %s, Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']))
-                    else:
-                        timeout_in = _system['TIMER'] - _now
-                        logger.info('Conference Bridge INACTIVE (OFF timer running): System: %s Bridge: %s, TS: %s, TGID: %s, Timeout in: %ss,', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']),  timeout_in)
-                elif _system['ACTIVE'] == True:
-                    logger.debug('Conference Bridge ACTIVE (no change): System: %s Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']))
-            else:
-                logger.debug('Conference Bridge NO ACTION: System: %s, Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], int_id(_system['TGID']))
 
+# BPTC encode the full and embedded LCs for a target, or fetch them from the
+# cache if any other target has used the same LC recently (LRU). The encodings
+# are stored already positioned in a 33 byte burst (every other bit zero) so
+# they can be spliced into frames a byte at a time.
+def encode_lc(_lc):
+    try:
+        _encoded = LC_CACHE.pop(_lc)
+        LC_CACHE_STATS['HITS'] += 1
+    except KeyError:
+        _h_lc = bptc.encode_header_lc(_lc)
+        _t_lc = bptc.encode_terminator_lc(_lc)
+        _emb_lc = bptc.encode_emblc(_lc)
+        _encoded = (
+            (_h_lc[0:98] + FULL_LC_GAP + _h_lc[98:197]).tobytes(),
+            (_t_lc[0:98] + FULL_LC_GAP + _t_lc[98:197]).tobytes(),
+            {_burst: (EMB_LC_GAP + _emb_lc[_burst] + EMB_LC_GAP).tobytes() for _burst in range(1,5)}
+        )
+        LC_CACHE_STATS['MISSES'] += 1
+        if len(LC_CACHE) >= hb_const.LC_CACHE_SIZE:
+            LC_CACHE.popitem(last=False)
+    LC_CACHE[_lc] = _encoded
+    return _encoded
+
+
+# Splice a positioned full LC into a voice header or terminator. Bits 0-97 and
+# 166-263 come from the LC, bits 98-165 (the sync pattern) from the original burst.
+def splice_full_lc(_dmrpkt, _lc):
+    return ''.join((_lc[:12], chr(ord(_lc[12]) | (ord(_dmrpkt[12]) & 0x3F)), _dmrpkt[13:20], chr((ord(_dmrpkt[20]) & 0xFC) | ord(_lc[20])), _lc[21:]))
+
+# Splice a positioned embedded LC fragment into voice bursts B-E. Bits 116-147
+# come from the LC, everything else from the original burst.
+def splice_emb_lc(_dmrpkt, _emb_lc):
+    return ''.join((_dmrpkt[:14], chr((ord(_dmrpkt[14]) & 0xF0) | ord(_emb_lc[14])), _emb_lc[15:18], chr(ord(_emb_lc[18]) | (ord(_dmrpkt[18]) & 0x0F)), _dmrpkt[19:]))
+
+
+# Rewrite a frame for a target: the new TGID and slot bits go in the HBP header
+# and the target's LC is spliced into voice headers, terminators and bursts B-E
+def rewrite_frame(_data, _dmrpkt, _tgid, _bits, _frame_type, _dtype_vseq, _h_lc, _t_lc, _emb_lc):
+    # Assemble transmit HBP packet header
+    _header = _data[:8] + _tgid + _data[11:15] + chr(_bits) + _data[16:20]
+
+    # Create a voice header packet (FULL LC)
+    if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
+        return _header + splice_full_lc(_dmrpkt, _h_lc)
+    # Create a voice terminator packet (FULL LC)
+    elif _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
+        return _header + splice_full_lc(_dmrpkt, _t_lc)
+    # Create a Burst B-E packet (Embedded LC)
+    elif _dtype_vseq in [1,2,3,4]:
+        return _header + splice_emb_lc(_dmrpkt, _emb_lc[_dtype_vseq])
+    return _header + _dmrpkt
+
+
+# Build the routing index from the bridges. Rather than walking every bridge for
+# every frame, each ACTIVE (SYSTEM, TGID, TS) maps directly to the list of
+# (bridge, source rule, target rule) it forwards to, so the cost of forwarding
+# depends only on the number of ACTIVE targets. Only running systems are
+# targets, so build it once the systems are started (and again when that changes).
+def make_routes(_bridges):
+    _routes = {}
+    for _bridge in _bridges:
+        add_routes(_routes, _bridges, _bridge)
+    return _routes
+
+def add_routes(_routes, _bridges, _bridge):
+    for _system in _bridges[_bridge]:
+        if _system['ACTIVE'] == True:
+            _targets = [(_bridge, _system, _target) for _target in _bridges[_bridge] if _target['SYSTEM'] != _system['SYSTEM'] and _target['ACTIVE'] and _target['SYSTEM'] in systems]
+            if _targets:
+                _routes.setdefault((_system['SYSTEM'], _system['TGID'], _system['TS']), []).extend(_targets)
+
+# Re-index a single bridge -- call this any time 'ACTIVE' changes for one of its rules
+def update_routes(_bridge):
+    for _system in BRIDGES[_bridge]:
+        _key = (_system['SYSTEM'], _system['TGID'], _system['TS'])
+        if _key in ROUTES:
+            _routes = [_route for _route in ROUTES[_key] if _route[0] != _bridge]
+            if _routes:
+                ROUTES[_key] = _routes
+            else:
+                del ROUTES[_key]
+    add_routes(ROUTES, BRIDGES, _bridge)
+
+
+# Rule timeouts are scheduled with the reactor rather than polled. Each rule
+# with a running timer has one DelayedCall here, keyed by (bridge, system, TS,
+# TGID). These live outside of BRIDGES because BRIDGES gets pickled for the
+# reporting clients.
+def rule_key(_bridge, _system):
+    return (_bridge, _system['SYSTEM'], _system['TS'], _system['TGID'])
+
+# Call this any time 'TIMER' or 'ACTIVE' changes for a rule. A rule only has a
+# running timer if it is an "ON" rule that is active or an "OFF" rule that is
+# not. If the timer was pushed out we leave the pending call alone and let it
+# re-arm itself when it fires, so resets on every call end cost nothing.
+def arm_rule_timer(_bridge, _system):
+    _key = rule_key(_bridge, _system)
+    _call = RULE_TIMERS.get(_key)
+    if (_system['TO_TYPE'] == 'ON' and _system['ACTIVE'] == True) or (_system['TO_TYPE'] == 'OFF' and _system['ACTIVE'] == False):
+        _delay = max(_system['TIMER'] - time(), 0)
+        if not _call:
+            RULE_TIMERS[_key] = reactor.callLater(_delay, rule_timeout, _bridge, _system)
+        elif _call.getTime() > _system['TIMER']:
+            _call.reset(_delay)
+    elif _call:
+        _call.cancel()
+        del RULE_TIMERS[_key]
+
+# Fired by the reactor when a rule's timer is due (or was, before being pushed out)
+def rule_timeout(_bridge, _system):
+    del RULE_TIMERS[rule_key(_bridge, _system)]
+    if _system['TIMER'] > time():
+        arm_rule_timer(_bridge, _system)
+        return
+
+    if _system['TO_TYPE'] == 'ON' and _system['ACTIVE'] == True:
+        _system['ACTIVE'] = False
+        logger.info('Conference Bridge TIMEOUT: DEACTIVATE System: %s, Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], LogID(_system['TGID']))
+    elif _system['TO_TYPE'] == 'OFF' and _system['ACTIVE'] == False:
+        _system['ACTIVE'] = True
+        logger.info('Conference Bridge TIMEOUT: ACTIVATE System: %s, Bridge: %s, TS: %s, TGID: %s', _system['SYSTEM'], _bridge, _system['TS'], LogID(_system['TGID']))
+    else:
+        return
+
+    update_routes(_bridge)
     if CONFIG['REPORTS']['REPORT']:
-        report_server.send_clients('bridge updated')
-
-
-# run this every 10 seconds to trim orphaned stream ids
-def stream_trimmer_loop():
-    logger.debug('(ALL OPENBRIDGE SYSTEMS) Trimming inactive stream IDs from system lists')
-    _now = time()
-
-    for system in systems:
-        # HBP systems, master and peer
-        if CONFIG['SYSTEMS'][system]['MODE'] != 'OPENBRIDGE':
-            for slot in range(1,3):
-                _slot  = systems[system].STATUS[slot]
-                if _slot['RX_TYPE'] != hb_const.HBPF_SLT_VTERM and _slot['RX_TIME'] <  _now - 5:
-                    _slot['RX_TYPE'] = hb_const.HBPF_SLT_VTERM
-                    logger.info('(%s) *TIME OUT*  RX STREAM ID: %s SUB: %s TGID %s, TS %s, Duration: %s', \
-                        system, int_id(_slot['RX_STREAM_ID']), int_id(_slot['RX_RFS']), int_id(_slot['RX_TGID']), slot, _slot['RX_TIME'] - _slot['RX_START'])
-                    if CONFIG['REPORTS']['REPORT']:
-                        systems[system]._report.send_bridgeEvent('GROUP VOICE,END,RX,{},{},{},{},{},{},{:.2f}'.format(system, int_id(_slot['RX_STREAM_ID']), int_id(_slot['RX_PEER']), int_id(_slot['RX_RFS']), slot, int_id(_slot['RX_TGID']), _slot['RX_TIME'] - _slot['RX_START']))
-
-            for slot in range(1,3):
-                _slot  = systems[system].STATUS[slot]
-                if _slot['TX_TYPE'] != hb_const.HBPF_SLT_VTERM and _slot['TX_TIME'] <  _now - 5:
-                    _slot['TX_TYPE'] = hb_const.HBPF_SLT_VTERM
-                    logger.info('(%s) *TIME OUT*  TX STREAM ID: %s SUB: %s TGID %s, TS %s, Duration: %s', \
-                        system, int_id(_slot['TX_STREAM_ID']), int_id(_slot['TX_RFS']), int_id(_slot['TX_TGID']), slot, _slot['TX_TIME'] - _slot['TX_START'])
-                    if CONFIG['REPORTS']['REPORT']:
-                        systems[system]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(system, int_id(_slot['TX_STREAM_ID']), int_id(_slot['TX_PEER']), int_id(_slot['TX_RFS']), slot, int_id(_slot['TX_TGID']), _slot['TX_TIME'] - _slot['TX_START']))
-
-        # OBP systems
-        # We can't delete items from a dicationry that's being iterated, so we have to make a temporarly list of entrys to remove later
-        if CONFIG['SYSTEMS'][system]['MODE'] == 'OPENBRIDGE':
-            remove_list = []
-            for stream_id in systems[system].STATUS:
-                if systems[system].STATUS[stream_id]['LAST'] < _now - 5:
-                    remove_list.append(stream_id)
-            for stream_id in remove_list:
-                if stream_id in systems[system].STATUS:
-                    _system = systems[system].STATUS[stream_id]
-                    _config = CONFIG['SYSTEMS'][system]
-                    logger.info('(%s) *TIME OUT*   STREAM ID: %s SUB: %s PEER: %s TGID: %s TS 1 Duration: %s', \
-                        system, int_id(stream_id), get_alias(int_id(_system['RFS']), subscriber_ids), get_alias(int_id(_config['NETWORK_ID']), peer_ids), get_alias(int_id(_system['TGID']), talkgroup_ids), _system['LAST'] - _system['START'])
-                    if CONFIG['REPORTS']['REPORT']:
-                            systems[system]._report.send_bridgeEvent('GROUP VOICE,END,RX,{},{},{},{},{},{},{:.2f}'.format(system, int_id(stream_id), int_id(_config['NETWORK_ID']), int_id(_system['RFS']), 1, int_id(_system['TGID']), _system['LAST'] - _system['START']))
-                    removed = systems[system].STATUS.pop(stream_id)
-                else:
-                    logger.error('(%s) Attemped to remove OpenBridge Stream ID %s not in the Stream ID list: %s', system, int_id(stream_id), [id for id in systems[system].STATUS])
+        report_server.send_bridge()
+
+# Arm timers for every rule -- used once the bridges are built
+def arm_rule_timers(_bridges):
+    for _bridge in _bridges:
+        for _system in _bridges[_bridge]:
+            arm_rule_timer(_bridge, _system)
+
+
+# Let go of a system that has been stopped: cancel its stream timers and
+# drop the routes to and from it, so nothing looks it up in systems before
+# reload_bridges() has rebuilt ROUTES. Rule timers never look in systems and
+# are re-armed by reload_bridges().
+def forget_system(_system):
+    for _key in [_key for _key in STREAM_TIMERS if _key[0] == _system]:
+        STREAM_TIMERS.pop(_key).cancel()
+    for _key in ROUTES.keys():
+        _routes = [_route for _route in ROUTES[_key] if _route[2]['SYSTEM'] != _system]
+        if _routes and _key[0] != _system:
+            ROUTES[_key] = _routes
+        else:
+            del ROUTES[_key]
+
+# Read the rules file again for a reload, checking it against the new
+# configuration's systems. If the new rules are bad, the running ones are kept.
+def reread_bridges(_systems):
+    try:
+        return make_bridges('hb_confbridge_rules', _systems)
+    except SystemExit as _err:
+        logger.error('RELOAD: bridge rules not reloaded, keeping the running ones -- %s', _err)
+    except Exception:
+        # Anything else wrong with the rules file (a NameError, a rule missing a key...)
+        logger.exception('RELOAD: bridge rules not reloaded, keeping the running ones')
+    return BRIDGES
+
+# Bring BRIDGES and ROUTES up to date after a reload (_diff is hblink's
+# config_diff()) with the rules from reread_bridges(). Rules still in them keep
+# their ACTIVE state and TIMER, so nothing switched on or off by a talkgroup
+# changes.
+def reload_bridges(_diff, _bridges):
+    _start = time()
+    _old = dict((rule_key(_bridge, _system), _system) for _bridge in BRIDGES for _system in BRIDGES[_bridge])
+    for _bridge in _bridges:
+        for _system in _bridges[_bridge]:
+            _was = _old.get(rule_key(_bridge, _system))
+            if _was is not None and _was is not _system:
+                _system['ACTIVE'] = _was['ACTIVE']
+                _system['TIMER'] = _was['TIMER']
+    _changed = changed_keys(BRIDGES, _bridges)
+
+    for _call in RULE_TIMERS.values():
+        _call.cancel()
+    RULE_TIMERS.clear()
+    if _bridges is not BRIDGES:
+        BRIDGES.clear()
+        BRIDGES.update(_bridges)
+    ROUTES.clear()
+    ROUTES.update(make_routes(BRIDGES))
+    arm_rule_timers(BRIDGES)
+
+    stats['RELOAD']['BRIDGES'] = _changed
+    logger.info('RELOAD: bridge rules reloaded in %.1f ms -- %s', (time() - _start) * 1000, ', '.join(_changed) or 'no changes')
+    if CONFIG['REPORTS']['REPORT']:
+        report_server.send_bridge()
+
+
+# Stream inactivity timers, also scheduled with the reactor. One is armed when
+# a stream starts: HBP slots are keyed (system, slot, 'RX'|'TX') and OpenBridge
+# streams (system, stream id). We don't touch them per frame -- when a timer
+# fires on a stream that is still carrying traffic, it is re-armed for the
+# last frame time + STREAM_IDLE_TO, and one that finds its stream already
+# ended just goes away.
+def arm_stream_timer(_key, _func, *_args):
+    if _key not in STREAM_TIMERS:
+        STREAM_TIMERS[_key] = reactor.callLater(hb_const.STREAM_IDLE_TO, _func, *_args)
+
+def slot_timeout(_system, _slot, _dir):
+    _key = (_system, _slot, _dir)
+    del STREAM_TIMERS[_key]
+    _status = systems[_system].STATUS[_slot]
+    if _dir == 'RX':
+        _type, _last = _status.RX_TYPE, _status.RX_TIME
+    else:
+        _type, _last = _status.TX_TYPE, _status.TX_TIME
+    if _type == hb_const.HBPF_SLT_VTERM:
+        return
+    _delay = _last + hb_const.STREAM_IDLE_TO - time()
+    if _delay > 0:
+        STREAM_TIMERS[_key] = reactor.callLater(_delay, slot_timeout, _system, _slot, _dir)
+        return
+
+    if _dir == 'RX':
+        _status.RX_TYPE = hb_const.HBPF_SLT_VTERM
+        logger.info('(%s) *TIME OUT*  RX STREAM ID: %s SUB: %s TGID %s, TS %s, Duration: %s', \
+            _system, LogID(_status.RX_STREAM_ID), LogID(_status.RX_RFS), LogID(_status.RX_TGID), _slot, _status.RX_TIME - _status.RX_START)
+        if CONFIG['REPORTS']['REPORT']:
+            systems[_system]._report.send_bridgeEvent('GROUP VOICE,END,RX,{},{},{},{},{},{},{:.2f}'.format(_system, int_id(_status.RX_STREAM_ID), int_id(_status.RX_PEER), int_id(_status.RX_RFS), _slot, int_id(_status.RX_TGID), _status.RX_TIME - _status.RX_START))
+    else:
+        _status.TX_TYPE = hb_const.HBPF_SLT_VTERM
+        logger.info('(%s) *TIME OUT*  TX STREAM ID: %s SUB: %s TGID %s, TS %s, Duration: %s', \
+            _system, LogID(_status.TX_STREAM_ID), LogID(_status.TX_RFS), LogID(_status.TX_TGID), _slot, _status.TX_TIME - _status.TX_START)
+        if CONFIG['REPORTS']['REPORT']:
+            systems[_system]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_system, int_id(_status.TX_STREAM_ID), int_id(_status.TX_PEER), int_id(_status.TX_RFS), _slot, int_id(_status.TX_TGID), _status.TX_TIME - _status.TX_START))
+
+def obp_stream_timeout(_system, _stream_id):
+    _key = (_system, _stream_id)
+    del STREAM_TIMERS[_key]
+    _stream = systems[_system].STATUS.get(_stream_id)
+    if not _stream:
+        return
+    _delay = _stream.LAST + hb_const.STREAM_IDLE_TO - time()
+    if _delay > 0:
+        STREAM_TIMERS[_key] = reactor.callLater(_delay, obp_stream_timeout, _system, _stream_id)
+        return
+
+    _config = CONFIG['SYSTEMS'][_system]
+    logger.info('(%s) *TIME OUT*   STREAM ID: %s SUB: %s PEER: %s TGID: %s TS 1 Duration: %s', \
+        _system, LogID(_stream_id), LogAlias(_stream.RFS, subscriber_ids), LogAlias(_config['NETWORK_ID'], peer_ids), LogAlias(_stream.TGID, talkgroup_ids), _stream.LAST - _stream.START)
+    if CONFIG['REPORTS']['REPORT']:
+        systems[_system]._report.send_bridgeEvent('GROUP VOICE,END,RX,{},{},{},{},{},{},{:.2f}'.format(_system, int_id(_stream_id), int_id(_config['NETWORK_ID']), int_id(_stream.RFS), 1, int_id(_stream.TGID), _stream.LAST - _stream.START))
+    del systems[_system].STATUS[_stream_id]
 
 class routerOBP(OPENBRIDGE):
 
@@ -208,199 +408,159 @@ class routerOBP(OPENBRIDGE):
         OPENBRIDGE.__init__(self, _name, _config, _report)
         self.STATUS = {}
 
+    def stopped(self):
+        forget_system(self._system)
 
     def dmrd_received(self, _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data):
         pkt_time = time()
         dmrpkt = _data[20:53]
-        _bits = int_id(_data[15])
+        _bits = ord(_data[15])
 
         if _call_type == 'group':
             # Is this a new call stream?
             if (_stream_id not in self.STATUS):
                 # This is a new call stream
-                self.STATUS[_stream_id] = {
-                    'START':     pkt_time,
-                    'CONTENTION':False,
-                    'RFS':       _rf_src,
-                    'TGID':      _dst_id,
-                }
+                self.STATUS[_stream_id] = StreamState(pkt_time, _rf_src, _dst_id)
+                arm_stream_timer((self._system, _stream_id), obp_stream_timeout, self._system, _stream_id)
 
                 # If we can, use the LC from the voice header as to keep all options intact
                 if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
                     decoded = decode.voice_head_term(dmrpkt)
-                    self.STATUS[_stream_id]['LC'] = decoded['LC']
+                    self.STATUS[_stream_id].LC = decoded['LC']
 
                 # If we don't have a voice header then don't wait to decode the Embedded LC
                 # just make a new one from the HBP header. This is good enough, and it saves lots of time
                 else:
-                    self.STATUS[_stream_id]['LC'] = const.LC_OPT + _dst_id + _rf_src
+                    self.STATUS[_stream_id].LC = const.LC_OPT + _dst_id + _rf_src
 
 
-                logger.info('(%s) *CALL START* STREAM ID: %s SUB: %s (%s) PEER: %s (%s) TGID %s (%s), TS %s', \
-                        self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot)
+                log_call(logger, 'START', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES)
                 if CONFIG['REPORTS']['REPORT']:
                     self._report.send_bridgeEvent('GROUP VOICE,START,RX,{},{},{},{},{},{}'.format(self._system, int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _slot, int_id(_dst_id)))
 
-            self.STATUS[_stream_id]['LAST'] = pkt_time
-
-
-            for _bridge in BRIDGES:
-                for _system in BRIDGES[_bridge]:
-
-                    if (_system['SYSTEM'] == self._system and _system['TGID'] == _dst_id and _system['TS'] == _slot and _system['ACTIVE'] == True):
-
-                        for _target in BRIDGES[_bridge]:
-                            if (_target['SYSTEM'] != self._system) and (_target['ACTIVE']):
-                                _target_status = systems[_target['SYSTEM']].STATUS
-                                _target_system = self._CONFIG['SYSTEMS'][_target['SYSTEM']]
-                                if _target_system['MODE'] == 'OPENBRIDGE':
-                                    # Is this a new call stream on the target?
-                                    if (_stream_id not in _target_status):
-                                        # This is a new call stream on the target
-                                        _target_status[_stream_id] = {
-                                            'START':     pkt_time,
-                                            'CONTENTION':False,
-                                            'RFS':       _rf_src,
-                                            'TGID':      _dst_id,
-                                        }
-                                        # Generate LCs (full and EMB) for the TX stream
-                                        dst_lc = ''.join([self.STATUS[_stream_id]['LC'][0:3], _target['TGID'], _rf_src])
-                                        _target_status[_stream_id]['H_LC'] = bptc.encode_header_lc(dst_lc)
-                                        _target_status[_stream_id]['T_LC'] = bptc.encode_terminator_lc(dst_lc)
-                                        _target_status[_stream_id]['EMB_LC'] = bptc.encode_emblc(dst_lc)
-
-                                        logger.info('(%s) Conference Bridge: %s, Call Bridged to OBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
-                                        if CONFIG['REPORTS']['REPORT']:
-                                            systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
-
-                                    # Record the time of this packet so we can later identify a stale stream
-                                    _target_status[_stream_id]['LAST'] = pkt_time
-                                    # Clear the TS bit -- all OpenBridge streams are effectively on TS1
-                                    _tmp_bits = _bits & ~(1 << 7)
-
-                                    # Assemble transmit HBP packet header
-                                    _tmp_data = _data[:8] + _target['TGID'] + _data[11:15] + chr(_tmp_bits) + _data[16:20]
-
-                                    # MUST TEST FOR NEW STREAM AND IF SO, RE-WRITE THE LC FOR THE TARGET
-                                    # MUST RE-WRITE DESTINATION TGID IF DIFFERENT
-                                    # if _dst_id != rule['DST_GROUP']:
-                                    dmrbits = bitarray(endian='big')
-                                    dmrbits.frombytes(dmrpkt)
-                                    # Create a voice header packet (FULL LC)
-                                    if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
-                                        dmrbits = _target_status[_stream_id]['H_LC'][0:98] + dmrbits[98:166] + _target_status[_stream_id]['H_LC'][98:197]
-                                    # Create a voice terminator packet (FULL LC)
-                                    elif _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
-                                        dmrbits = _target_status[_stream_id]['T_LC'][0:98] + dmrbits[98:166] + _target_status[_stream_id]['T_LC'][98:197]
-                                        if CONFIG['REPORTS']['REPORT']:
-                                            call_duration = pkt_time - _target_status[_stream_id]['START']
-                                            systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
-                                    # Create a Burst B-E packet (Embedded LC)
-                                    elif _dtype_vseq in [1,2,3,4]:
-                                        dmrbits = dmrbits[0:116] + _target_status[_stream_id]['EMB_LC'][_dtype_vseq] + dmrbits[148:264]
-                                    dmrpkt = dmrbits.tobytes()
-                                    _tmp_data = _tmp_data + dmrpkt #+ _data[53:55]
-
-                                else:
-                                    # BEGIN CONTENTION HANDLING
-                                    #
-                                    # The rules for each of the 4 "ifs" below are listed here for readability. The Frame To Send is:
-                                    #   From a different group than last RX from this HBSystem, but it has been less than Group Hangtime
-                                    #   From a different group than last TX to this HBSystem, but it has been less than Group Hangtime
-                                    #   From the same group as the last RX from this HBSystem, but from a different subscriber, and it has been less than stream timeout
-                                    #   From the same group as the last TX to this HBSystem, but from a different subscriber, and it has been less than stream timeout
-                                    # The "continue" at the end of each means the next iteration of the for loop that tests for matching rules
-                                    #
-                                    if ((_target['TGID'] != _target_status[_target['TS']]['RX_TGID']) and ((pkt_time - _target_status[_target['TS']]['RX_TIME']) < _target_system['GROUP_HANGTIME'])):
-                                        if self.STATUS[_stream_id]['CONTENTION'] == False:
-                                            self.STATUS[_stream_id]['CONTENTION'] = True
-                                            logger.info('(%s) Call not routed to TGID %s, target active or in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, int_id(_target['TGID']), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['RX_TGID']))
-                                        continue
-                                    if ((_target['TGID'] != _target_status[_target['TS']]['TX_TGID']) and ((pkt_time - _target_status[_target['TS']]['TX_TIME']) < _target_system['GROUP_HANGTIME'])):
-                                        if self.STATUS[_stream_id]['CONTENTION'] == False:
-                                            self.STATUS[_stream_id]['CONTENTION'] = True
-                                            logger.info('(%s) Call not routed to TGID%s, target in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, int_id(_target['TGID']), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['TX_TGID']))
-                                        continue
-                                    if (_target['TGID'] == _target_status[_target['TS']]['RX_TGID']) and ((pkt_time - _target_status[_target['TS']]['RX_TIME']) < hb_const.STREAM_TO):
-                                        if self.STATUS[_stream_id]['CONTENTION'] == False:
-                                            self.STATUS[_stream_id]['CONTENTION'] = True
-                                            logger.info('(%s) Call not routed to TGID%s, matching call already active on target: HBSystem: %s, TS: %s, TGID: %s', self._system, int_id(_target['TGID']), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['RX_TGID']))
-                                        continue
-                                    if (_target['TGID'] == _target_status[_target['TS']]['TX_TGID']) and (_rf_src != _target_status[_target['TS']]['TX_RFS']) and ((pkt_time - _target_status[_target['TS']]['TX_TIME']) < hb_const.STREAM_TO):
-                                        if self.STATUS[_stream_id]['CONTENTION'] == False:
-                                            self.STATUS[_stream_id]['CONTENTION'] = True
-                                            logger.info('(%s) Call not routed for subscriber %s, call route in progress on target: HBSystem: %s, TS: %s, TGID: %s, SUB: %s', self._system, int_id(_rf_src), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['TX_TGID']), int_id(_target_status[_target['TS']]['TX_RFS']))
-                                        continue
-
-                                    # Is this a new call stream?
-                                    if (_target_status[_target['TS']]['TX_STREAM_ID'] != _stream_id): #(_target_status[_target['TS']]['TX_RFS'] != _rf_src) or (_target_status[_target['TS']]['TX_TGID'] != _target['TGID']):
-                                    #if (_stream_id != self.STATUS[_slot]['RX_STREAM_ID']) or (_target_status[_target['TS']]['TX_RFS'] != _rf_src) or (_target_status[_target['TS']]['TX_TGID'] != _target['TGID']):
-                                        # Record the DST TGID and Stream ID
-                                        _target_status[_target['TS']]['TX_START'] = pkt_time
-                                        _target_status[_target['TS']]['TX_TGID'] = _target['TGID']
-                                        _target_status[_target['TS']]['TX_STREAM_ID'] = _stream_id
-                                        _target_status[_target['TS']]['TX_RFS'] = _rf_src
-                                        _target_status[_target['TS']]['TX_PEER'] = _peer_id
-                                        # Generate LCs (full and EMB) for the TX stream
-                                        dst_lc = self.STATUS[_stream_id]['LC'][0:3] + _target['TGID'] + _rf_src
-                                        _target_status[_target['TS']]['TX_H_LC'] = bptc.encode_header_lc(dst_lc)
-                                        _target_status[_target['TS']]['TX_T_LC'] = bptc.encode_terminator_lc(dst_lc)
-                                        _target_status[_target['TS']]['TX_EMB_LC'] = bptc.encode_emblc(dst_lc)
-                                        logger.debug('(%s) Generating TX FULL and EMB LCs for HomeBrew destination: System: %s, TS: %s, TGID: %s', self._system, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
-                                        logger.info('(%s) Conference Bridge: %s, Call Bridged to HBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
-                                        if CONFIG['REPORTS']['REPORT']:
-                                           systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
-
-                                    # Set other values for the contention handler to test next time there is a frame to forward
-                                    _target_status[_target['TS']]['TX_TIME'] = pkt_time
-                                    _target_status[_target['TS']]['TX_TYPE'] = _dtype_vseq
-
-                                    # Handle any necessary re-writes for the destination
-                                    if _system['TS'] != _target['TS']:
-                                        _tmp_bits = _bits ^ 1 << 7
-                                    else:
-                                        _tmp_bits = _bits
-
-                                    # Assemble transmit HBP packet header
-                                    _tmp_data = _data[:8] + _target['TGID'] + _data[11:15] + chr(_tmp_bits) + _data[16:20]
-
-                                    # MUST TEST FOR NEW STREAM AND IF SO, RE-WRITE THE LC FOR THE TARGET
-                                    # MUST RE-WRITE DESTINATION TGID IF DIFFERENT
-                                    # if _dst_id != rule['DST_GROUP']:
-                                    dmrbits = bitarray(endian='big')
-                                    dmrbits.frombytes(dmrpkt)
-                                    # Create a voice header packet (FULL LC)
-                                    if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
-                                        dmrbits = _target_status[_target['TS']]['TX_H_LC'][0:98] + dmrbits[98:166] + _target_status[_target['TS']]['TX_H_LC'][98:197]
-                                    # Create a voice terminator packet (FULL LC)
-                                    elif _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
-                                        dmrbits = _target_status[_target['TS']]['TX_T_LC'][0:98] + dmrbits[98:166] + _target_status[_target['TS']]['TX_T_LC'][98:197]
-                                        if CONFIG['REPORTS']['REPORT']:
-                                            call_duration = pkt_time - _target_status[_target['TS']]['TX_START']
-                                            systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
-                                    # Create a Burst B-E packet (Embedded LC)
-                                    elif _dtype_vseq in [1,2,3,4]:
-                                        dmrbits = dmrbits[0:116] + _target_status[_target['TS']]['TX_EMB_LC'][_dtype_vseq] + dmrbits[148:264]
-                                    dmrpkt = dmrbits.tobytes()
-                                    _tmp_data = _tmp_data + dmrpkt + '\x00\x00' # Add two bytes of nothing since OBP doesn't include BER & RSSI bytes #_data[53:55]
-
-                                # Transmit the packet to the destination system
-                                systems[_target['SYSTEM']].send_system(_tmp_data)
-                                #logger.debug('(%s) Packet routed by bridge: %s to system: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
+            self.STATUS[_stream_id].LAST = pkt_time
+
+
+            _frames = {}
+            for _bridge, _system, _target in ROUTES.get((self._system, _dst_id, _slot), []):
+                _target_status = systems[_target['SYSTEM']].STATUS
+                _target_system = self._CONFIG['SYSTEMS'][_target['SYSTEM']]
+                if _target_system['MODE'] == 'OPENBRIDGE':
+                    # Is this a new call stream on the target?
+                    if (_stream_id not in _target_status):
+                        # This is a new call stream on the target
+                        _target_status[_stream_id] = StreamState(pkt_time, _rf_src, _dst_id)
+                        arm_stream_timer((_target['SYSTEM'], _stream_id), obp_stream_timeout, _target['SYSTEM'], _stream_id)
+                        # Generate LCs (full and EMB) for the TX stream
+                        dst_lc = ''.join([self.STATUS[_stream_id].LC[0:3], _target['TGID'], _rf_src])
+                        _target_status[_stream_id].H_LC, _target_status[_stream_id].T_LC, _target_status[_stream_id].EMB_LC = encode_lc(dst_lc)
+
+                        logger.info('(%s) Conference Bridge: %s, Call Bridged to OBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], LogID(_target['TGID']))
+                        if CONFIG['REPORTS']['REPORT']:
+                            systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
+
+                    # Record the time of this packet so we can later identify a stale stream
+                    _target_status[_stream_id].LAST = pkt_time
+                    if CONFIG['REPORTS']['REPORT'] and _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
+                        call_duration = pkt_time - _target_status[_stream_id].START
+                        systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
+
+                    # Every target with the same TGID, TS and mode gets an identical frame, so only build it once
+                    _frame_key = (_target['TGID'], _target['TS'], 'OPENBRIDGE')
+                    _tmp_data = _frames.get(_frame_key)
+                    if _tmp_data is None:
+                        # Clear the TS bit -- all OpenBridge streams are effectively on TS1
+                        _tmp_data = rewrite_frame(_data, dmrpkt, _target['TGID'], _bits & ~(1 << 7), _frame_type, _dtype_vseq, _target_status[_stream_id].H_LC, _target_status[_stream_id].T_LC, _target_status[_stream_id].EMB_LC) #+ _data[53:55]
+                        _frames[_frame_key] = _tmp_data
+
+                else:
+                    _tgt_slot = _target_status[_target['TS']]
+
+                    # BEGIN CONTENTION HANDLING
+                    #
+                    # The rules for each of the 4 "ifs" below are listed here for readability. The Frame To Send is:
+                    #   From a different group than last RX from this HBSystem, but it has been less than Group Hangtime
+                    #   From a different group than last TX to this HBSystem, but it has been less than Group Hangtime
+                    #   From the same group as the last RX from this HBSystem, but from a different subscriber, and it has been less than stream timeout
+                    #   From the same group as the last TX to this HBSystem, but from a different subscriber, and it has been less than stream timeout
+                    # The "continue" at the end of each means the next iteration of the for loop that tests for matching rules
+                    #
+                    if ((_target['TGID'] != _tgt_slot.RX_TGID) and ((pkt_time - _tgt_slot.RX_TIME) < _target_system['GROUP_HANGTIME'])):
+                        if self.STATUS[_stream_id].CONTENTION == False:
+                            self.STATUS[_stream_id].CONTENTION = True
+                            logger.info('(%s) Call not routed to TGID %s, target active or in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, LogID(_target['TGID']), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.RX_TGID))
+                        continue
+                    if ((_target['TGID'] != _tgt_slot.TX_TGID) and ((pkt_time - _tgt_slot.TX_TIME) < _target_system['GROUP_HANGTIME'])):
+                        if self.STATUS[_stream_id].CONTENTION == False:
+                            self.STATUS[_stream_id].CONTENTION = True
+                            logger.info('(%s) Call not routed to TGID%s, target in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, LogID(_target['TGID']), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.TX_TGID))
+                        continue
+                    if (_target['TGID'] == _tgt_slot.RX_TGID) and ((pkt_time - _tgt_slot.RX_TIME) < hb_const.STREAM_TO):
+                        if self.STATUS[_stream_id].CONTENTION == False:
+                            self.STATUS[_stream_id].CONTENTION = True
+                            logger.info('(%s) Call not routed to TGID%s, matching call already active on target: HBSystem: %s, TS: %s, TGID: %s', self._system, LogID(_target['TGID']), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.RX_TGID))
+                        continue
+                    if (_target['TGID'] == _tgt_slot.TX_TGID) and (_rf_src != _tgt_slot.TX_RFS) and ((pkt_time - _tgt_slot.TX_TIME) < hb_const.STREAM_TO):
+                        if self.STATUS[_stream_id].CONTENTION == False:
+                            self.STATUS[_stream_id].CONTENTION = True
+                            logger.info('(%s) Call not routed for subscriber %s, call route in progress on target: HBSystem: %s, TS: %s, TGID: %s, SUB: %s', self._system, LogID(_rf_src), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.TX_TGID), LogID(_tgt_slot.TX_RFS))
+                        continue
+
+                    # Is this a new call stream?
+                    if (_tgt_slot.TX_STREAM_ID != _stream_id): #(_tgt_slot.TX_RFS != _rf_src) or (_tgt_slot.TX_TGID != _target['TGID']):
+                    #if (_stream_id != self.STATUS[_slot].RX_STREAM_ID) or (_tgt_slot.TX_RFS != _rf_src) or (_tgt_slot.TX_TGID != _target['TGID']):
+                        # Record the DST TGID and Stream ID
+                        _tgt_slot.TX_START = pkt_time
+                        _tgt_slot.TX_TGID = _target['TGID']
+                        _tgt_slot.TX_STREAM_ID = _stream_id
+                        arm_stream_timer((_target['SYSTEM'], _target['TS'], 'TX'), slot_timeout, _target['SYSTEM'], _target['TS'], 'TX')
+                        _tgt_slot.TX_RFS = _rf_src
+                        _tgt_slot.TX_PEER = _peer_id
+                        # Generate LCs (full and EMB) for the TX stream
+                        dst_lc = self.STATUS[_stream_id].LC[0:3] + _target['TGID'] + _rf_src
+                        _tgt_slot.TX_H_LC, _tgt_slot.TX_T_LC, _tgt_slot.TX_EMB_LC = encode_lc(dst_lc)
+                        if log_levels.DEBUG:
+                            logger.debug('(%s) Generating TX FULL and EMB LCs for HomeBrew destination: System: %s, TS: %s, TGID: %s', self._system, _target['SYSTEM'], _target['TS'], LogID(_target['TGID']))
+                        logger.info('(%s) Conference Bridge: %s, Call Bridged to HBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], LogID(_target['TGID']))
+                        if CONFIG['REPORTS']['REPORT']:
+                           systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
+
+                    # Set other values for the contention handler to test next time there is a frame to forward
+                    _tgt_slot.TX_TIME = pkt_time
+                    _tgt_slot.TX_TYPE = _dtype_vseq
+
+                    if CONFIG['REPORTS']['REPORT'] and _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
+                        call_duration = pkt_time - _tgt_slot.TX_START
+                        systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
+
+                    # Every target with the same TGID, TS and mode gets an identical frame, so only build it once
+                    _frame_key = (_target['TGID'], _target['TS'], 'HBP')
+                    _tmp_data = _frames.get(_frame_key)
+                    if _tmp_data is None:
+                        # Handle any necessary re-writes for the destination
+                        if _system['TS'] != _target['TS']:
+                            _tmp_bits = _bits ^ 1 << 7
+                        else:
+                            _tmp_bits = _bits
+                        _tmp_data = rewrite_frame(_data, dmrpkt, _target['TGID'], _tmp_bits, _frame_type, _dtype_vseq, _tgt_slot.TX_H_LC, _tgt_slot.TX_T_LC, _tgt_slot.TX_EMB_LC) + '\x00\x00' # Add two bytes of nothing since OBP doesn't include BER & RSSI bytes #_data[53:55]
+                        _frames[_frame_key] = _tmp_data
+
+                # Transmit the packet to the destination system
+                systems[_target['SYSTEM']].send_system(_tmp_data)
+                #logger.debug('(%s) Packet routed by bridge: %s to system: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
 
 
 
             # Final actions - Is this a voice terminator?
             if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM):
-                call_duration = pkt_time - self.STATUS[_stream_id]['START']
-                logger.info('(%s) *CALL END*   STREAM ID: %s SUB: %s (%s) PEER: %s (%s) TGID %s (%s), TS %s, Duration: %s', \
-                        self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot, call_duration)
+                call_duration = pkt_time - self.STATUS[_stream_id].START
+                log_call(logger, 'END', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES, call_duration)
                 if CONFIG['REPORTS']['REPORT']:
                    self._report.send_bridgeEvent('GROUP VOICE,END,RX,{},{},{},{},{},{},{:.2f}'.format(self._system, int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _slot, int_id(_dst_id), call_duration))
                 removed = self.STATUS.pop(_stream_id)
-                logger.debug('(%s) OpenBridge sourced call stream end, remove terminated Stream ID: %s', self._system, int_id(_stream_id))
+                logger.debug('(%s) OpenBridge sourced call stream end, remove terminated Stream ID: %s', self._system, LogID(_stream_id))
                 if not removed:
-                    selflogger.error('(%s) *CALL END*   STREAM ID: %s NOT IN LIST -- THIS IS A REAL PROBLEM', self._system, int_id(_stream_id))
+                    selflogger.error('(%s) *CALL END*   STREAM ID: %s NOT IN LIST -- THIS IS A REAL PROBLEM', self._system, LogID(_stream_id))
 
 class routerHBP(HBSYSTEM):
 
@@ -409,240 +569,151 @@ class routerHBP(HBSYSTEM):
 
         # Status information for the system, TS1 & TS2
         # 1 & 2 are "timeslot"
-        # In TX_EMB_LC, 2-5 are burst B-E
-        self.STATUS = {
-            1: {
-                'RX_START':     time(),
-                'TX_START':     time(),
-                'RX_SEQ':       '\x00',
-                'RX_RFS':       '\x00',
-                'TX_RFS':       '\x00',
-                'RX_PEER':      '\x00',
-                'TX_PEER':      '\x00',
-                'RX_STREAM_ID': '\x00',
-                'TX_STREAM_ID': '\x00',
-                'RX_TGID':      '\x00\x00\x00',
-                'TX_TGID':      '\x00\x00\x00',
-                'RX_TIME':      time(),
-                'TX_TIME':      time(),
-                'RX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'TX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'RX_LC':        '\x00',
-                'TX_H_LC':      '\x00',
-                'TX_T_LC':      '\x00',
-                'TX_EMB_LC': {
-                    1: '\x00',
-                    2: '\x00',
-                    3: '\x00',
-                    4: '\x00',
-                    }
-                },
-            2: {
-                'RX_START':     time(),
-                'TX_START':     time(),
-                'RX_SEQ':       '\x00',
-                'RX_RFS':       '\x00',
-                'TX_RFS':       '\x00',
-                'RX_PEER':      '\x00',
-                'TX_PEER':      '\x00',
-                'RX_STREAM_ID': '\x00',
-                'TX_STREAM_ID': '\x00',
-                'RX_TGID':      '\x00\x00\x00',
-                'TX_TGID':      '\x00\x00\x00',
-                'RX_TIME':      time(),
-                'TX_TIME':      time(),
-                'RX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'TX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'RX_LC':        '\x00',
-                'TX_H_LC':      '\x00',
-                'TX_T_LC':      '\x00',
-                'TX_EMB_LC': {
-                    1: '\x00',
-                    2: '\x00',
-                    3: '\x00',
-                    4: '\x00',
-                    }
-                }
-            }
+        self.STATUS = {1: SlotState(), 2: SlotState()}
+
+    def stopped(self):
+        forget_system(self._system)
 
     def dmrd_received(self, _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data):
         pkt_time = time()
         dmrpkt = _data[20:53]
-        _bits = int_id(_data[15])
+        _bits = ord(_data[15])
 
         if _call_type == 'group':
 
             # Is this a new call stream?
-            if (_stream_id != self.STATUS[_slot]['RX_STREAM_ID']):
-                if (self.STATUS[_slot]['RX_TYPE'] != hb_const.HBPF_SLT_VTERM) and (pkt_time < (self.STATUS[_slot]['RX_TIME'] + hb_const.STREAM_TO)) and (_rf_src != self.STATUS[_slot]['RX_RFS']):
-                    logger.warning('(%s) Packet received with STREAM ID: %s <FROM> SUB: %s PEER: %s <TO> TGID %s, SLOT %s collided with existing call', self._system, int_id(_stream_id), int_id(_rf_src), int_id(_peer_id), int_id(_dst_id), _slot)
+            if (_stream_id != self.STATUS[_slot].RX_STREAM_ID):
+                if (self.STATUS[_slot].RX_TYPE != hb_const.HBPF_SLT_VTERM) and (pkt_time < (self.STATUS[_slot].RX_TIME + hb_const.STREAM_TO)) and (_rf_src != self.STATUS[_slot].RX_RFS):
+                    logger.warning('(%s) Packet received with STREAM ID: %s <FROM> SUB: %s PEER: %s <TO> TGID %s, SLOT %s collided with existing call', self._system, LogID(_stream_id), LogID(_rf_src), LogID(_peer_id), LogID(_dst_id), _slot)
                     return
 
                 # This is a new call stream
-                self.STATUS[_slot]['RX_START'] = pkt_time
-                logger.info('(%s) *CALL START* STREAM ID: %s SUB: %s (%s) PEER: %s (%s) TGID %s (%s), TS %s', \
-                        self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot)
+                self.STATUS[_slot].RX_START = pkt_time
+                arm_stream_timer((self._system, _slot, 'RX'), slot_timeout, self._system, _slot, 'RX')
+                log_call(logger, 'START', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES)
                 if CONFIG['REPORTS']['REPORT']:
                     self._report.send_bridgeEvent('GROUP VOICE,START,RX,{},{},{},{},{},{}'.format(self._system, int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _slot, int_id(_dst_id)))
 
                 # If we can, use the LC from the voice header as to keep all options intact
                 if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
                     decoded = decode.voice_head_term(dmrpkt)
-                    self.STATUS[_slot]['RX_LC'] = decoded['LC']
+                    self.STATUS[_slot].RX_LC = decoded['LC']
 
                 # If we don't have a voice header then don't wait to decode it from the Embedded LC
                 # just make a new one from the HBP header. This is good enough, and it saves lots of time
                 else:
-                    self.STATUS[_slot]['RX_LC'] = const.LC_OPT + _dst_id + _rf_src
-
-            for _bridge in BRIDGES:
-                for _system in BRIDGES[_bridge]:
-
-                    if (_system['SYSTEM'] == self._system and _system['TGID'] == _dst_id and _system['TS'] == _slot and _system['ACTIVE'] == True):
-
-                        for _target in BRIDGES[_bridge]:
-                            if _target['SYSTEM'] != self._system:
-                                if _target['ACTIVE']:
-                                    _target_status = systems[_target['SYSTEM']].STATUS
-                                    _target_system = self._CONFIG['SYSTEMS'][_target['SYSTEM']]
-
-                                    if _target_system['MODE'] == 'OPENBRIDGE':
-                                        # Is this a new call stream on the target?
-                                        if (_stream_id not in _target_status):
-                                            # This is a new call stream on the target
-                                            _target_status[_stream_id] = {
-                                                'START':     pkt_time,
-                                                'CONTENTION':False,
-                                                'RFS':       _rf_src,
-                                                'TGID':      _dst_id,
-                                            }
-                                            # Generate LCs (full and EMB) for the TX stream
-                                            dst_lc = ''.join([self.STATUS[_slot]['RX_LC'][0:3], _target['TGID'], _rf_src])
-                                            _target_status[_stream_id]['H_LC'] = bptc.encode_header_lc(dst_lc)
-                                            _target_status[_stream_id]['T_LC'] = bptc.encode_terminator_lc(dst_lc)
-                                            _target_status[_stream_id]['EMB_LC'] = bptc.encode_emblc(dst_lc)
-                                            
-                                            logger.info('(%s) Conference Bridge: %s, Call Bridged to OBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
-                                            if CONFIG['REPORTS']['REPORT']:
-                                                systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
-
-                                        # Record the time of this packet so we can later identify a stale stream
-                                        _target_status[_stream_id]['LAST'] = pkt_time
-                                        # Clear the TS bit -- all OpenBridge streams are effectively on TS1
-                                        _tmp_bits = _bits & ~(1 << 7)
-
-                                        # Assemble transmit HBP packet header
-                                        _tmp_data = _data[:8] + _target['TGID'] + _data[11:15] + chr(_tmp_bits) + _data[16:20]
-
-                                        # MUST TEST FOR NEW STREAM AND IF SO, RE-WRITE THE LC FOR THE TARGET
-                                        # MUST RE-WRITE DESTINATION TGID IF DIFFERENT
-                                        # if _dst_id != rule['DST_GROUP']:
-                                        dmrbits = bitarray(endian='big')
-                                        dmrbits.frombytes(dmrpkt)
-                                        # Create a voice header packet (FULL LC)
-                                        if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
-                                            dmrbits = _target_status[_stream_id]['H_LC'][0:98] + dmrbits[98:166] + _target_status[_stream_id]['H_LC'][98:197]
-                                        # Create a voice terminator packet (FULL LC)
-                                        elif _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
-                                            dmrbits = _target_status[_stream_id]['T_LC'][0:98] + dmrbits[98:166] + _target_status[_stream_id]['T_LC'][98:197]
-                                            if CONFIG['REPORTS']['REPORT']:
-                                                call_duration = pkt_time - _target_status[_stream_id]['START']
-                                                systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
-                                        # Create a Burst B-E packet (Embedded LC)
-                                        elif _dtype_vseq in [1,2,3,4]:
-                                            dmrbits = dmrbits[0:116] + _target_status[_stream_id]['EMB_LC'][_dtype_vseq] + dmrbits[148:264]
-                                        dmrpkt = dmrbits.tobytes()
-                                        _tmp_data = _tmp_data + dmrpkt #+ _data[53:55]
-
-                                    else:
-                                        # BEGIN STANDARD CONTENTION HANDLING
-                                        #
-                                        # The rules for each of the 4 "ifs" below are listed here for readability. The Frame To Send is:
-                                        #   From a different group than last RX from this HBSystem, but it has been less than Group Hangtime
-                                        #   From a different group than last TX to this HBSystem, but it has been less than Group Hangtime
-                                        #   From the same group as the last RX from this HBSystem, but from a different subscriber, and it has been less than stream timeout
-                                        #   From the same group as the last TX to this HBSystem, but from a different subscriber, and it has been less than stream timeout
-                                        # The "continue" at the end of each means the next iteration of the for loop that tests for matching rules
-                                        #
-                                        if ((_target['TGID'] != _target_status[_target['TS']]['RX_TGID']) and ((pkt_time - _target_status[_target['TS']]['RX_TIME']) < _target_system['GROUP_HANGTIME'])):
-                                            if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot]['RX_STREAM_ID'] != _seq:
-                                                logger.info('(%s) Call not routed to TGID %s, target active or in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, int_id(_target['TGID']), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['RX_TGID']))
-                                            continue
-                                        if ((_target['TGID'] != _target_status[_target['TS']]['TX_TGID']) and ((pkt_time - _target_status[_target['TS']]['TX_TIME']) < _target_system['GROUP_HANGTIME'])):
-                                            if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot]['RX_STREAM_ID'] != _seq:
-                                                logger.info('(%s) Call not routed to TGID%s, target in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, int_id(_target['TGID']), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['TX_TGID']))
-                                            continue
-                                        if (_target['TGID'] == _target_status[_target['TS']]['RX_TGID']) and ((pkt_time - _target_status[_target['TS']]['RX_TIME']) < hb_const.STREAM_TO):
-                                            if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot]['RX_STREAM_ID'] != _seq:
-                                                logger.info('(%s) Call not routed to TGID%s, matching call already active on target: HBSystem: %s, TS: %s, TGID: %s', self._system, int_id(_target['TGID']), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['RX_TGID']))
-                                            continue
-                                        if (_target['TGID'] == _target_status[_target['TS']]['TX_TGID']) and (_rf_src != _target_status[_target['TS']]['TX_RFS']) and ((pkt_time - _target_status[_target['TS']]['TX_TIME']) < hb_const.STREAM_TO):
-                                            if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot]['RX_STREAM_ID'] != _seq:
-                                                logger.info('(%s) Call not routed for subscriber %s, call route in progress on target: HBSystem: %s, TS: %s, TGID: %s, SUB: %s', self._system, int_id(_rf_src), _target['SYSTEM'], _target['TS'], int_id(_target_status[_target['TS']]['TX_TGID']), int_id(_target_status[_target['TS']]['TX_RFS']))
-                                            continue
-
-                                        # Is this a new call stream? 
-                                        if (_stream_id != self.STATUS[_slot]['RX_STREAM_ID']) or (_target_status[_target['TS']]['TX_RFS'] != _rf_src) or (_target_status[_target['TS']]['TX_TGID'] != _target['TGID']):
-                                             # Record the DST TGID and Stream ID
-                                             _target_status[_target['TS']]['TX_START'] = pkt_time
-                                             _target_status[_target['TS']]['TX_TGID'] = _target['TGID']
-                                             _target_status[_target['TS']]['TX_STREAM_ID'] = _stream_id
-                                             _target_status[_target['TS']]['TX_RFS'] = _rf_src
-                                             _target_status[_target['TS']]['TX_PEER'] = _peer_id
-                                             # Generate LCs (full and EMB) for the TX stream
-                                             dst_lc = self.STATUS[_slot]['RX_LC'][0:3] + _target['TGID'] + _rf_src
-                                             _target_status[_target['TS']]['TX_H_LC'] = bptc.encode_header_lc(dst_lc)
-                                             _target_status[_target['TS']]['TX_T_LC'] = bptc.encode_terminator_lc(dst_lc)
-                                             _target_status[_target['TS']]['TX_EMB_LC'] = bptc.encode_emblc(dst_lc)
-                                             logger.debug('(%s) Generating TX FULL and EMB LCs for HomeBrew destination: System: %s, TS: %s, TGID: %s', self._system, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
-                                             logger.info('(%s) Conference Bridge: %s, Call Bridged to HBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
-                                             if CONFIG['REPORTS']['REPORT']:
-                                                systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
-
-                                        # Set other values for the contention handler to test next time there is a frame to forward
-                                        _target_status[_target['TS']]['TX_TIME'] = pkt_time
-                                        _target_status[_target['TS']]['TX_TYPE'] = _dtype_vseq
-
-                                        # Handle any necessary re-writes for the destination
-                                        if _system['TS'] != _target['TS']:
-                                            _tmp_bits = _bits ^ 1 << 7
-                                        else:
-                                            _tmp_bits = _bits
-
-                                        # Assemble transmit HBP packet header
-                                        _tmp_data = _data[:8] + _target['TGID'] + _data[11:15] + chr(_tmp_bits) + _data[16:20]
-
-                                        # MUST TEST FOR NEW STREAM AND IF SO, RE-WRITE THE LC FOR THE TARGET
-                                        # MUST RE-WRITE DESTINATION TGID IF DIFFERENT
-                                        # if _dst_id != rule['DST_GROUP']:
-                                        dmrbits = bitarray(endian='big')
-                                        dmrbits.frombytes(dmrpkt)
-                                        # Create a voice header packet (FULL LC)
-                                        if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD:
-                                            dmrbits = _target_status[_target['TS']]['TX_H_LC'][0:98] + dmrbits[98:166] + _target_status[_target['TS']]['TX_H_LC'][98:197]
-                                        # Create a voice terminator packet (FULL LC)
-                                        elif _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
-                                            dmrbits = _target_status[_target['TS']]['TX_T_LC'][0:98] + dmrbits[98:166] + _target_status[_target['TS']]['TX_T_LC'][98:197]
-                                            if CONFIG['REPORTS']['REPORT']:
-                                                call_duration = pkt_time - _target_status[_target['TS']]['TX_START']
-                                                systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
-                                        # Create a Burst B-E packet (Embedded LC)
-                                        elif _dtype_vseq in [1,2,3,4]:
-                                            dmrbits = dmrbits[0:116] + _target_status[_target['TS']]['TX_EMB_LC'][_dtype_vseq] + dmrbits[148:264]
-                                        dmrpkt = dmrbits.tobytes()
-                                        _tmp_data = _tmp_data + dmrpkt + _data[53:55]
-
-                                    # Transmit the packet to the destination system
-                                    systems[_target['SYSTEM']].send_system(_tmp_data)
-                                    #logger.debug('(%s) Packet routed by bridge: %s to system: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
+                    self.STATUS[_slot].RX_LC = const.LC_OPT + _dst_id + _rf_src
+
+            _frames = {}
+            for _bridge, _system, _target in ROUTES.get((self._system, _dst_id, _slot), []):
+                _target_status = systems[_target['SYSTEM']].STATUS
+                _target_system = self._CONFIG['SYSTEMS'][_target['SYSTEM']]
+
+                if _target_system['MODE'] == 'OPENBRIDGE':
+                    # Is this a new call stream on the target?
+                    if (_stream_id not in _target_status):
+                        # This is a new call stream on the target
+                        _target_status[_stream_id] = StreamState(pkt_time, _rf_src, _dst_id)
+                        arm_stream_timer((_target['SYSTEM'], _stream_id), obp_stream_timeout, _target['SYSTEM'], _stream_id)
+                        # Generate LCs (full and EMB) for the TX stream
+                        dst_lc = ''.join([self.STATUS[_slot].RX_LC[0:3], _target['TGID'], _rf_src])
+                        _target_status[_stream_id].H_LC, _target_status[_stream_id].T_LC, _target_status[_stream_id].EMB_LC = encode_lc(dst_lc)
+
+                        logger.info('(%s) Conference Bridge: %s, Call Bridged to OBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], LogID(_target['TGID']))
+                        if CONFIG['REPORTS']['REPORT']:
+                            systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
+
+                    # Record the time of this packet so we can later identify a stale stream
+                    _target_status[_stream_id].LAST = pkt_time
+                    if CONFIG['REPORTS']['REPORT'] and _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
+                        call_duration = pkt_time - _target_status[_stream_id].START
+                        systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
+
+                    # Every target with the same TGID, TS and mode gets an identical frame, so only build it once
+                    _frame_key = (_target['TGID'], _target['TS'], 'OPENBRIDGE')
+                    _tmp_data = _frames.get(_frame_key)
+                    if _tmp_data is None:
+                        # Clear the TS bit -- all OpenBridge streams are effectively on TS1
+                        _tmp_data = rewrite_frame(_data, dmrpkt, _target['TGID'], _bits & ~(1 << 7), _frame_type, _dtype_vseq, _target_status[_stream_id].H_LC, _target_status[_stream_id].T_LC, _target_status[_stream_id].EMB_LC) #+ _data[53:55]
+                        _frames[_frame_key] = _tmp_data
+
+                else:
+                    _tgt_slot = _target_status[_target['TS']]
+
+                    # BEGIN STANDARD CONTENTION HANDLING
+                    #
+                    # The rules for each of the 4 "ifs" below are listed here for readability. The Frame To Send is:
+                    #   From a different group than last RX from this HBSystem, but it has been less than Group Hangtime
+                    #   From a different group than last TX to this HBSystem, but it has been less than Group Hangtime
+                    #   From the same group as the last RX from this HBSystem, but from a different subscriber, and it has been less than stream timeout
+                    #   From the same group as the last TX to this HBSystem, but from a different subscriber, and it has been less than stream timeout
+                    # The "continue" at the end of each means the next iteration of the for loop that tests for matching rules
+                    #
+                    if ((_target['TGID'] != _tgt_slot.RX_TGID) and ((pkt_time - _tgt_slot.RX_TIME) < _target_system['GROUP_HANGTIME'])):
+                        if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot].RX_STREAM_ID != _seq:
+                            logger.info('(%s) Call not routed to TGID %s, target active or in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, LogID(_target['TGID']), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.RX_TGID))
+                        continue
+                    if ((_target['TGID'] != _tgt_slot.TX_TGID) and ((pkt_time - _tgt_slot.TX_TIME) < _target_system['GROUP_HANGTIME'])):
+                        if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot].RX_STREAM_ID != _seq:
+                            logger.info('(%s) Call not routed to TGID%s, target in group hangtime: HBSystem: %s, TS: %s, TGID: %s', self._system, LogID(_target['TGID']), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.TX_TGID))
+                        continue
+                    if (_target['TGID'] == _tgt_slot.RX_TGID) and ((pkt_time - _tgt_slot.RX_TIME) < hb_const.STREAM_TO):
+                        if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot].RX_STREAM_ID != _seq:
+                            logger.info('(%s) Call not routed to TGID%s, matching call already active on target: HBSystem: %s, TS: %s, TGID: %s', self._system, LogID(_target['TGID']), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.RX_TGID))
+                        continue
+                    if (_target['TGID'] == _tgt_slot.TX_TGID) and (_rf_src != _tgt_slot.TX_RFS) and ((pkt_time - _tgt_slot.TX_TIME) < hb_const.STREAM_TO):
+                        if _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VHEAD and self.STATUS[_slot].RX_STREAM_ID != _seq:
+                            logger.info('(%s) Call not routed for subscriber %s, call route in progress on target: HBSystem: %s, TS: %s, TGID: %s, SUB: %s', self._system, LogID(_rf_src), _target['SYSTEM'], _target['TS'], LogID(_tgt_slot.TX_TGID), LogID(_tgt_slot.TX_RFS))
+                        continue
+
+                    # Is this a new call stream? 
+                    if (_stream_id != self.STATUS[_slot].RX_STREAM_ID) or (_tgt_slot.TX_RFS != _rf_src) or (_tgt_slot.TX_TGID != _target['TGID']):
+                         # Record the DST TGID and Stream ID
+                         _tgt_slot.TX_START = pkt_time
+                         _tgt_slot.TX_TGID = _target['TGID']
+                         _tgt_slot.TX_STREAM_ID = _stream_id
+                         arm_stream_timer((_target['SYSTEM'], _target['TS'], 'TX'), slot_timeout, _target['SYSTEM'], _target['TS'], 'TX')
+                         _tgt_slot.TX_RFS = _rf_src
+                         _tgt_slot.TX_PEER = _peer_id
+                         # Generate LCs (full and EMB) for the TX stream
+                         dst_lc = self.STATUS[_slot].RX_LC[0:3] + _target['TGID'] + _rf_src
+                         _tgt_slot.TX_H_LC, _tgt_slot.TX_T_LC, _tgt_slot.TX_EMB_LC = encode_lc(dst_lc)
+                         if log_levels.DEBUG:
+                             logger.debug('(%s) Generating TX FULL and EMB LCs for HomeBrew destination: System: %s, TS: %s, TGID: %s', self._system, _target['SYSTEM'], _target['TS'], LogID(_target['TGID']))
+                         logger.info('(%s) Conference Bridge: %s, Call Bridged to HBP System: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], LogID(_target['TGID']))
+                         if CONFIG['REPORTS']['REPORT']:
+                            systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,START,TX,{},{},{},{},{},{}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID'])))
+
+                    # Set other values for the contention handler to test next time there is a frame to forward
+                    _tgt_slot.TX_TIME = pkt_time
+                    _tgt_slot.TX_TYPE = _dtype_vseq
+
+                    if CONFIG['REPORTS']['REPORT'] and _frame_type == hb_const.HBPF_DATA_SYNC and _dtype_vseq == hb_const.HBPF_SLT_VTERM:
+                        call_duration = pkt_time - _tgt_slot.TX_START
+                        systems[_target['SYSTEM']]._report.send_bridgeEvent('GROUP VOICE,END,TX,{},{},{},{},{},{},{:.2f}'.format(_target['SYSTEM'], int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _target['TS'], int_id(_target['TGID']), call_duration))
+
+                    # Every target with the same TGID, TS and mode gets an identical frame, so only build it once
+                    _frame_key = (_target['TGID'], _target['TS'], 'HBP')
+                    _tmp_data = _frames.get(_frame_key)
+                    if _tmp_data is None:
+                        # Handle any necessary re-writes for the destination
+                        if _system['TS'] != _target['TS']:
+                            _tmp_bits = _bits ^ 1 << 7
+                        else:
+                            _tmp_bits = _bits
+                        _tmp_data = rewrite_frame(_data, dmrpkt, _target['TGID'], _tmp_bits, _frame_type, _dtype_vseq, _tgt_slot.TX_H_LC, _tgt_slot.TX_T_LC, _tgt_slot.TX_EMB_LC) + _data[53:55]
+                        _frames[_frame_key] = _tmp_data
+
+                # Transmit the packet to the destination system
+                systems[_target['SYSTEM']].send_system(_tmp_data)
+                #logger.debug('(%s) Packet routed by bridge: %s to system: %s TS: %s, TGID: %s', self._system, _bridge, _target['SYSTEM'], _target['TS'], int_id(_target['TGID']))
 
 
 
             # Final actions - Is this a voice terminator?
-            if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM) and (self.STATUS[_slot]['RX_TYPE'] != hb_const.HBPF_SLT_VTERM):
-                call_duration = pkt_time - self.STATUS[_slot]['RX_START']
-                logger.info('(%s) *CALL END*   STREAM ID: %s SUB: %s (%s) PEER: %s (%s) TGID %s (%s), TS %s, Duration: %s', \
-                        self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot, call_duration)
+            if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM) and (self.STATUS[_slot].RX_TYPE != hb_const.HBPF_SLT_VTERM):
+                call_duration = pkt_time - self.STATUS[_slot].RX_START
+                log_call(logger, 'END', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES, call_duration)
                 if CONFIG['REPORTS']['REPORT']:
                    self._report.send_bridgeEvent('GROUP VOICE,END,RX,{},{},{},{},{},{},{:.2f}'.format(self._system, int_id(_stream_id), int_id(_peer_id), int_id(_rf_src), _slot, int_id(_dst_id), call_duration))
 
@@ -669,6 +740,7 @@ class routerHBP(HBSYSTEM):
                                         _system['ACTIVE'] = True
                                         _system['TIMER'] = pkt_time + _system['TIMEOUT']
                                         logger.info('(%s) Bridge: %s, connection changed to state: %s', self._system, _bridge, _system['ACTIVE'])
+                                        update_routes(_bridge)
                                         # Cancel the timer if we've enabled an "OFF" type timeout
                                         if _system['TO_TYPE'] == 'OFF':
                                             _system['TIMER'] = pkt_time
@@ -685,6 +757,7 @@ class routerHBP(HBSYSTEM):
                                     if _system['ACTIVE'] == True:
                                         _system['ACTIVE'] = False
                                         logger.info('(%s) Bridge: %s, connection changed to state: %s', self._system, _bridge, _system['ACTIVE'])
+                                        update_routes(_bridge)
                                         # Cancel the timer if we've enabled an "ON" type timeout
                                         if _system['TO_TYPE'] == 'ON':
                                             _system['TIMER'] = pkt_time
@@ -694,32 +767,56 @@ class routerHBP(HBSYSTEM):
                                     _system['TIMER'] = pkt_time + _system['TIMEOUT']
                                     logger.info('(%s) Bridge: %s, timeout timer reset to: %s', self._system, _bridge, _system['TIMER'] - pkt_time)
                                 # Cancel the timer if we've enabled an "ON" type timeout
-                                if _system['ACTIVE'] == True and _system['TO_TYPE'] == 'ON' and _dst_group in _system['OFF']:
+                                if _system['ACTIVE'] == True and _system['TO_TYPE'] == 'ON' and _dst_id in _system['OFF']:
                                     _system['TIMER'] = pkt_time
                                     logger.info('(%s) Bridge: %s set to ON with and "OFF" timer rule: timeout timer cancelled', self._system, _bridge)
 
+                            # Reschedule the rule's timeout to match whatever we did above
+                            arm_rule_timer(_bridge, _system)
+
             #
             # END IN-BAND SIGNALLING
             #
 
 
             # Mark status variables for use later
-            self.STATUS[_slot]['RX_PEER']      = _peer_id
-            self.STATUS[_slot]['RX_SEQ']       = _seq
-            self.STATUS[_slot]['RX_RFS']       = _rf_src
-            self.STATUS[_slot]['RX_TYPE']      = _dtype_vseq
-            self.STATUS[_slot]['RX_TGID']      = _dst_id
-            self.STATUS[_slot]['RX_TIME']      = pkt_time
-            self.STATUS[_slot]['RX_STREAM_ID'] = _stream_id
+            self.STATUS[_slot].RX_PEER      = _peer_id
+            self.STATUS[_slot].RX_SEQ       = _seq
+            self.STATUS[_slot].RX_RFS       = _rf_src
+            self.STATUS[_slot].RX_TYPE      = _dtype_vseq
+            self.STATUS[_slot].RX_TGID      = _dst_id
+            self.STATUS[_slot].RX_TIME      = pkt_time
+            self.STATUS[_slot].RX_STREAM_ID = _stream_id
 
 #
 # Socket-based reporting section
 #
 class confbridgeReportFactory(reportFactory):
 
+    def __init__(self, config):
+        reportFactory.__init__(self, config)
+        self._bridge_ver = 0
+        self._bridge_shadow = {}
+
+    # Bridges are lists of rules, so snapshots and updates both index them by
+    # position: {bridge: {rule index: {fields}}}
     def send_bridge(self):
-        serialized = pickle.dumps(BRIDGES, protocol=pickle.HIGHEST_PROTOCOL)
-        self.send_clients(REPORT_OPCODES['BRIDGE_SND']+serialized)
+        if self.clients:
+            self.update_bridge()
+
+    def update_bridge(self):
+        _bridges = dict((_bridge, dict(enumerate(BRIDGES[_bridge]))) for _bridge in BRIDGES)
+        _delta = shadow_delta(self._bridge_shadow, _bridges)
+        if _delta:
+            self._bridge_ver += 1
+            if self.clients:
+                serialized = pickle.dumps((self._bridge_ver, _delta), protocol=pickle.HIGHEST_PROTOCOL)
+                self.send_clients(REPORT_OPCODES['BRIDGE_UPD']+serialized)
+
+    def send_bridge_snap(self, _client):
+        self.update_bridge()
+        serialized = pickle.dumps((self._bridge_ver, self._bridge_shadow), protocol=pickle.HIGHEST_PROTOCOL)
+        _client.sendString(REPORT_OPCODES['BRIDGE_SND']+serialized)
 
     def send_bridgeEvent(self, _data):
         self.send_clients(REPORT_OPCODES['BRDG_EVENT']+_data)
@@ -743,6 +840,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', action='store', dest='CONFIG_FILE', help='/full/path/to/config.file (usually hblink.cfg)')
     parser.add_argument('-l', '--logging', action='store', dest='LOG_LEVEL', help='Override config file logging level.')
+    parser.add_argument('-w', '--workers', action='store', dest='WORKERS', type=int, default=1, help='Split the systems across this many worker processes.')
+    parser.add_argument('--worker', action='store', dest='WORKER', type=int, help=argparse.SUPPRESS)
     cli_args = parser.parse_args()
 
     # Ensure we have a path for the config file, if one wasn't specified, then use the default (top of file)
@@ -771,11 +870,19 @@ if __name__ == '__main__':
         signal.signal(sig, sig_handler)
     
     # Create the name-number mapping dictionaries
-    peer_ids, subscriber_ids, talkgroup_ids = mk_aliases(CONFIG)
+    ALIASES = mk_aliases(CONFIG)
+    peer_ids, subscriber_ids, talkgroup_ids = ALIASES
 
     # Build the routing rules file
     BRIDGES = make_bridges('hb_confbridge_rules')
 
+    # Split the systems across worker processes -- from here on we are one of the
+    # workers. Every system in a bridge has to be in the same process.
+    if cli_args.WORKER is not None:
+        join_workers(CONFIG, cli_args.WORKER, cli_args.WORKERS, bridge_groups(BRIDGES))
+    elif cli_args.WORKERS > 1:
+        start_workers(CONFIG, cli_args.WORKERS, bridge_groups(BRIDGES))
+
     # INITIALIZE THE REPORTING LOOP
     report_server = config_reports(CONFIG, confbridgeReportFactory)
 
@@ -783,26 +890,22 @@ if __name__ == '__main__':
     logger.info('HBlink \'hb_confbridge.py\' -- SYSTEM STARTING...')
     for system in CONFIG['SYSTEMS']:
         if CONFIG['SYSTEMS'][system]['ENABLED']:
-            if CONFIG['SYSTEMS'][system]['MODE'] == 'OPENBRIDGE':
-                systems[system] = routerOBP(system, CONFIG, report_server)
-            else:
-                systems[system] = routerHBP(system, CONFIG, report_server)
-            reactor.listenUDP(CONFIG['SYSTEMS'][system]['PORT'], systems[system], interface=CONFIG['SYSTEMS'][system]['IP'])
-            logger.debug('%s instance created: %s, %s', CONFIG['SYSTEMS'][system]['MODE'], system, systems[system])
-
-    def loopingErrHandle(failure):
-        logger.error('STOPPING REACTOR TO AVOID MEMORY LEAK: Unhandled error in timed loop.\n %s', failure)
-        reactor.stop()
-
-    # Initialize the rule timer -- this if for user activated stuff
-    rule_timer_task = task.LoopingCall(rule_timer_loop)
-    rule_timer = rule_timer_task.start(60)
-    rule_timer.addErrback(loopingErrHandle)
-
-    # Initialize the stream trimmer
-    stream_trimmer_task = task.LoopingCall(stream_trimmer_loop)
-    stream_trimmer = stream_trimmer_task.start(5)
-    stream_trimmer.addErrback(loopingErrHandle)
-    
+            start_system(CONFIG, system, report_server, routerOBP, routerHBP)
+
+    # Build the routing index from the bridges
+    ROUTES = make_routes(BRIDGES)
+
+    # SIGHUP reloads hblink.cfg and the bridge rules in place
+    def reload_handler():
+        _new = reread_config(cli_args.CONFIG_FILE, cli_args.LOG_LEVEL)
+        if _new:
+            # Read the rules first, so systems new to both go on their bridges' worker
+            _bridges = reread_bridges(_new['SYSTEMS'])
+            reload_config(CONFIG, _new, report_server, routerOBP, routerHBP, bridge_groups(_bridges)).addCallback(reload_bridges, _bridges)
+    reload_on_hup(reload_handler)
+
+    # Start the rule timers -- this is for user activated stuff. Stream timers
+    # are armed as the streams start.
+    arm_rule_timers(BRIDGES)
 
     reactor.run()
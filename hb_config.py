@@ -31,6 +31,9 @@ import sys
 import hb_const as const
 
 from socket import gethostbyname 
+from array import array
+from bisect import bisect
+from dmr_utils.utils import int_id
 
 # Does anybody read this stuff? There's a PEP somewhere that says I should do this.
 __author__     = 'Cortney T. Buffington, N0MJS'
@@ -62,12 +65,16 @@ def process_acls(_config):
 
 # Create an access control list that is programatically useable from human readable:
 # ORIGINAL:  'DENY:1-5,3120101,3120124'
-# PROCESSED: (False, set([(1, 5), (3120124, 3120124), (3120101, 3120101)]))
+# PROCESSED: (False, set([3120124, 3120101]), array('L', [1]), array('L', [5]))
+#
+# Single IDs go in a set for a hash lookup. Ranges are sorted, merged and split
+# into arrays of starts and ends so acl_check can binary search them.
 def acl_build(_acl, _max):
     if not _acl:
-        return(True, set((const.ID_MIN, _max)))
+        return(True, set(), array('L', [const.ID_MIN]), array('L', [_max]))
 
-    acl = set()
+    ids = set()
+    ranges = []
     sections = _acl.split(':')
 
     if sections[0] == 'PERMIT':
@@ -77,24 +84,44 @@ def acl_build(_acl, _max):
 
     for entry in sections[1].split(','):
         if entry == 'ALL':
-            acl.add((const.ID_MIN, _max))
+            ranges.append((const.ID_MIN, _max))
             break
 
         elif '-' in entry:
             start,end = entry.split('-')
             start,end = int(start), int(end)
             if (const.ID_MIN <= start <= _max) or (const.ID_MIN <= end <= _max):
-                acl.add((start, end))
+                ranges.append((start, end))
             else:
-                sys.exit('ACL CREATION ERROR, VALUE OUT OF RANGE (} - {})IN RANGE-BASED ENTRY: {}'.format(const.ID_MIN, _max, entry))
+                sys.exit('ACL CREATION ERROR, VALUE OUT OF RANGE ({} - {}) IN RANGE-BASED ENTRY: {}'.format(const.ID_MIN, _max, entry))
         else:
             id = int(entry)
             if (const.ID_MIN <= id <= _max):
-                acl.add((id, id))
+                ids.add(id)
             else:
                  sys.exit('ACL CREATION ERROR, VALUE OUT OF RANGE ({} - {}) IN SINGLE ID ENTRY: {}'.format(const.ID_MIN, _max, entry))
 
-    return (action, acl)
+    starts = array('L')
+    ends = array('L')
+    for start, end in sorted(ranges):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+
+    return (action, ids, starts, ends)
+
+# Check a supplied ID against the ACL provided. Returns action (True|False) based
+# on matching and the action specified.
+def acl_check(_id, _acl):
+    id = int_id(_id)
+    if id in _acl[1]:
+        return _acl[0]
+    i = bisect(_acl[2], id)
+    if i and id <= _acl[3][i-1]:
+        return _acl[0]
+    return not _acl[0]
 
 def build_config(_config_file):
     config = ConfigParser.ConfigParser()
@@ -120,7 +147,8 @@ def build_config(_config_file):
                     'REG_ACL': config.get(section, 'REG_ACL'),
                     'SUB_ACL': config.get(section, 'SUB_ACL'),
                     'TG1_ACL': config.get(section, 'TGID_TS1_ACL'),
-                    'TG2_ACL': config.get(section, 'TGID_TS2_ACL')
+                    'TG2_ACL': config.get(section, 'TGID_TS2_ACL'),
+                    'BATCH_TX': config.getboolean(section, 'BATCH_TX') if config.has_option(section, 'BATCH_TX') else False
                 })
 
             elif section == 'REPORTS':
@@ -136,7 +164,8 @@ def build_config(_config_file):
                     'LOG_FILE': config.get(section, 'LOG_FILE'),
                     'LOG_HANDLERS': config.get(section, 'LOG_HANDLERS'),
                     'LOG_LEVEL': config.get(section, 'LOG_LEVEL'),
-                    'LOG_NAME': config.get(section, 'LOG_NAME')
+                    'LOG_NAME': config.get(section, 'LOG_NAME'),
+                    'LOG_QUEUE': config.getboolean(section, 'LOG_QUEUE') if config.has_option(section, 'LOG_QUEUE') else False
                 })
 
             elif section == 'ALIASES':
@@ -247,7 +276,6 @@ if __name__ == '__main__':
     import os
     import argparse
     from pprint import pprint
-    from dmr_utils.utils import int_id
     
     # Change the current directory to the location of the application
     os.chdir(os.path.dirname(os.path.realpath(sys.argv[0])))
@@ -265,11 +293,4 @@ if __name__ == '__main__':
     CONFIG = build_config(cli_args.CONFIG_FILE)
     pprint(CONFIG)
     
-    def acl_check(_id, _acl):
-        id = int_id(_id)
-        for entry in _acl[1]:
-            if entry[0] <= id <= entry[1]:
-                return _acl[0]
-        return not _acl[0]
-        
     print acl_check('\x00\x01\x37', CONFIG['GLOBAL']['TG1_ACL'])
@@ -41,6 +41,21 @@ ID_MAX = 16776415
 # Timers
 STREAM_TO = .360
 
+# Seconds without a frame before hb_confbridge times out a stream
+STREAM_IDLE_TO = 5
+
+# Number of per-stream ACL verdicts each system remembers
+ACL_CACHE_SIZE = 100
+
+# Number of encoded LCs hb_confbridge keeps for re-use across targets
+LC_CACHE_SIZE = 512
+
+# Number of ID aliases each alias store keeps in memory (see hb_alias)
+ALIAS_CACHE_SIZE = 1000
+
+# Seconds between checks for new alias files to download and index
+ALIAS_REFRESH_TIME = 3600
+
 # HomeBrew Protocol Frame Types
 HBPF_VOICE      = 0x0
 HBPF_VOICE_SYNC = 0x1
@@ -51,5 +66,37 @@ HBPF_SLT_VTERM  = 0x2
 # Higheset peer ID permitted by HBP
 PEER_MAX = 4294967295
 
+# Connection states of a peer logged in to an HBP master, in the order a login
+# progresses. PEER_CONN_NAMES are the names reporting clients are sent.
+PEER_RPTL_RECEIVED  = 0
+PEER_CHALLENGE_SENT = 1
+PEER_WAITING_CONFIG = 2
+PEER_CONNECTED      = 3
+PEER_CONN_NAMES = ('RPTL-RECEIVED', 'CHALLENGE_SENT', 'WAITING_CONFIG', 'YES')
+
+# Flood protection for HBP control traffic from sources that aren't logged in
+# to a master: packets per second and burst allowed from each source IP, and
+# from all of them together
+CTRL_RATE = 2
+CTRL_BURST = 10
+CTRL_GLOBAL_RATE = 100
+CTRL_GLOBAL_BURST = 200
+
+# Most peers a master lets sit part way through logging in, in all and from
+# any one source IP, and the seconds they have to finish before being dropped.
+# A new login past either limit pushes out the oldest one instead of being
+# refused, so a flood can't keep real repeaters from logging in.
+PENDING_MAX = 32
+PENDING_PER_IP = 4
+PENDING_TO = 10
+
+# Queued logging: most records waiting before any more are dropped, records
+# waiting before DEBUG is sampled (one kept in LOG_DEBUG_SAMPLE), and seconds
+# between writes
+LOG_QUEUE_SIZE = 10000
+LOG_QUEUE_PRESSURE = 1000
+LOG_DEBUG_SAMPLE = 10
+LOG_FLUSH_TIME = 0.1
+
 # Use if late entry
 LC_OPT = '\x00\x00\x20'
@@ -25,7 +25,15 @@ likely to never change.
 '''
 
 import logging
+import atexit
 from logging.config import dictConfig
+from os import getpid
+from threading import Thread, Event
+from collections import deque
+
+import hb_const as const
+from dmr_utils.utils import int_id
+from hb_alias import get_alias
 
 # Does anybody read this stuff? There's a PEP somewhere that says I should do this.
 __author__     = 'Cortney T. Buffington, N0MJS'
@@ -36,6 +44,173 @@ __maintainer__ = 'Cort Buffington, N0MJS'
 __email__      = 'n0mjs@me.com'
 
 
+# Which levels are enabled, worked out when logging is configured rather than
+# on every call -- on Python 2, Logger.isEnabledFor() walks the logger
+# hierarchy each time. Guard a log call whose arguments cost anything to make:
+#     if log_levels.DEBUG:
+#         logger.debug(...)
+# Everything is enabled until config_logging() has run.
+class LogLevels(object):
+    __slots__ = ('DEBUG', 'INFO', 'WARNING')
+
+    def __init__(self):
+        self.DEBUG = self.INFO = self.WARNING = True
+
+    def update(self, _logger):
+        self.DEBUG = _logger.isEnabledFor(logging.DEBUG)
+        self.INFO = _logger.isEnabledFor(logging.INFO)
+        self.WARNING = _logger.isEnabledFor(logging.WARNING)
+
+log_levels = LogLevels()
+
+# Logging arguments that are only worked out when a record is actually
+# written -- pass these instead of int_id() and get_alias() results, and a
+# filtered out (or shed) record costs nothing more than making the wrapper.
+# Only use them with %s.
+class LogID(object):
+    __slots__ = ('ID',)
+
+    def __init__(self, _id):
+        self.ID = _id
+
+    def __str__(self):
+        return str(int_id(self.ID))
+
+class LogAlias(object):
+    __slots__ = ('ID', 'ALIASES')
+
+    def __init__(self, _id, _aliases):
+        self.ID = _id
+        self.ALIASES = _aliases
+
+    def __str__(self):
+        return str(get_alias(self.ID, self.ALIASES))
+
+
+# Call start and end, logged the same way by every application. _aliases is
+# the (peer_ids, subscriber_ids, talkgroup_ids) from mk_aliases(), and _peer is
+# what to call the peer the call came from. Nothing is looked up unless INFO
+# is enabled, and then the line is always written, so the IDs and aliases are
+# worked out straight away rather than wrapped.
+CALL_EVENTS = {
+    'START': '(%s) *CALL START* STREAM ID: %s SUB: %s (%s) %s: %s (%s) TGID %s (%s), TS %s',
+    'END':   '(%s) *CALL END*   STREAM ID: %s SUB: %s (%s) %s: %s (%s) TGID %s (%s), TS %s, Duration: %s'
+}
+
+def log_call(_logger, _event, _system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, _aliases, _duration=None, _peer='PEER'):
+    if not log_levels.INFO:
+        return
+    _args = (_system, int_id(_stream_id), get_alias(_rf_src, _aliases[1]), int_id(_rf_src), _peer, get_alias(_peer_id, _aliases[0]), int_id(_peer_id), get_alias(_dst_id, _aliases[2]), int_id(_dst_id), _slot)
+    if _event == 'END':
+        _args += (_duration,)
+    _logger.info(CALL_EVENTS[_event], *_args)
+
+
+# Queued logging (LOG_QUEUE in the LOGGER stanza). The reactor thread only
+# appends records to a queue, and a listener thread wakes every
+# LOG_FLUSH_TIME to write whatever has collected in one go, so a slow disk or
+# syslog server never holds up the frames. (A deque rather than a Queue.Queue:
+# appending takes no lock and doesn't wake the listener for every record.)
+# A record's message is rendered before it's queued (alias lookups belong to
+# the reactor thread), but only once it has passed the level check and isn't
+# being shed: with more than LOG_QUEUE_PRESSURE records waiting only one DEBUG
+# record in LOG_DEBUG_SAMPLE is kept, and anything arriving with
+# LOG_QUEUE_SIZE waiting is dropped. The listener logs how many were lost.
+class QueueHandler(logging.Handler):
+    def __init__(self, _handlers):
+        logging.Handler.__init__(self)
+        self._handlers = _handlers
+        self.dropped = 0
+        self._reported = 0
+        self._sampled = 0
+        self.start()
+
+    # Threads don't survive a fork, so a worker process starts its own listener
+    def start(self):
+        self._pid = getpid()
+        self._queue = deque()
+        self._stopped = Event()
+        self._listener = Thread(target=self.listen, name='hb_log')
+        self._listener.daemon = True
+        self._listener.start()
+
+    # Write out anything still queued and stop the listener
+    def stop(self):
+        if self._pid == getpid() and self._listener.is_alive():
+            self._stopped.set()
+            self._listener.join(5)
+
+    def emit(self, record):
+        if self._pid != getpid():
+            self.start()
+        _waiting = len(self._queue)
+        if _waiting >= const.LOG_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        if record.levelno <= logging.DEBUG and _waiting > const.LOG_QUEUE_PRESSURE:
+            self._sampled += 1
+            if self._sampled % const.LOG_DEBUG_SAMPLE:
+                self.dropped += 1
+                return
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.append(record)
+        except Exception:
+            self.handleError(record)
+
+    def listen(self):
+        while not self._stopped.wait(const.LOG_FLUSH_TIME):
+            self.flush_queue()
+        self.flush_queue()
+
+    def flush_queue(self):
+        _batch = []
+        try:
+            while True:
+                _batch.append(self._queue.popleft())
+        except IndexError:
+            pass
+
+        _dropped = self.dropped
+        if _dropped != self._reported:
+            _batch.append(logging.makeLogRecord({'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'LOGGING: {} records dropped, the log can\'t keep up'.format(_dropped - self._reported)}))
+            self._reported = _dropped
+        if _batch:
+            for _handler in self._handlers:
+                emit_batch(_handler, _batch)
+
+# Hand a batch of records to a handler: stream and file handlers get one
+# write and one flush for the lot, anything else one record at a time
+def emit_batch(_handler, _records):
+    _records = [_record for _record in _records if _record.levelno >= _handler.level and _handler.filter(_record)]
+    if not _records:
+        return
+    if not isinstance(_handler, logging.StreamHandler) or getattr(_handler, 'stream', None) is None:
+        for _record in _records:
+            _handler.handle(_record)
+        return
+
+    _lines = []
+    for _record in _records:
+        try:
+            _lines.append(_handler.format(_record) + '\n')
+        except Exception:
+            _handler.handleError(_record)
+    _handler.acquire()
+    try:
+        _handler.stream.write(''.join(_lines))
+        _handler.flush()
+    except Exception:
+        _handler.handleError(_records[-1])
+    finally:
+        _handler.release()
+
+
 def config_logging(_logger):
     dictConfig({
         'version': 1,
@@ -90,4 +265,16 @@ def config_logging(_logger):
         },
     })
 
-    return logging.getLogger(_logger['LOG_NAME'])
\ No newline at end of file
+    # Swap the handlers for a queue feeding them from another thread
+    if _logger.get('LOG_QUEUE'):
+        _root = logging.getLogger()
+        _handlers = _root.handlers[:]
+        for _handler in _handlers:
+            _root.removeHandler(_handler)
+        _queue = QueueHandler(_handlers)
+        _root.addHandler(_queue)
+        atexit.register(_queue.stop)
+
+    _log = logging.getLogger(_logger['LOG_NAME'])
+    log_levels.update(_log)
+    return _log
\ No newline at end of file
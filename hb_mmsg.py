@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+###############################################################################
+#   Copyright (C) 2018 Cortney T. Buffington, N0MJS <n0mjs@me.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software Foundation,
+#   Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+###############################################################################
+
+'''
+Batched UDP transmit for HBlink systems (BATCH_TX in the GLOBAL stanza).
+Datagrams written during one pass of the reactor are queued per socket and
+handed to the kernel with a single sendmmsg(2) call when the reactor comes
+back around, instead of one sendto(2) each. Where sendmmsg isn't available
+(not Linux, not a 64 bit build, IPv6 sockets) systems keep writing each
+datagram to the transport as they always have.
+'''
+
+from __future__ import print_function
+
+from ctypes import CDLL, create_string_buffer, addressof, sizeof, c_void_p
+from ctypes.util import find_library
+from socket import AF_INET, inet_aton
+from struct import Struct, pack
+
+from twisted.internet import reactor
+
+# The module needs logging logging, but handlers, etc. are controlled by the parent
+import logging
+logger = logging.getLogger(__name__)
+
+__author__     = 'Cortney T. Buffington, N0MJS'
+__copyright__  = 'Copyright (c) 2018 Cortney T. Buffington, N0MJS and the K0USY Group'
+__license__    = 'GNU GPLv3'
+__maintainer__ = 'Cort Buffington, N0MJS'
+__email__      = 'n0mjs@me.com'
+
+# Most datagrams handed to the kernel in one call
+MAX_BATCH = 64
+
+# struct iovec and struct mmsghdr, as laid out on LP64 Linux
+IOVEC = Struct('PQ')
+MMSGHDR = Struct('PI4xPQPQi4xI4x')
+SOCKADDR_IN_LEN = 16
+
+try:
+    _sendmmsg = CDLL(find_library('c'), use_errno=True).sendmmsg
+    available = sizeof(c_void_p) == 8
+except (OSError, AttributeError, TypeError):
+    _sendmmsg = None
+    available = False
+
+
+# Use a BatchWriter's write() in place of transport.write() -- returns the
+# plain transport.write if batching isn't possible on this transport
+def batch_writer(_transport):
+    if available and getattr(_transport, 'addressFamily', AF_INET) == AF_INET:
+        return BatchWriter(_transport).write
+    return _transport.write
+
+
+# Done with a write function from batch_writer() -- for when a system is
+# stopped: anything still queued goes out before the socket closes, and the
+# writer is let go
+def close(_write):
+    _writer = getattr(_write, '__self__', None)
+    if isinstance(_writer, BatchWriter):
+        _writer.close()
+
+
+class BatchWriter(object):
+    def __init__(self, _transport):
+        self._transport = _transport
+        self._queue = []
+        self._flush = None
+        self._sockaddrs = {}
+        self._iov = create_string_buffer(IOVEC.size * MAX_BATCH)
+        self._hdr = create_string_buffer(MMSGHDR.size * MAX_BATCH)
+        self._iov_base = addressof(self._iov)
+        # Don't strand anything (de-registrations in particular) when the reactor
+        # stops. close() takes this off again, or every restart of a system would
+        # leave its old writer behind, to be flushed on a closed socket at shutdown.
+        self._shutdown = reactor.addSystemEventTrigger('before', 'shutdown', self.shutdown)
+
+    def write(self, _packet, _sockaddr):
+        self._queue.append((_packet, _sockaddr))
+        if self._flush is None:
+            self._flush = reactor.callLater(0, self.flush)
+
+    def close(self):
+        self.flush()
+        if self._shutdown is not None:
+            reactor.removeSystemEventTrigger(self._shutdown)
+            self._shutdown = None
+
+    # The reactor fires (and forgets) the trigger once, so there's nothing left to remove
+    def shutdown(self):
+        self._shutdown = None
+        self.flush()
+
+    # Packed struct sockaddr_in, cached per address
+    def sockaddr(self, _sockaddr):
+        _packed = self._sockaddrs.get(_sockaddr)
+        if _packed is None:
+            if len(self._sockaddrs) > 4096:
+                self._sockaddrs.clear()
+            _packed = self._sockaddrs[_sockaddr] = pack('=H', AF_INET) + pack('!H', _sockaddr[1]) + inet_aton(_sockaddr[0]) + '\x00' * 8
+        return _packed
+
+    def flush(self):
+        if self._flush and self._flush.active():
+            self._flush.cancel()
+        self._flush = None
+        if not self._queue:
+            return
+        _queue, self._queue = self._queue, []
+        _fd = self._transport.fileno()
+
+        for i in range(0, len(_queue), MAX_BATCH):
+            _batch = _queue[i:i+MAX_BATCH]
+            # Every datagram and address in the batch goes in one buffer each; the
+            # headers just point into them
+            _data = create_string_buffer(''.join([_packet for _packet, _sockaddr in _batch]))
+            _names = create_string_buffer(''.join([self.sockaddr(_sockaddr) for _packet, _sockaddr in _batch]))
+            _data_ptr = addressof(_data)
+            _names_ptr = addressof(_names)
+            for j, (_packet, _sockaddr) in enumerate(_batch):
+                IOVEC.pack_into(self._iov, j * IOVEC.size, _data_ptr, len(_packet))
+                MMSGHDR.pack_into(self._hdr, j * MMSGHDR.size, _names_ptr + j * SOCKADDR_IN_LEN, SOCKADDR_IN_LEN, self._iov_base + j * IOVEC.size, 1, 0, 0, 0, 0)
+                _data_ptr += len(_packet)
+
+            _sent = _sendmmsg(_fd, self._hdr, len(_batch), 0)
+            # Whatever the kernel didn't take goes the old way, and the transport
+            # deals with (and logs) the error the same as it always has
+            for _packet, _sockaddr in _batch[max(_sent, 0):]:
+                self._transport.write(_packet, _sockaddr)
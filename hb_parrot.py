@@ -26,7 +26,7 @@ from __future__ import print_function
 # Python modules we need
 import sys
 from bitarray import bitarray
-from time import time, sleep
+from time import time
 from importlib import import_module
 
 # Twisted is pretty important, so I keep it separate
@@ -35,11 +35,12 @@ from twisted.protocols.basic import NetstringReceiver
 from twisted.internet import reactor, task
 
 # Things we import from the main hblink module
-from hblink import HBSYSTEM, systems, hblink_handler, reportFactory, REPORT_OPCODES, config_reports, mk_aliases
-from dmr_utils.utils import hex_str_3, int_id, get_alias
+from hblink import HBSYSTEM, SlotState, systems, hblink_handler, reportFactory, REPORT_OPCODES, config_reports, mk_aliases
+from dmr_utils.utils import hex_str_3
 from dmr_utils import decode, bptc, const
 import hb_config
 import hb_log
+from hb_log import LogID, log_call
 import hb_const
 
 # The module needs logging logging, but handlers, etc. are controlled by the parent
@@ -59,99 +60,65 @@ __status__     = 'pre-alpha'
 # Module gobal varaibles
 
 class parrot(HBSYSTEM):
+    # What playback is scheduled on -- the reactor, or a task.Clock to test it
+    clock = reactor
 
     def __init__(self, _name, _config, _report):
         HBSYSTEM.__init__(self, _name, _config, _report)
 
         # Status information for the system, TS1 & TS2
         # 1 & 2 are "timeslot"
-        # In TX_EMB_LC, 2-5 are burst B-E
-        self.STATUS = {
-            1: {
-                'RX_START':     time(),
-                'RX_SEQ':       '\x00',
-                'RX_RFS':       '\x00',
-                'TX_RFS':       '\x00',
-                'RX_STREAM_ID': '\x00',
-                'TX_STREAM_ID': '\x00',
-                'RX_TGID':      '\x00\x00\x00',
-                'TX_TGID':      '\x00\x00\x00',
-                'RX_TIME':      time(),
-                'TX_TIME':      time(),
-                'RX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'RX_LC':        '\x00',
-                'TX_H_LC':      '\x00',
-                'TX_T_LC':      '\x00',
-                'TX_EMB_LC': {
-                    1: '\x00',
-                    2: '\x00',
-                    3: '\x00',
-                    4: '\x00',
-                }
-                },
-            2: {
-                'RX_START':     time(),
-                'RX_SEQ':       '\x00',
-                'RX_RFS':       '\x00',
-                'TX_RFS':       '\x00',
-                'RX_STREAM_ID': '\x00',
-                'TX_STREAM_ID': '\x00',
-                'RX_TGID':      '\x00\x00\x00',
-                'TX_TGID':      '\x00\x00\x00',
-                'RX_TIME':      time(),
-                'TX_TIME':      time(),
-                'RX_TYPE':      hb_const.HBPF_SLT_VTERM,
-                'RX_LC':        '\x00',
-                'TX_H_LC':      '\x00',
-                'TX_T_LC':      '\x00',
-                'TX_EMB_LC': {
-                    1: '\x00',
-                    2: '\x00',
-                    3: '\x00',
-                    4: '\x00',
-                }
-            }
-        }
-        self.CALL_DATA = []
+        self.STATUS = {1: SlotState(), 2: SlotState()}
+
+        # Frames being recorded, per timeslot
+        self.CALL_DATA = {1: [], 2: []}
+
+    # Play a recorded transmission back one frame every 60ms. This runs from the
+    # reactor, so other systems (and the other slot) keep going while it does.
+    def play_back(self, _call, _rf_src):
+        logger.info('(%s) Playing back transmission from subscriber: %s', self._system, LogID(_rf_src))
+        _frames = iter(_call)
+        def send_frame():
+            try:
+                self.send_system(next(_frames))
+            except StopIteration:
+                _playback.stop()
+        _playback = task.LoopingCall(send_frame)
+        _playback.clock = self.clock
+        _playback.start(0.06)
 
     def dmrd_received(self, _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data):
         pkt_time = time()
         dmrpkt = _data[20:53]
-        _bits = int_id(_data[15])
+        _bits = ord(_data[15])
         if _call_type == 'group':
 
             # Is this is a new call stream?
-            if (_stream_id != self.STATUS[_slot]['RX_STREAM_ID']):
-                self.STATUS['RX_START'] = pkt_time
-                logger.info('(%s) *CALL START* STREAM ID: %s SUB: %s (%s) REPEATER: %s (%s) TGID %s (%s), TS %s', \
-                                  self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot)
+            if (_stream_id != self.STATUS[_slot].RX_STREAM_ID):
+                self.STATUS[_slot].RX_START = pkt_time
+                log_call(logger, 'START', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES, _peer='REPEATER')
 
 
             # Final actions - Is this a voice terminator?
-            if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM) and (self.STATUS[_slot]['RX_TYPE'] != hb_const.HBPF_SLT_VTERM):
-                call_duration = pkt_time - self.STATUS['RX_START']
-                logger.info('(%s) *CALL END*   STREAM ID: %s SUB: %s (%s) REPEATER: %s (%s) TGID %s (%s), TS %s, Duration: %s', \
-                                  self._system, int_id(_stream_id), get_alias(_rf_src, subscriber_ids), int_id(_rf_src), get_alias(_peer_id, peer_ids), int_id(_peer_id), get_alias(_dst_id, talkgroup_ids), int_id(_dst_id), _slot, call_duration)
-                self.CALL_DATA.append(_data)
-                sleep(2)
-                logger.info('(%s) Playing back transmission from subscriber: %s', self._system, int_id(_rf_src))
-                for i in self.CALL_DATA:
-                    self.send_system(i)
-                    sleep(0.06)
-                self.CALL_DATA = []
+            if (_frame_type == hb_const.HBPF_DATA_SYNC) and (_dtype_vseq == hb_const.HBPF_SLT_VTERM) and (self.STATUS[_slot].RX_TYPE != hb_const.HBPF_SLT_VTERM):
+                call_duration = pkt_time - self.STATUS[_slot].RX_START
+                log_call(logger, 'END', self._system, _stream_id, _rf_src, _peer_id, _dst_id, _slot, ALIASES, call_duration, _peer='REPEATER')
+                self.CALL_DATA[_slot].append(_data)
+                self.clock.callLater(2, self.play_back, self.CALL_DATA[_slot], _rf_src)
+                self.CALL_DATA[_slot] = []
 
             else:
-                if not self.CALL_DATA:
-                    logger.info('(%s) Receiving transmission to be played back from subscriber: %s', self._system, int_id(_rf_src))
-                self.CALL_DATA.append(_data)
+                if not self.CALL_DATA[_slot]:
+                    logger.info('(%s) Receiving transmission to be played back from subscriber: %s', self._system, LogID(_rf_src))
+                self.CALL_DATA[_slot].append(_data)
 
 
             # Mark status variables for use later
-            self.STATUS[_slot]['RX_RFS']       = _rf_src
-            self.STATUS[_slot]['RX_TYPE']      = _dtype_vseq
-            self.STATUS[_slot]['RX_TGID']      = _dst_id
-            self.STATUS[_slot]['RX_TIME']      = pkt_time
-            self.STATUS[_slot]['RX_STREAM_ID'] = _stream_id
+            self.STATUS[_slot].RX_RFS       = _rf_src
+            self.STATUS[_slot].RX_TYPE      = _dtype_vseq
+            self.STATUS[_slot].RX_TGID      = _dst_id
+            self.STATUS[_slot].RX_TIME      = pkt_time
+            self.STATUS[_slot].RX_STREAM_ID = _stream_id
 
 
 #************************************************
@@ -164,7 +131,6 @@ if __name__ == '__main__':
     import sys
     import os
     import signal
-    from dmr_utils.utils import try_download, mk_id_dict
     
     # Change the current directory to the location of the application
     os.chdir(os.path.dirname(os.path.realpath(sys.argv[0])))
@@ -200,18 +166,8 @@ if __name__ == '__main__':
     for sig in [signal.SIGTERM, signal.SIGINT]:
         signal.signal(sig, sig_handler)
     
-    # ID ALIAS CREATION
-    # Download
-    if CONFIG['ALIASES']['TRY_DOWNLOAD'] == True:
-        # Try updating peer aliases file
-        result = try_download(CONFIG['ALIASES']['PATH'], CONFIG['ALIASES']['PEER_FILE'], CONFIG['ALIASES']['PEER_URL'], CONFIG['ALIASES']['STALE_TIME'])
-        logger.info(result)
-        # Try updating subscriber aliases file
-        result = try_download(CONFIG['ALIASES']['PATH'], CONFIG['ALIASES']['SUBSCRIBER_FILE'], CONFIG['ALIASES']['SUBSCRIBER_URL'], CONFIG['ALIASES']['STALE_TIME'])
-        logger.info(result)
-        
-    # Create the name-number mapping dictionaries
-    peer_ids, subscriber_ids, talkgroup_ids = mk_aliases(CONFIG)
+    # Create the name-number mapping dictionaries (downloaded and refreshed in the background)
+    ALIASES = mk_aliases(CONFIG)
         
     # INITIALIZE THE REPORTING LOOP
     report_server = config_reports(CONFIG, reportFactory)    
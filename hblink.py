@@ -36,20 +36,33 @@ from random import randint
 from hashlib import sha256, sha1
 from hmac import new as hmac_new, compare_digest
 from time import time
+from json import loads as jloads
 from bitstring import BitArray
 from importlib import import_module
-from collections import deque
+from collections import OrderedDict
+from copy import deepcopy
+from struct import Struct
+from errno import EINTR
+import os
+import sys
+import signal
 
 # Twisted is pretty important, so I keep it separate
 from twisted.internet.protocol import DatagramProtocol, Factory, Protocol
 from twisted.protocols.basic import NetstringReceiver
-from twisted.internet import reactor, task
+from twisted.internet import reactor, task, defer
+from twisted.internet.utils import getProcessOutputAndValue
 
 # Other files we pull from -- this is mostly for readability and segmentation
 import hb_log
+from hb_log import LogID, log_levels
 import hb_config
 import hb_const as const
-from dmr_utils.utils import int_id, hex_str_4, try_download, mk_id_dict
+import hb_mmsg
+from hb_config import acl_check
+from dmr_utils.utils import int_id, hex_str_4
+import hb_alias
+from hb_alias import AliasStore
 
 # Imports for the reporting server
 import cPickle as pickle
@@ -70,6 +83,9 @@ __email__      = 'n0mjs@me.com'
 # Global variables used whether we are a module or __main__
 systems = {}
 
+# Counters for the reporting server -- applications add their own entries
+stats = {}
+
 # Timed loop used for reporting HBP status
 #
 # REPORT BASED ON THE TYPE SELECTED IN THE MAIN CONFIG FILE
@@ -78,6 +94,7 @@ def config_reports(_config, _factory):
         def reporting_loop(_logger, _server):
             _logger.debug('Periodic reporting loop started')
             _server.send_config()
+            _server.send_stats()
 
         logger.info('HBlink TCP reporting server configured')
 
@@ -91,26 +108,294 @@ def config_reports(_config, _factory):
     return report_server
 
 
+# Run a new stream through the global and system ACLs. The verdict is stored in
+# the system's per-stream cache so the rest of the frames in the call skip the
+# ACLs entirely. Returns (True, None) if permitted or (False, reason) if not.
+def acl_stream(_cache, _CONFIG, _config, _stream_id, _rf_src, _dst_id, _slot):
+    _tg_acl = 'TG1_ACL' if _slot == 1 else 'TG2_ACL'
+    if _CONFIG['GLOBAL']['USE_ACL'] and not acl_check(_rf_src, _CONFIG['GLOBAL']['SUB_ACL']):
+        _acl = (False, 'FROM SUBSCRIBER {} BY GLOBAL ACL'.format(int_id(_rf_src)))
+    elif _CONFIG['GLOBAL']['USE_ACL'] and not acl_check(_dst_id, _CONFIG['GLOBAL'][_tg_acl]):
+        _acl = (False, 'ON TGID {} BY GLOBAL TS{} ACL'.format(int_id(_dst_id), _slot))
+    elif _config['USE_ACL'] and not acl_check(_rf_src, _config['SUB_ACL']):
+        _acl = (False, 'FROM SUBSCRIBER {} BY SYSTEM ACL'.format(int_id(_rf_src)))
+    elif _config['USE_ACL'] and not acl_check(_dst_id, _config[_tg_acl]):
+        _acl = (False, 'ON TGID {} BY SYSTEM TS{} ACL'.format(int_id(_dst_id), _slot))
+    else:
+        _acl = (True, None)
+
+    _cache[_stream_id] = _acl
+    if len(_cache) > const.ACL_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return _acl
+
 # Shut ourselves down gracefully by disconnecting from the masters and peers.
 def hblink_handler(_signal, _frame):
     for system in systems:
         logger.info('SHUTDOWN: DE-REGISTER SYSTEM: %s', system)
         systems[system].dereg()
 
-# Check a supplied ID against the ACL provided. Returns action (True|False) based
-# on matching and the action specified.
-def acl_check(_id, _acl):
-    id = int_id(_id)
-    for entry in _acl[1]:
-        if entry[0] <= id <= entry[1]:
-            return _acl[0]
-    return not _acl[0]
+
+#************************************************
+#    WORKER PROCESSES
+#************************************************
+
+# Join _systems into the sets that have to share a process. Frames only ever
+# move between systems within one process, so systems that share one of
+# _groups (i.e. are joined by a conference bridge) go together. Largest first,
+# and in the same order in every process.
+def join_systems(_systems, _groups=()):
+    _sets = []
+    for _group in list(_groups) + [[_system] for _system in _systems]:
+        _group = set(_group) & set(_systems)
+        for _set in [_set for _set in _sets if _set & _group]:
+            _group |= _set
+            _sets.remove(_set)
+        if _group:
+            _sets.append(_group)
+    return sorted(_sets, key=lambda _set: (-len(_set), sorted(_set)))
+
+# Split _systems into (at most) _workers shards, each set from join_systems()
+# on the least loaded shard.
+def shard_systems(_systems, _workers, _groups=()):
+    _shards = [set() for _ in range(_workers)]
+    for _set in join_systems(_systems, _groups):
+        min(_shards, key=len).update(_set)
+    return [_shard for _shard in _shards if _shard]
+
+# Fit the systems of a reloaded configuration into the running _shards. Systems
+# already running stay where they are; a new one goes to the worker running
+# anything it is joined to, or else to the least loaded one. Every worker works
+# this out from the same files, so they all agree on where everything is.
+def place_systems(_shards, _systems, _groups=()):
+    _shards = [_shard & set(_systems) for _shard in _shards]
+    for _set in join_systems(_systems, _groups):
+        _owners = [_shard for _shard in _shards if _shard & _set]
+        if len(_owners) > 1:
+            logger.warning('RELOAD: bridged systems are split across workers until a restart: %s', ', '.join(sorted(_set)))
+        (_owners[0] if _owners else min(_shards, key=len)).update(_set - set().union(*_shards))
+    return _shards
+
+# Cut a configuration down to worker _index's share: it disables the systems
+# it doesn't own and runs its reporting server on REPORT_PORT + its index.
+# Applied once when the worker starts and again to every reloaded configuration.
+def worker_config(_config, _index, _shards):
+    for _system in _config['SYSTEMS']:
+        if _system not in _shards[_index]:
+            _config['SYSTEMS'][_system]['ENABLED'] = False
+    _config['REPORTS']['REPORT_PORT'] += _index
+    # One worker keeps the alias files up to date, the rest just pick up its indexes
+    _config['ALIASES']['BUILD_INDEX'] = _index == 0
+    _config['WORKER'] = (_index, _shards)
+
+# Start a worker process per shard. A worker runs this program again from the
+# start, with --worker <index>: the reactor already exists here, and a forked
+# copy would share its epoll set with every other worker's, so each of them
+# would be woken for every packet. The supervisor never returns: it passes
+# SIGTERM and SIGHUP on to the workers and exits once they all have.
+def start_workers(_config, _workers, _groups=()):
+    _enabled = [_system for _system in _config['SYSTEMS'] if _config['SYSTEMS'][_system]['ENABLED']]
+    _shards = shard_systems(_enabled, _workers, _groups)
+    if len(_shards) < _workers:
+        logger.warning('SUPERVISOR: %s workers requested, but the systems only split %s ways', _workers, len(_shards))
+
+    _pids = {}
+    for _index, _shard in enumerate(_shards):
+        _pid = os.fork()
+        if _pid == 0:
+            try:
+                os.execv(sys.executable, [sys.executable, os.path.realpath(sys.argv[0])] + sys.argv[1:] + ['--worker', str(_index)])
+            finally:
+                os._exit(1)
+        _pids[_pid] = _index
+
+    def sig_handler(_signal, _frame):
+        logger.info('SUPERVISOR: passing signal %s on to the workers', _signal)
+        for _pid in _pids:
+            os.kill(_pid, _signal)
+
+    # SIGINT from a terminal already goes to the whole process group
+    signal.signal(signal.SIGTERM, sig_handler)
+    signal.signal(signal.SIGHUP, sig_handler)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while _pids:
+        try:
+            _pid, _status = os.wait()
+        except OSError as e:
+            if e.errno == EINTR:
+                continue
+            raise
+        logger.info('SUPERVISOR: worker %s (PID %s) exited with status %s', _pids.pop(_pid), _pid, _status)
+    sys.exit(0)
+
+# The worker side of start_workers(): split the systems the same way and take
+# up shard _index
+def join_workers(_config, _index, _workers, _groups=()):
+    _enabled = [_system for _system in _config['SYSTEMS'] if _config['SYSTEMS'][_system]['ENABLED']]
+    _shards = shard_systems(_enabled, _workers, _groups)
+    worker_config(_config, _index, _shards)
+    logger.info('WORKER %s: started with PID %s, systems: %s', _index, os.getpid(), ', '.join(sorted(_shards[_index])))
+
+
+#************************************************
+#    CALL STATE CLASSES
+#************************************************
+
+# Status information for one timeslot of an HBP system. These are touched by
+# every frame, so they are slotted objects rather than dicts of dicts.
+# In TX_EMB_LC, 1-4 are burst B-E
+class SlotState(object):
+    __slots__ = ('RX_START', 'TX_START', 'RX_SEQ', 'RX_RFS', 'TX_RFS', 'RX_PEER', 'TX_PEER',
+                 'RX_STREAM_ID', 'TX_STREAM_ID', 'RX_TGID', 'TX_TGID', 'RX_TIME', 'TX_TIME',
+                 'RX_TYPE', 'TX_TYPE', 'RX_LC', 'TX_H_LC', 'TX_T_LC', 'TX_EMB_LC')
+
+    def __init__(self):
+        _now = time()
+        self.RX_START     = _now
+        self.TX_START     = _now
+        self.RX_SEQ       = '\x00'
+        self.RX_RFS       = '\x00'
+        self.TX_RFS       = '\x00'
+        self.RX_PEER      = '\x00'
+        self.TX_PEER      = '\x00'
+        self.RX_STREAM_ID = '\x00'
+        self.TX_STREAM_ID = '\x00'
+        self.RX_TGID      = '\x00\x00\x00'
+        self.TX_TGID      = '\x00\x00\x00'
+        self.RX_TIME      = _now
+        self.TX_TIME      = _now
+        self.RX_TYPE      = const.HBPF_SLT_VTERM
+        self.TX_TYPE      = const.HBPF_SLT_VTERM
+        self.RX_LC        = '\x00'
+        self.TX_H_LC      = '\x00'
+        self.TX_T_LC      = '\x00'
+        self.TX_EMB_LC    = {1: '\x00', 2: '\x00', 3: '\x00', 4: '\x00'}
+
+# Status information for one OpenBridge call stream, keyed by stream ID. LC is
+# only used on the source, H_LC/T_LC/EMB_LC only on the targets.
+class StreamState(object):
+    __slots__ = ('START', 'LAST', 'CONTENTION', 'RFS', 'TGID', 'LC', 'H_LC', 'T_LC', 'EMB_LC')
+
+    def __init__(self, _start, _rf_src, _tgid):
+        self.START      = _start
+        self.LAST       = _start
+        self.CONTENTION = False
+        self.RFS        = _rf_src
+        self.TGID       = _tgid
+        self.LC         = None
+        self.H_LC       = None
+        self.T_LC       = None
+        self.EMB_LC     = None
+
+# One peer logged in to an HBP master, keyed by peer ID in the system's PEERS.
+# A busy master can hold thousands of these, so they are slotted objects rather
+# than dicts. CONNECTION is one of the hb_const.PEER_* states; as_dict() is
+# what the reporting clients see.
+class Peer(object):
+    __slots__ = ('PEER_ID', 'CONNECTION', 'CONNECTED', 'PINGS_RECEIVED', 'LAST_PING', 'SOCKADDR', 'IP', 'PORT',
+                 'SALT', 'RADIO_ID', 'CALLSIGN', 'RX_FREQ', 'TX_FREQ', 'TX_POWER', 'COLORCODE', 'LATITUDE',
+                 'LONGITUDE', 'HEIGHT', 'LOCATION', 'DESCRIPTION', 'SLOTS', 'URL', 'SOFTWARE_ID', 'PACKAGE_ID')
+
+    def __init__(self, _peer_id, _sockaddr):
+        _now = time()
+        self.PEER_ID        = _peer_id
+        self.CONNECTION     = const.PEER_RPTL_RECEIVED
+        self.CONNECTED      = _now
+        self.PINGS_RECEIVED = 0
+        self.LAST_PING      = _now
+        self.SOCKADDR       = _sockaddr
+        self.IP             = _sockaddr[0]
+        self.PORT           = _sockaddr[1]
+        self.SALT           = randint(0,0xFFFFFFFF)
+        self.RADIO_ID       = str(int(ahex(_peer_id), 16))
+        self.CALLSIGN       = ''
+        self.RX_FREQ        = ''
+        self.TX_FREQ        = ''
+        self.TX_POWER       = ''
+        self.COLORCODE      = ''
+        self.LATITUDE       = ''
+        self.LONGITUDE      = ''
+        self.HEIGHT         = ''
+        self.LOCATION       = ''
+        self.DESCRIPTION    = ''
+        self.SLOTS          = ''
+        self.URL            = ''
+        self.SOFTWARE_ID    = ''
+        self.PACKAGE_ID     = ''
+
+    def as_dict(self):
+        _dict = dict((_key, getattr(self, _key)) for _key in self.__slots__[1:])
+        _dict['CONNECTION'] = const.PEER_CONN_NAMES[self.CONNECTION]
+        return _dict
+
+# Token bucket used to rate limit control traffic: RATE tokens per second, up
+# to BURST saved up. take() spends one if there is one.
+class TokenBucket(object):
+    __slots__ = ('RATE', 'BURST', 'TOKENS', 'LAST')
+
+    def __init__(self, _rate, _burst, _now):
+        self.RATE   = _rate
+        self.BURST  = _burst
+        self.TOKENS = _burst
+        self.LAST   = _now
+
+    def take(self, _now):
+        self.TOKENS = min(self.BURST, self.TOKENS + (_now - self.LAST) * self.RATE)
+        self.LAST = _now
+        if self.TOKENS < 1:
+            return False
+        self.TOKENS -= 1
+        return True
+
+    # True once the bucket would have refilled -- it can be forgotten
+    def idle(self, _now):
+        return self.TOKENS + (_now - self.LAST) * self.RATE >= self.BURST
+
+
+#************************************************
+#     DMRD HEADER DECODING
+#************************************************
+
+# seq, rf_src, dst_id, peer_id, bits, stream_id
+DMRD_HEADER = Struct('4xc3s3s4sB4s')
+
+# Everything that follows from the bits byte (byte 15), indexed by its value:
+# (slot, call type, frame type, dtype/vseq). dtype/vseq is for data,
+# 1=voice header, 2=voice terminator; for voice, 0=burst A ... 5=burst F
+def dmrd_bits(_bits):
+    _slot = 2 if (_bits & 0x80) else 1
+    if _bits & 0x40:
+        _call_type = 'unit'
+    elif (_bits & 0x23) == 0x23:
+        _call_type = 'vcsbk'
+    else:
+        _call_type = 'group'
+    return (_slot, _call_type, (_bits & 0x30) >> 4, _bits & 0xF)
+
+DMRD_BITS = tuple([dmrd_bits(_bits) for _bits in range(256)])
+
+# Decode a DMRD header in one pass. Returns the fields in the order
+# dmrd_received() takes them: peer_id, rf_src, dst_id, seq, slot, call_type,
+# frame_type, dtype_vseq, stream_id. _data must be at least DMRD_HEADER.size
+# bytes -- callers drop anything shorter first.
+def decode_dmrd(_data):
+    _seq, _rf_src, _dst_id, _peer_id, _bits, _stream_id = DMRD_HEADER.unpack_from(_data)
+    _slot, _call_type, _frame_type, _dtype_vseq = DMRD_BITS[_bits]
+    return _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id
 
 
 #************************************************
 #    OPENBRIDGE CLASS
 #************************************************
 
+# Write function for a system's socket: batched through sendmmsg if asked for
+# and supported, otherwise straight to the transport
+def system_writer(_config, _transport):
+    if _config['GLOBAL']['BATCH_TX']:
+        return hb_mmsg.batch_writer(_transport)
+    return _transport.write
+
 class OPENBRIDGE(DatagramProtocol):
     def __init__(self, _name, _config, _report):
         # Define a few shortcuts to make the rest of the class more readable
@@ -118,16 +403,42 @@ class OPENBRIDGE(DatagramProtocol):
         self._system = _name
         self._report = _report
         self._config = self._CONFIG['SYSTEMS'][self._system]
-        self._laststrid = deque([], 20)
+        self._acl_cache = OrderedDict()
+        # HMAC keyed with our passphrase -- copy() it for each frame rather than
+        # working the key into a new one every time
+        self._hmac = hmac_new(self._config['PASSPHRASE'], digestmod=sha1)
+
+    def startProtocol(self):
+        self._write = system_writer(self._CONFIG, self.transport)
+
+    # Called before the socket closes, so anything queued still goes out
+    def stopProtocol(self):
+        hb_mmsg.close(self._write)
 
     def dereg(self):
         logger.info('(%s) is mode OPENBRIDGE. No De-Registration required, continuing shutdown', self._system)
 
+    # Forget cached ACL verdicts -- must be called whenever the ACLs are rebuilt
+    def flush_acl_cache(self):
+        self._acl_cache.clear()
+
+    # Our configuration was changed in place by a reload
+    def config_updated(self):
+        self.flush_acl_cache()
+        self._hmac = hmac_new(self._config['PASSPHRASE'], digestmod=sha1)
+
+    # Called by stop_system() once the system is out of systems -- applications
+    # let go of anything else they hold for it here
+    def stopped(self):
+        pass
+
     def send_system(self, _packet):
         if _packet[:4] == 'DMRD':
             _packet = _packet[:11] + self._config['NETWORK_ID'] + _packet[15:]
-            _packet += hmac_new(self._config['PASSPHRASE'],_packet,sha1).digest()
-            self.transport.write(_packet, (self._config['TARGET_IP'], self._config['TARGET_PORT']))
+            _hmac = self._hmac.copy()
+            _hmac.update(_packet)
+            _packet += _hmac.digest()
+            self._write(_packet, (self._config['TARGET_IP'], self._config['TARGET_PORT']))
             # KEEP THE FOLLOWING COMMENTED OUT UNLESS YOU'RE DEBUGGING DEEPLY!!!!
             # logger.debug('(%s) TX Packet to OpenBridge %s:%s -- %s', self._system, self._config['TARGET_IP'], self._config['TARGET_PORT'], ahex(_packet))
         else:
@@ -141,58 +452,39 @@ class OPENBRIDGE(DatagramProtocol):
         # Keep This Line Commented Unless HEAVILY Debugging!
         #logger.debug('(%s) RX packet from %s -- %s', self._system, _sockaddr, ahex(_packet))
 
+        # Only our target can send to us -- check that before spending anything on crypto
+        if _sockaddr != self._config['TARGET_SOCK']:
+            if log_levels.DEBUG:
+                logger.debug('(%s) OpenBridge packet from unexpected source %s:%s discarded', self._system, _sockaddr[0], _sockaddr[1])
+            return
+
         if _packet[:4] == 'DMRD':    # DMRData -- encapsulated DMR data frame
+            if len(_packet) < DMRD_HEADER.size:
+                if log_levels.DEBUG:
+                    logger.debug('(%s) Runt DMRD packet (%s bytes) from %s:%s discarded', self._system, len(_packet), _sockaddr[0], _sockaddr[1])
+                return
             _data = _packet[:53]
             _hash = _packet[53:]
-            _ckhs = hmac_new(self._config['PASSPHRASE'],_data,sha1).digest()
+            _hmac = self._hmac.copy()
+            _hmac.update(_data)
 
-            if compare_digest(_hash, _ckhs) and _sockaddr == self._config['TARGET_SOCK']:
-                _peer_id = _data[11:15]
-                _seq = _data[4]
-                _rf_src = _data[5:8]
-                _dst_id = _data[8:11]
-                _bits = int_id(_data[15])
-                _slot = 2 if (_bits & 0x80) else 1
-                #_call_type = 'unit' if (_bits & 0x40) else 'group'
-                if _bits & 0x40:
-                    _call_type = 'unit'
-                elif (_bits & 0x23) == 0x23:
-                    _call_type = 'vcsbk'
-                else:
-                    _call_type = 'group'
-                _frame_type = (_bits & 0x30) >> 4
-                _dtype_vseq = (_bits & 0xF) # data, 1=voice header, 2=voice terminator; voice, 0=burst A ... 5=burst F
-                _stream_id = _data[16:20]
+            if compare_digest(_hash, _hmac.digest()):
+                _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id = decode_dmrd(_data)
                 #logger.debug('(%s) DMRD - Seqence: %s, RF Source: %s, Destination ID: %s', self._system, int_id(_seq), int_id(_rf_src), int_id(_dst_id))
 
                 # Sanity check for OpenBridge -- all calls must be on Slot 1
                 if _slot != 1:
-                    logger.error('(%s) OpenBridge packet discarded because it was not received on slot 1. SID: %s, TGID %s', self._system, int_id(_rf_src), int_id(_dst_id))
+                    logger.error('(%s) OpenBridge packet discarded because it was not received on slot 1. SID: %s, TGID %s', self._system, LogID(_rf_src), LogID(_dst_id))
                     return
 
-                # ACL Processing
-                if self._CONFIG['GLOBAL']['USE_ACL']:
-                    if not acl_check(_rf_src, self._CONFIG['GLOBAL']['SUB_ACL']):
-                        if _stream_id not in self._laststrid:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s FROM SUBSCRIBER %s BY GLOBAL ACL', self._system, int_id(_stream_id), int_id(_rf_src))
-                            self._laststrid.append(_stream_id)
-                        return
-                    if _slot == 1 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG1_ACL']):
-                        if _stream_id not in self._laststrid:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY GLOBAL TS1 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                            self._laststrid.append(_stream_id)
-                        return
-                if self._config['USE_ACL']:
-                    if not acl_check(_rf_src, self._config['SUB_ACL']):
-                        if _stream_id not in self._laststrid:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s FROM SUBSCRIBER %s BY SYSTEM ACL', self._system, int_id(_stream_id), int_id(_rf_src))
-                            self._laststrid.append(_stream_id)
-                        return
-                    if not acl_check(_dst_id, self._config['TG1_ACL']):
-                        if _stream_id not in self._laststrid:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY SYSTEM ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                            self._laststrid.append(_stream_id)
-                        return
+                # ACL Processing -- evaluated on the first frame of a stream, then cached
+                _acl = self._acl_cache.get(_stream_id)
+                if _acl is None:
+                    _acl = acl_stream(self._acl_cache, self._CONFIG, self._config, _stream_id, _rf_src, _dst_id, _slot)
+                    if not _acl[0]:
+                        logger.info('(%s) CALL DROPPED WITH STREAM ID %s %s', self._system, LogID(_stream_id), _acl[1])
+                if not _acl[0]:
+                    return
 
                 # Userland actions -- typically this is the function you subclass for an application
                 self.dmrd_received(_peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data)
@@ -211,12 +503,28 @@ class HBSYSTEM(DatagramProtocol):
         self._system = _name
         self._report = _report
         self._config = self._CONFIG['SYSTEMS'][self._system]
-        self._laststrid1 = ''
-        self._laststrid2 = ''
+        self._acl_cache = OrderedDict()
 
         # Define shortcuts and generic function names based on the type of system we are
         if self._config['MODE'] == 'MASTER':
             self._peers = self._CONFIG['SYSTEMS'][self._system]['PEERS']
+            self._peer_list = []
+            # Peers in the order they were last heard from (value is LAST_PING), so
+            # the maintenance loop only has to look at the front for timeouts
+            self._peer_pings = OrderedDict()
+            # Peers part way through logging in, in the order they sent RPTL
+            self._pending = OrderedDict()
+            # Control traffic rate limits, per source IP and overall
+            self._ctrl_buckets = {}
+            self._ctrl_global = TokenBucket(const.CTRL_GLOBAL_RATE, const.CTRL_GLOBAL_BURST, time())
+            self._peer_stats = stats.setdefault('PEERS', {}).setdefault(self._system, {
+                'ACTIVE': 0,
+                'REMOVED': 0,
+                'CTRL_DROPPED': 0,
+                'PENDING_EVICTED': 0,
+                'PENDING_EXPIRED': 0
+            })
+            self._drops_logged = (0, 0)
             self.send_system = self.send_peers
             self.maintenance_loop = self.master_maintenance_loop
             self.datagramReceived = self.master_datagramReceived
@@ -230,23 +538,52 @@ class HBSYSTEM(DatagramProtocol):
             self.dereg = self.peer_dereg
 
     def startProtocol(self):
+        self._write = system_writer(self._CONFIG, self.transport)
+
         # Set up periodic loop for tracking pings from peers. Run every 'PING_TIME' seconds
         self._system_maintenance = task.LoopingCall(self.maintenance_loop)
         self._system_maintenance_loop = self._system_maintenance.start(self._CONFIG['GLOBAL']['PING_TIME'])
 
+    # Called before the socket closes, so anything queued still goes out
+    def stopProtocol(self):
+        if self._system_maintenance.running:
+            self._system_maintenance.stop()
+        hb_mmsg.close(self._write)
+
     # Aliased in __init__ to maintenance_loop if system is a master
     def master_maintenance_loop(self):
         logger.debug('(%s) Master maintenance loop started', self._system)
-        remove_list = []
-        for peer in self._peers:
-            _this_peer = self._peers[peer]
-            # Check to see if any of the peers have been quiet (no ping) longer than allowed
-            if _this_peer['LAST_PING']+(self._CONFIG['GLOBAL']['PING_TIME']*self._CONFIG['GLOBAL']['MAX_MISSED']) < time():
-                remove_list.append(peer)
-        for peer in remove_list:
-            logger.info('(%s) Peer %s (%s) has timed out and is being removed', self._system, self._peers[peer]['CALLSIGN'], self._peers[peer]['RADIO_ID'])
+        # Check to see if any of the peers have been quiet (no ping) longer than allowed
+        _expired = time() - (self._CONFIG['GLOBAL']['PING_TIME']*self._CONFIG['GLOBAL']['MAX_MISSED'])
+        while self._peer_pings:
+            _peer = next(iter(self._peer_pings))
+            if self._peer_pings[_peer] >= _expired:
+                break
+            logger.info('(%s) Peer %s (%s) has timed out and is being removed', self._system, self._peers[_peer].CALLSIGN, self._peers[_peer].RADIO_ID)
             # Remove any timed out peers from the configuration
-            del self._CONFIG['SYSTEMS'][self._system]['PEERS'][peer]
+            self.remove_peer(_peer)
+            self._peer_stats['REMOVED'] += 1
+
+        # Drop peers that started logging in but never finished
+        _now = time()
+        _expired = _now - const.PENDING_TO
+        while self._pending:
+            _peer = next(iter(self._pending))
+            if self._pending[_peer] >= _expired:
+                break
+            logger.debug('(%s) Peer %s did not finish logging in and is being removed', self._system, int_id(_peer))
+            self.remove_peer(_peer)
+            self._peer_stats['PENDING_EXPIRED'] += 1
+
+        # Forget rate limits for sources that have gone quiet
+        for _ip in [_ip for _ip in self._ctrl_buckets if self._ctrl_buckets[_ip].idle(_now)]:
+            del self._ctrl_buckets[_ip]
+
+        # Dropped control traffic is only logged here, in aggregate
+        _drops = (self._peer_stats['CTRL_DROPPED'], self._peer_stats['PENDING_EVICTED'])
+        if _drops != self._drops_logged:
+            logger.warning('(%s) Flood protection dropped %s control packets and pushed out %s unfinished logins since the last check', self._system, _drops[0] - self._drops_logged[0], _drops[1] - self._drops_logged[1])
+            self._drops_logged = _drops
 
     # Aliased in __init__ to maintenance_loop if system is a peer
     def peer_maintenance_loop(self):
@@ -265,40 +602,116 @@ class HBSYSTEM(DatagramProtocol):
         # If we are connected, sent a ping to the master and increment the counter
         if self._stats['CONNECTION'] == 'YES':
             self.send_master('RPTPING'+self._config['RADIO_ID'])
-            logger.debug('(%s) RPTPING Sent to Master. Total Sent: %s, Total Missed: %s, Currently Outstanding: %s', self._system, self._stats['PINGS_SENT'], self._stats['PINGS_SENT'] - self._stats['PINGS_ACKD'], self._stats['NUM_OUTSTANDING'])
+            if log_levels.DEBUG:
+                logger.debug('(%s) RPTPING Sent to Master. Total Sent: %s, Total Missed: %s, Currently Outstanding: %s', self._system, self._stats['PINGS_SENT'], self._stats['PINGS_SENT'] - self._stats['PINGS_ACKD'], self._stats['NUM_OUTSTANDING'])
             self._stats['PINGS_SENT'] += 1
             self._stats['PING_OUTSTANDING'] = True
 
-    def send_peers(self, _packet):
-        for _peer in self._peers:
-            self.send_peer(_peer, _packet)
-            #logger.debug('(%s) Packet sent to peer %s', self._system, self._peers[_peer]['RADIO_ID'])
+    # (peer_id, sockaddr) for every connected peer, so fan-out doesn't walk the
+    # peers dict for every frame -- rebuild whenever a peer logs in or out
+    def update_peer_list(self):
+        self._peer_list = [(_peer.PEER_ID, _peer.SOCKADDR) for _peer in self._peers.itervalues() if _peer.CONNECTION == const.PEER_CONNECTED]
+        self._peer_stats['ACTIVE'] = len(self._peer_list)
+
+    # Record that we've heard from a peer, moving it to the back of the timeout order
+    def peer_heard(self, _peer_id):
+        _now = time()
+        self._peers[_peer_id].LAST_PING = _now
+        self._peer_pings.pop(_peer_id, None)
+        self._peer_pings[_peer_id] = _now
+
+    def remove_peer(self, _peer_id):
+        del self._peers[_peer_id]
+        self._peer_pings.pop(_peer_id, None)
+        self._pending.pop(_peer_id, None)
+        self.update_peer_list()
+
+    # Send a DMRD frame to every connected peer (except _exclude) with the peer ID rewritten
+    def send_peers(self, _packet, _exclude = None):
+        _pkt = [_packet[:11], '', _packet[15:]]
+        for _peer, _sockaddr in self._peer_list:
+            if _peer != _exclude:
+                _pkt[1] = _peer
+                self._write(''.join(_pkt), _sockaddr)
+                #logger.debug('(%s) Packet sent to peer %s', self._system, self._peers[_peer].RADIO_ID)
 
     def send_peer(self, _peer, _packet):
         #if _packet[:4] == 'DMRD':
-        self.transport.write(''.join([_packet[:11], _peer, _packet[15:]]), self._peers[_peer]['SOCKADDR'])
+        self._write(''.join([_packet[:11], _peer, _packet[15:]]), self._peers[_peer].SOCKADDR)
         # KEEP THE FOLLOWING COMMENTED OUT UNLESS YOU'RE DEBUGGING DEEPLY!!!!
-        #logger.debug('(%s) TX Packet to %s on port %s: %s', self._peers[_peer]['RADIO_ID'], self._peers[_peer]['IP'], self._peers[_peer]['PORT'], ahex(_packet))
+        #logger.debug('(%s) TX Packet to %s on port %s: %s', self._peers[_peer].RADIO_ID, self._peers[_peer].IP, self._peers[_peer].PORT, ahex(_packet))
 
     def send_master(self, _packet):
         if _packet[:4] == 'DMRD':
             _packet = _packet[:11] + self._config['RADIO_ID'] + _packet[15:]
-        self.transport.write(_packet, self._config['MASTER_SOCKADDR'])
+        self._write(_packet, self._config['MASTER_SOCKADDR'])
         # KEEP THE FOLLOWING COMMENTED OUT UNLESS YOU'RE DEBUGGING DEEPLY!!!!
         # logger.debug('(%s) TX Packet to %s:%s -- %s', self._system, self._config['MASTER_IP'], self._config['MASTER_PORT'], ahex(_packet))
 
     def dmrd_received(self, _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data):
         pass
 
+    # Forget cached ACL verdicts -- must be called whenever the ACLs are rebuilt
+    def flush_acl_cache(self):
+        self._acl_cache.clear()
+
+    # Our configuration was changed in place by a reload
+    def config_updated(self):
+        self.flush_acl_cache()
+
+    # Called by stop_system() once the system is out of systems -- applications
+    # let go of anything else they hold for it here
+    def stopped(self):
+        pass
+
     def master_dereg(self):
         for _peer in self._peers:
             self.send_peer(_peer, 'MSTCL'+_peer)
-            logger.info('(%s) De-Registration sent to Peer: %s (%s)', self._system, self._peers[_peer]['CALLSIGN'], self._peers[_peer]['RADIO_ID'])
+            logger.info('(%s) De-Registration sent to Peer: %s (%s)', self._system, self._peers[_peer].CALLSIGN, self._peers[_peer].RADIO_ID)
 
     def peer_dereg(self):
         self.send_master('RPTCL'+self._config['RADIO_ID'])
         logger.info('(%s) De-Registration sent to Master: %s:%s', self._system, self._config['MASTER_SOCKADDR'][0], self._config['MASTER_SOCKADDR'][1])
 
+    # Rate limit for control traffic from sources that aren't logged in. Sources
+    # only get a bucket of their own if the overall limit lets them in, so a
+    # flood from spoofed addresses can't grow the table without bound.
+    def control_permitted(self, _ip):
+        _now = time()
+        _bucket = self._ctrl_buckets.get(_ip)
+        if (_bucket is None or _bucket.take(_now)) and self._ctrl_global.take(_now):
+            if _bucket is None:
+                self._ctrl_buckets[_ip] = _bucket = TokenBucket(const.CTRL_RATE, const.CTRL_BURST, _now)
+                _bucket.take(_now)
+            return True
+        self._peer_stats['CTRL_DROPPED'] += 1
+        return False
+
+    # Make room for one more login in progress from _ip. Past PENDING_PER_IP
+    # from that address, the oldest login from it is pushed out; past
+    # PENDING_MAX in all, or with MAX_PEERS taken, the oldest one from
+    # anywhere. The new login is never the one turned away -- otherwise a
+    # trickle of spoofed RPTLs, each finishing nothing, would hold every
+    # slot and lock real repeaters out.
+    def make_pending_room(self, _ip):
+        _from_ip = [_peer for _peer in self._pending if self._peers[_peer].IP == _ip]
+        if len(_from_ip) >= const.PENDING_PER_IP:
+            _oldest = _from_ip[0]
+        elif self._pending and (len(self._pending) >= const.PENDING_MAX or len(self._peers) >= self._config['MAX_PEERS']):
+            _oldest = next(iter(self._pending))
+        else:
+            return
+        self.remove_peer(_oldest)
+        self._peer_stats['PENDING_EVICTED'] += 1
+
+    # NAK control traffic we won't accept, if the source is within its rate
+    # limit. Returns True if it was sent (and so is worth logging)
+    def send_nak(self, _peer_id, _sockaddr):
+        if self.control_permitted(_sockaddr[0]):
+            self._write('MSTNAK'+_peer_id, _sockaddr)
+            return True
+        return False
+
     # Aliased in __init__ to datagramReceived if system is a master
     def master_datagramReceived(self, _data, _sockaddr):
         # Keep This Line Commented Unless HEAVILY Debugging!
@@ -308,74 +721,27 @@ class HBSYSTEM(DatagramProtocol):
         _command = _data[:4]
 
         if _command == 'DMRD':    # DMRData -- encapsulated DMR data frame
+            if len(_data) < DMRD_HEADER.size:
+                if log_levels.DEBUG:
+                    logger.debug('(%s) Runt DMRD packet (%s bytes) from %s:%s discarded', self._system, len(_data), _sockaddr[0], _sockaddr[1])
+                return
             _peer_id = _data[11:15]
-            if _peer_id in self._peers \
-                        and self._peers[_peer_id]['CONNECTION'] == 'YES' \
-                        and self._peers[_peer_id]['SOCKADDR'] == _sockaddr:
-                _seq = _data[4]
-                _rf_src = _data[5:8]
-                _dst_id = _data[8:11]
-                _bits = int_id(_data[15])
-                _slot = 2 if (_bits & 0x80) else 1
-                #_call_type = 'unit' if (_bits & 0x40) else 'group'
-                if _bits & 0x40:
-                    _call_type = 'unit'
-                elif (_bits & 0x23) == 0x23:
-                    _call_type = 'vcsbk'
-                else:
-                    _call_type = 'group'
-                _frame_type = (_bits & 0x30) >> 4
-                _dtype_vseq = (_bits & 0xF) # data, 1=voice header, 2=voice terminator; voice, 0=burst A ... 5=burst F
-                _stream_id = _data[16:20]
+            _peer = self._peers.get(_peer_id)
+            if _peer is not None and _peer.CONNECTION == const.PEER_CONNECTED and _peer.SOCKADDR == _sockaddr:
+                _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id = decode_dmrd(_data)
                 #logger.debug('(%s) DMRD - Seqence: %s, RF Source: %s, Destination ID: %s', self._system, int_id(_seq), int_id(_rf_src), int_id(_dst_id))
-                # ACL Processing
-                if self._CONFIG['GLOBAL']['USE_ACL']:
-                    if not acl_check(_rf_src, self._CONFIG['GLOBAL']['SUB_ACL']):
-                        if self._laststrid != _stream_id:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s FROM SUBSCRIBER %s BY GLOBAL ACL', self._system, int_id(_stream_id), int_id(_rf_src))
-                            if _slot == 1:
-                                self._laststrid1 = _stream_id
-                            else:
-                                self._laststrid2 = _stream_id
-                        return
-                    if _slot == 1 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG1_ACL']):
-                        if self._laststrid1 != _stream_id:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY GLOBAL TS1 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                            self._laststrid1 = _stream_id
-                        return
-                    if _slot == 2 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG2_ACL']):
-                        if self._laststrid2 != _stream_id:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY GLOBAL TS2 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                            self._laststrid2 = _stream_id
-                        return
-                if self._config['USE_ACL']:
-                    if not acl_check(_rf_src, self._config['SUB_ACL']):
-                        if self._laststrid != _stream_id:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s FROM SUBSCRIBER %s BY SYSTEM ACL', self._system, int_id(_stream_id), int_id(_rf_src))
-                            if _slot == 1:
-                                self._laststrid1 = _stream_id
-                            else:
-                                self._laststrid2 = _stream_id
-                        return
-                    if _slot == 1 and not acl_check(_dst_id, self._config['TG1_ACL']):
-                        if self._laststrid1 != _stream_id:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY SYSTEM TS1 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                            self._laststrid1 = _stream_id
-                        return
-                    if _slot == 2 and not acl_check(_dst_id, self._config['TG2_ACL']):
-                        if self._laststrid2 != _stream_id:
-                            logger.info('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY SYSTEM TS2 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                            self._laststrid2 = _stream_id
-                        return
+                # ACL Processing -- evaluated on the first frame of a stream, then cached
+                _acl = self._acl_cache.get(_stream_id)
+                if _acl is None:
+                    _acl = acl_stream(self._acl_cache, self._CONFIG, self._config, _stream_id, _rf_src, _dst_id, _slot)
+                    if not _acl[0]:
+                        logger.info('(%s) CALL DROPPED WITH STREAM ID %s %s', self._system, LogID(_stream_id), _acl[1])
+                if not _acl[0]:
+                    return
 
                 # The basic purpose of a master is to repeat to the peers
                 if self._config['REPEAT'] == True:
-                    pkt = [_data[:11], '', _data[15:]]
-                    for _peer in self._peers:
-                        if _peer != _peer_id:
-                            pkt[1] = _peer
-                            self.transport.write(''.join(pkt), self._peers[_peer]['SOCKADDR'])
-                            #logger.debug('(%s) Packet on TS%s from %s (%s) for destination ID %s repeated to peer: %s (%s) [Stream ID: %s]', self._system, _slot, self._peers[_peer_id]['CALLSIGN'], int_id(_peer_id), int_id(_dst_id), self._peers[_peer]['CALLSIGN'], int_id(_peer), int_id(_stream_id))
+                    self.send_peers(_data, _peer_id)
 
 
                 # Userland actions -- typically this is the function you subclass for an application
@@ -383,124 +749,107 @@ class HBSYSTEM(DatagramProtocol):
 
         elif _command == 'RPTL':    # RPTLogin -- a repeater wants to login
             _peer_id = _data[4:8]
+            # Logins are unauthenticated -- rate limit them, and how many can be in progress at once
+            if not self.control_permitted(_sockaddr[0]):
+                return
+            # Check for valid Radio ID
+            if not (acl_check(_peer_id, self._CONFIG['GLOBAL']['REG_ACL']) and acl_check(_peer_id, self._config['REG_ACL'])):
+                self._write('MSTNAK'+_peer_id, _sockaddr)
+                logger.warning('(%s) Invalid Login from Radio ID: %s Denied by Registation ACL', self._system, int_id(_peer_id))
+                return
+            if _peer_id not in self._pending:
+                self.make_pending_room(_sockaddr[0])
             # Check to see if we've reached the maximum number of allowed peers
             if len(self._peers) < self._config['MAX_PEERS']:
-                # Check for valid Radio ID
-                if acl_check(_peer_id, self._CONFIG['GLOBAL']['REG_ACL']) and acl_check(_peer_id, self._config['REG_ACL']):
-                    # Build the configuration data strcuture for the peer
-                    self._peers.update({_peer_id: {
-                        'CONNECTION': 'RPTL-RECEIVED',
-                        'CONNECTED': time(),
-                        'PINGS_RECEIVED': 0,
-                        'LAST_PING': time(),
-                        'SOCKADDR': _sockaddr,
-                        'IP': _sockaddr[0],
-                        'PORT': _sockaddr[1],
-                        'SALT': randint(0,0xFFFFFFFF),
-                        'RADIO_ID': str(int(ahex(_peer_id), 16)),
-                        'CALLSIGN': '',
-                        'RX_FREQ': '',
-                        'TX_FREQ': '',
-                        'TX_POWER': '',
-                        'COLORCODE': '',
-                        'LATITUDE': '',
-                        'LONGITUDE': '',
-                        'HEIGHT': '',
-                        'LOCATION': '',
-                        'DESCRIPTION': '',
-                        'SLOTS': '',
-                        'URL': '',
-                        'SOFTWARE_ID': '',
-                        'PACKAGE_ID': '',
-                    }})
-                    logger.info('(%s) Repeater Logging in with Radio ID: %s, %s:%s', self._system, int_id(_peer_id), _sockaddr[0], _sockaddr[1])
-                    _salt_str = hex_str_4(self._peers[_peer_id]['SALT'])
-                    self.send_peer(_peer_id, 'RPTACK'+_salt_str)
-                    self._peers[_peer_id]['CONNECTION'] = 'CHALLENGE_SENT'
-                    logger.info('(%s) Sent Challenge Response to %s for login: %s', self._system, int_id(_peer_id), self._peers[_peer_id]['SALT'])
-                else:
-                    self.transport.write('MSTNAK'+_peer_id, _sockaddr)
-                    logger.warning('(%s) Invalid Login from Radio ID: %s Denied by Registation ACL', self._system, int_id(_peer_id))
+                # A peer logging in again starts over, and drops out of the fan-out until it's reconfigured
+                if _peer_id in self._peers:
+                    self.remove_peer(_peer_id)
+                # Build the configuration data strcuture for the peer
+                _this_peer = self._peers[_peer_id] = Peer(_peer_id, _sockaddr)
+                self._pending[_peer_id] = _this_peer.CONNECTED
+                self.peer_heard(_peer_id)
+                logger.info('(%s) Repeater Logging in with Radio ID: %s, %s:%s', self._system, int_id(_peer_id), _sockaddr[0], _sockaddr[1])
+                _salt_str = hex_str_4(_this_peer.SALT)
+                self.send_peer(_peer_id, 'RPTACK'+_salt_str)
+                _this_peer.CONNECTION = const.PEER_CHALLENGE_SENT
+                logger.info('(%s) Sent Challenge Response to %s for login: %s', self._system, int_id(_peer_id), _this_peer.SALT)
             else:
-                self.transport.write('MSTNAK'+_peer_id, _sockaddr)
+                self._write('MSTNAK'+_peer_id, _sockaddr)
                 logger.warning('(%s) Registration denied from Radio ID: %s Maximum number of peers exceeded', self._system, int_id(_peer_id))
 
         elif _command == 'RPTK':    # Repeater has answered our login challenge
             _peer_id = _data[4:8]
-            if _peer_id in self._peers \
-                        and self._peers[_peer_id]['CONNECTION'] == 'CHALLENGE_SENT' \
-                        and self._peers[_peer_id]['SOCKADDR'] == _sockaddr:
-                _this_peer = self._peers[_peer_id]
-                _this_peer['LAST_PING'] = time()
+            _this_peer = self._peers.get(_peer_id)
+            if _this_peer is not None and _this_peer.CONNECTION == const.PEER_CHALLENGE_SENT and _this_peer.SOCKADDR == _sockaddr:
+                self.peer_heard(_peer_id)
                 _sent_hash = _data[8:]
-                _salt_str = hex_str_4(_this_peer['SALT'])
+                _salt_str = hex_str_4(_this_peer.SALT)
                 _calc_hash = bhex(sha256(_salt_str+self._config['PASSPHRASE']).hexdigest())
                 if _sent_hash == _calc_hash:
-                    _this_peer['CONNECTION'] = 'WAITING_CONFIG'
+                    _this_peer.CONNECTION = const.PEER_WAITING_CONFIG
                     self.send_peer(_peer_id, 'RPTACK'+_peer_id)
-                    logger.info('(%s) Peer %s has completed the login exchange successfully', self._system, _this_peer['RADIO_ID'])
+                    logger.info('(%s) Peer %s has completed the login exchange successfully', self._system, _this_peer.RADIO_ID)
                 else:
-                    logger.info('(%s) Peer %s has FAILED the login exchange successfully', self._system, _this_peer['RADIO_ID'])
-                    self.transport.write('MSTNAK'+_peer_id, _sockaddr)
-                    del self._peers[_peer_id]
+                    logger.info('(%s) Peer %s has FAILED the login exchange successfully', self._system, _this_peer.RADIO_ID)
+                    self._write('MSTNAK'+_peer_id, _sockaddr)
+                    self.remove_peer(_peer_id)
             else:
-                self.transport.write('MSTNAK'+_peer_id, _sockaddr)
-                logger.warning('(%s) Login challenge from Radio ID that has not logged in: %s', self._system, int_id(_peer_id))
+                if self.send_nak(_peer_id, _sockaddr):
+                    logger.warning('(%s) Login challenge from Radio ID that has not logged in: %s', self._system, int_id(_peer_id))
 
         elif _command == 'RPTC':    # Repeater is sending it's configuraiton OR disconnecting
             if _data[:5] == 'RPTCL':    # Disconnect command
                 _peer_id = _data[5:9]
-                if _peer_id in self._peers \
-                            and self._peers[_peer_id]['CONNECTION'] == 'YES' \
-                            and self._peers[_peer_id]['SOCKADDR'] == _sockaddr:
-                    logger.info('(%s) Peer is closing down: %s (%s)', self._system, self._peers[_peer_id]['CALLSIGN'], int_id(_peer_id))
-                    self.transport.write('MSTNAK'+_peer_id, _sockaddr)
-                    del self._peers[_peer_id]
+                _this_peer = self._peers.get(_peer_id)
+                if _this_peer is not None and _this_peer.CONNECTION == const.PEER_CONNECTED and _this_peer.SOCKADDR == _sockaddr:
+                    logger.info('(%s) Peer is closing down: %s (%s)', self._system, _this_peer.CALLSIGN, int_id(_peer_id))
+                    self._write('MSTNAK'+_peer_id, _sockaddr)
+                    self.remove_peer(_peer_id)
 
             else:
                 _peer_id = _data[4:8]      # Configure Command
-                if _peer_id in self._peers \
-                            and self._peers[_peer_id]['CONNECTION'] == 'WAITING_CONFIG' \
-                            and self._peers[_peer_id]['SOCKADDR'] == _sockaddr:
-                    _this_peer = self._peers[_peer_id]
-                    _this_peer['CONNECTION'] = 'YES'
-                    _this_peer['CONNECTED'] = time()
-                    _this_peer['LAST_PING'] = time()
-                    _this_peer['CALLSIGN'] = _data[8:16]
-                    _this_peer['RX_FREQ'] = _data[16:25]
-                    _this_peer['TX_FREQ'] =  _data[25:34]
-                    _this_peer['TX_POWER'] = _data[34:36]
-                    _this_peer['COLORCODE'] = _data[36:38]
-                    _this_peer['LATITUDE'] = _data[38:46]
-                    _this_peer['LONGITUDE'] = _data[46:55]
-                    _this_peer['HEIGHT'] = _data[55:58]
-                    _this_peer['LOCATION'] = _data[58:78]
-                    _this_peer['DESCRIPTION'] = _data[78:97]
-                    _this_peer['SLOTS'] = _data[97:98]
-                    _this_peer['URL'] = _data[98:222]
-                    _this_peer['SOFTWARE_ID'] = _data[222:262]
-                    _this_peer['PACKAGE_ID'] = _data[262:302]
+                _this_peer = self._peers.get(_peer_id)
+                if _this_peer is not None and _this_peer.CONNECTION == const.PEER_WAITING_CONFIG and _this_peer.SOCKADDR == _sockaddr:
+                    _this_peer.CONNECTION = const.PEER_CONNECTED
+                    _this_peer.CONNECTED = time()
+                    del self._pending[_peer_id]
+                    self.peer_heard(_peer_id)
+                    _this_peer.CALLSIGN = _data[8:16]
+                    _this_peer.RX_FREQ = _data[16:25]
+                    _this_peer.TX_FREQ =  _data[25:34]
+                    _this_peer.TX_POWER = _data[34:36]
+                    _this_peer.COLORCODE = _data[36:38]
+                    _this_peer.LATITUDE = _data[38:46]
+                    _this_peer.LONGITUDE = _data[46:55]
+                    _this_peer.HEIGHT = _data[55:58]
+                    _this_peer.LOCATION = _data[58:78]
+                    _this_peer.DESCRIPTION = _data[78:97]
+                    _this_peer.SLOTS = _data[97:98]
+                    _this_peer.URL = _data[98:222]
+                    _this_peer.SOFTWARE_ID = _data[222:262]
+                    _this_peer.PACKAGE_ID = _data[262:302]
+                    self.update_peer_list()
 
                     self.send_peer(_peer_id, 'RPTACK'+_peer_id)
-                    logger.info('(%s) Peer %s (%s) has sent repeater configuration', self._system, _this_peer['CALLSIGN'], _this_peer['RADIO_ID'])
+                    logger.info('(%s) Peer %s (%s) has sent repeater configuration', self._system, _this_peer.CALLSIGN, _this_peer.RADIO_ID)
                 else:
-                    self.transport.write('MSTNAK'+_peer_id, _sockaddr)
-                    logger.warning('(%s) Peer info from Radio ID that has not logged in: %s', self._system, int_id(_peer_id))
+                    if self.send_nak(_peer_id, _sockaddr):
+                        logger.warning('(%s) Peer info from Radio ID that has not logged in: %s', self._system, int_id(_peer_id))
 
         elif _command == 'RPTP':    # RPTPing -- peer is pinging us
                 _peer_id = _data[7:11]
-                if _peer_id in self._peers \
-                            and self._peers[_peer_id]['CONNECTION'] == "YES" \
-                            and self._peers[_peer_id]['SOCKADDR'] == _sockaddr:
-                    self._peers[_peer_id]['PINGS_RECEIVED'] += 1
-                    self._peers[_peer_id]['LAST_PING'] = time()
+                _this_peer = self._peers.get(_peer_id)
+                if _this_peer is not None and _this_peer.CONNECTION == const.PEER_CONNECTED and _this_peer.SOCKADDR == _sockaddr:
+                    _this_peer.PINGS_RECEIVED += 1
+                    self.peer_heard(_peer_id)
                     self.send_peer(_peer_id, 'MSTPONG'+_peer_id)
-                    logger.debug('(%s) Received and answered RPTPING from peer %s (%s)', self._system, self._peers[_peer_id]['CALLSIGN'], int_id(_peer_id))
+                    if log_levels.DEBUG:
+                        logger.debug('(%s) Received and answered RPTPING from peer %s (%s)', self._system, _this_peer.CALLSIGN, int_id(_peer_id))
                 else:
-                    self.transport.write('MSTNAK'+_peer_id, _sockaddr)
-                    logger.warning('(%s) Ping from Radio ID that is not logged in: %s', self._system, int_id(_peer_id))
+                    if self.send_nak(_peer_id, _sockaddr):
+                        logger.warning('(%s) Ping from Radio ID that is not logged in: %s', self._system, int_id(_peer_id))
 
-        else:
+        elif self.control_permitted(_sockaddr[0]):
             logger.error('(%s) Unrecognized command. Raw HBP PDU: %s', self._system, ahex(_data))
 
     # Aliased in __init__ to datagramReceived if system is a peer
@@ -513,65 +862,23 @@ class HBSYSTEM(DatagramProtocol):
             # Extract the command, which is various length, but only 4 significant characters
             _command = _data[:4]
             if   _command == 'DMRD':    # DMRData -- encapsulated DMR data frame
+                if len(_data) < DMRD_HEADER.size:
+                    if log_levels.DEBUG:
+                        logger.debug('(%s) Runt DMRD packet (%s bytes) from the master discarded', self._system, len(_data))
+                    return
                 _peer_id = _data[11:15]
                 if self._config['LOOSE'] or _peer_id == self._config['RADIO_ID']: # Validate the Radio_ID unless using loose validation
-                    _seq = _data[4:5]
-                    _rf_src = _data[5:8]
-                    _dst_id = _data[8:11]
-                    _bits = int_id(_data[15])
-                    _slot = 2 if (_bits & 0x80) else 1
-                    #_call_type = 'unit' if (_bits & 0x40) else 'group'
-                    if _bits & 0x40:
-                        _call_type = 'unit'
-                    elif (_bits & 0x23) == 0x23:
-                        _call_type = 'vcsbk'
-                    else:
-                        _call_type = 'group'
-                    _frame_type = (_bits & 0x30) >> 4
-                    _dtype_vseq = (_bits & 0xF) # data, 1=voice header, 2=voice terminator; voice, 0=burst A ... 5=burst F
-                    _stream_id = _data[16:20]
+                    _peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id = decode_dmrd(_data)
                     #logger.debug('(%s) DMRD - Sequence: %s, RF Source: %s, Destination ID: %s', self._system, int_id(_seq), int_id(_rf_src), int_id(_dst_id))
 
-                    # ACL Processing
-                    if self._CONFIG['GLOBAL']['USE_ACL']:
-                        if not acl_check(_rf_src, self._CONFIG['GLOBAL']['SUB_ACL']):
-                            if self._laststrid != _stream_id:
-                                logger.debug('(%s) CALL DROPPED WITH STREAM ID %s FROM SUBSCRIBER %s BY GLOBAL ACL', self._system, int_id(_stream_id), int_id(_rf_src))
-                                if _slot == 1:
-                                    self._laststrid1 = _stream_id
-                                else:
-                                    self._laststrid2 = _stream_id
-                            return
-                        if _slot == 1 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG1_ACL']):
-                            if self._laststrid1 != _stream_id:
-                                logger.debug('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY GLOBAL TS1 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                                self._laststrid1 = _stream_id
-                            return
-                        if _slot == 2 and not acl_check(_dst_id, self._CONFIG['GLOBAL']['TG2_ACL']):
-                            if self._laststrid2 != _stream_id:
-                                logger.debug('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY GLOBAL TS2 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                                self._laststrid2 = _stream_id
-                            return
-                    if self._config['USE_ACL']:
-                        if not acl_check(_rf_src, self._config['SUB_ACL']):
-                            if self._laststrid != _stream_id:
-                                logger.debug('(%s) CALL DROPPED WITH STREAM ID %s FROM SUBSCRIBER %s BY SYSTEM ACL', self._system, int_id(_stream_id), int_id(_rf_src))
-                                if _slot == 1:
-                                    self._laststrid1 = _stream_id
-                                else:
-                                    self._laststrid2 = _stream_id
-                            return
-                        if _slot == 1 and not acl_check(_dst_id, self._config['TG1_ACL']):
-                            if self._laststrid1 != _stream_id:
-                                logger.debug('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY SYSTEM TS1 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                                self._laststrid1 = _stream_id
-                            return
-                        if _slot == 2 and not acl_check(_dst_id, self._config['TG2_ACL']):
-                            if self._laststrid2 != _stream_id:
-                                logger.debug('(%s) CALL DROPPED WITH STREAM ID %s ON TGID %s BY SYSTEM TS2 ACL', self._system, int_id(_stream_id), int_id(_dst_id))
-                                self._laststrid2 = _stream_id
-                            return
-
+                    # ACL Processing -- evaluated on the first frame of a stream, then cached
+                    _acl = self._acl_cache.get(_stream_id)
+                    if _acl is None:
+                        _acl = acl_stream(self._acl_cache, self._CONFIG, self._config, _stream_id, _rf_src, _dst_id, _slot)
+                        if not _acl[0]:
+                            logger.debug('(%s) CALL DROPPED WITH STREAM ID %s %s', self._system, LogID(_stream_id), _acl[1])
+                    if not _acl[0]:
+                        return
 
                     # Userland actions -- typically this is the function you subclass for an application
                     self.dmrd_received(_peer_id, _rf_src, _dst_id, _seq, _slot, _call_type, _frame_type, _dtype_vseq, _stream_id, _data)
@@ -653,7 +960,8 @@ class HBSYSTEM(DatagramProtocol):
                     self._stats['PING_OUTSTANDING'] = False
                     self._stats['NUM_OUTSTANDING'] = 0
                     self._stats['PINGS_ACKD'] += 1
-                    logger.debug('(%s) MSTPONG Received. Pongs Since Connected: %s', self._system, self._stats['PINGS_ACKD'])
+                    if log_levels.DEBUG:
+                        logger.debug('(%s) MSTPONG Received. Pongs Since Connected: %s', self._system, self._stats['PINGS_ACKD'])
 
             elif _command == 'MSTC':    # Actually MSTCL -- notify us the master is closing down
                 _peer_id = _data[5:9]
@@ -672,8 +980,11 @@ class report(NetstringReceiver):
         self._factory = factory
 
     def connectionMade(self):
-        self._factory.clients.append(self)
         logger.info('HBlink reporting client connected: %s', self.transport.getPeer())
+        # Snapshots first -- the client only gets updates once it has something to apply them to
+        self._factory.send_config_snap(self)
+        self._factory.send_bridge_snap(self)
+        self._factory.clients.append(self)
 
     def connectionLost(self, reason):
         logger.info('HBlink reporting client disconnected: %s', self.transport.getPeer())
@@ -686,13 +997,50 @@ class report(NetstringReceiver):
         opcode = _message[:1]
         if opcode == REPORT_OPCODES['CONFIG_REQ']:
             logger.info('HBlink reporting client sent \'CONFIG_REQ\': %s', self.transport.getPeer())
-            self.send_config()
+            self._factory.send_config_snap(self)
+        elif opcode == REPORT_OPCODES['BRIDGE_REQ']:
+            logger.info('HBlink reporting client sent \'BRIDGE_REQ\': %s', self.transport.getPeer())
+            self._factory.send_bridge_snap(self)
         else:
             logger.error('got unknown opcode')
 
+# Bring _shadow up to date with _current and return what changed. Nested dicts
+# are diffed recursively, so a peer that only answered a ping costs just those
+# two fields. Keys that have gone away are reported as None. Clients apply the
+# result by merging it into their copy of the last snapshot. Anything else that
+# changed is copied into the shadow, so a list changed in place later on is
+# still seen as a change.
+def shadow_delta(_shadow, _current):
+    _delta = {}
+    for _key, _value in _current.iteritems():
+        if type(_value) is Peer:
+            _value = _value.as_dict()
+        if type(_value) is dict:
+            _sub_shadow = _shadow.get(_key)
+            if type(_sub_shadow) is not dict:
+                _sub_shadow = _shadow[_key] = {}
+            elif _sub_shadow == _value:
+                continue
+            _sub_delta = shadow_delta(_sub_shadow, _value)
+            if _sub_delta:
+                _delta[_key] = _sub_delta
+        elif _key not in _shadow or _shadow[_key] != _value:
+            _shadow[_key] = deepcopy(_value)
+            _delta[_key] = _value
+    for _key in [_key for _key in _shadow if _key not in _current]:
+        del _shadow[_key]
+        _delta[_key] = None
+    return _delta
+
+# Clients get a full snapshot (*_SND) when they connect or ask for one
+# (*_REQ), then only what has changed each reporting interval (*_UPD). Every
+# message carries (version, data) -- a snapshot has the version of the last
+# update sent, and each update increments it.
 class reportFactory(Factory):
     def __init__(self, config):
         self._config = config
+        self._config_ver = 0
+        self._config_shadow = {}
 
     def buildProtocol(self, addr):
         if (addr.host) in self._config['REPORTS']['REPORT_CLIENTS'] or '*' in self._config['REPORTS']['REPORT_CLIENTS']:
@@ -707,35 +1055,263 @@ class reportFactory(Factory):
             client.sendString(_message)
 
     def send_config(self):
-        serialized = pickle.dumps(self._config['SYSTEMS'], protocol=pickle.HIGHEST_PROTOCOL)
-        self.send_clients(REPORT_OPCODES['CONFIG_SND']+serialized)
+        if self.clients:
+            self.update_config()
+
+    # Bring the shadow up to date with SYSTEMS, sending what changed to the clients
+    def update_config(self):
+        _delta = shadow_delta(self._config_shadow, self._config['SYSTEMS'])
+        if _delta:
+            self._config_ver += 1
+            if self.clients:
+                serialized = pickle.dumps((self._config_ver, _delta), protocol=pickle.HIGHEST_PROTOCOL)
+                self.send_clients(REPORT_OPCODES['CONFIG_UPD']+serialized)
+
+    def send_config_snap(self, _client):
+        # Catch everyone else up first, so the snapshot and the next update line up.
+        # The shadow is then a plain copy of SYSTEMS that clients can unpickle.
+        self.update_config()
+        serialized = pickle.dumps((self._config_ver, self._config_shadow), protocol=pickle.HIGHEST_PROTOCOL)
+        _client.sendString(REPORT_OPCODES['CONFIG_SND']+serialized)
+
+    # Only applications with bridges (hb_confbridge) have anything to send here
+    def send_bridge(self):
+        pass
+
+    def send_bridge_snap(self, _client):
+        pass
+
+    def send_stats(self):
+        if not self.clients:
+            return
+        serialized = pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL)
+        self.send_clients(REPORT_OPCODES['STATS_SND']+serialized)
 
 
 # ID ALIAS CREATION
-# Download
+# Alias stores open whatever index is already on disk, so startup never waits
+# on a download or a parse. refresh_aliases() then runs straight away and every
+# ALIAS_REFRESH_TIME after that.
 def mk_aliases(_config):
-    if _config['ALIASES']['TRY_DOWNLOAD'] == True:
-        # Try updating peer aliases file
-        result = try_download(_config['ALIASES']['PATH'], _config['ALIASES']['PEER_FILE'], _config['ALIASES']['PEER_URL'], _config['ALIASES']['STALE_TIME'])
-        logger.info(result)
-        # Try updating subscriber aliases file
-        result = try_download(_config['ALIASES']['PATH'], _config['ALIASES']['SUBSCRIBER_FILE'], _config['ALIASES']['SUBSCRIBER_URL'], _config['ALIASES']['STALE_TIME'])
-        logger.info(result)
+    _aliases = []
+    for _name, _file in (('peer_ids', 'PEER_FILE'), ('subscriber_ids', 'SUBSCRIBER_FILE'), ('talkgroup_ids', 'TGID_FILE')):
+        _store = AliasStore(_config['ALIASES']['PATH'], _config['ALIASES'][_file])
+        if _store:
+            logger.info('ID ALIAS MAPPER: %s dictionary is available', _name)
+        _aliases.append(_store)
+
+    _refresh = task.LoopingCall(refresh_aliases, _config, _aliases)
+    reactor.callWhenRunning(_refresh.start, const.ALIAS_REFRESH_TIME)
+    return tuple(_aliases)
+
+# Download (if stale) and re-index each alias file, then point its store at the
+# new index. The work is done by hb_alias.py in a child process: the JSON parse
+# takes seconds and holds the GIL throughout, so a thread would stall the
+# reactor just the same, and the child takes the parse's memory with it.
+# With --workers, only worker 0 does this; the others re-open the indexes it builds.
+ALIAS_INDEXER = os.path.abspath(os.path.splitext(hb_alias.__file__)[0] + '.py')
+
+@defer.inlineCallbacks
+def refresh_aliases(_config, _stores):
+    # Nothing may escape from here -- a failure would stop the LoopingCall for good
+    try:
+        _start = time()
+        _files = {}
+        for _store, _file, _url in zip(_stores, ('PEER_FILE', 'SUBSCRIBER_FILE', 'TGID_FILE'), ('PEER_URL', 'SUBSCRIBER_URL', None)):
+            _name = _config['ALIASES'][_file]
+            try:
+                if _store.changed():
+                    _store.reopen()
+                if not _config['ALIASES'].get('BUILD_INDEX', True):
+                    continue
+
+                _args = [ALIAS_INDEXER, _config['ALIASES']['PATH'], _name]
+                if _url and _config['ALIASES']['TRY_DOWNLOAD'] == True:
+                    _args += [_config['ALIASES'][_url], str(_config['ALIASES']['STALE_TIME'])]
+                _out, _err, _code = yield getProcessOutputAndValue(sys.executable, _args, env=os.environ)
+                if _code != 0:
+                    logger.error('ID ALIAS MAPPER: refreshing \'%s\' failed: %s', _name, _err.strip())
+                    continue
+                _result = jloads(_out)
+
+                if _result['DOWNLOAD']:
+                    logger.info(_result['DOWNLOAD'])
+                if _result['RECORDS'] is not None:
+                    _store.reopen()
+                    logger.info('ID ALIAS MAPPER: \'%s\' re-indexed, %s records in %.1f seconds', _name, _result['RECORDS'], _result['INDEX_TIME'])
+                _files[_name] = _result
+            except Exception:
+                logger.exception('ID ALIAS MAPPER: refreshing \'%s\' failed', _name)
+
+        stats['ALIASES'] = {'LAST_REFRESH': _start, 'REFRESH_TIME': time() - _start, 'FILES': _files}
+    except Exception:
+        logger.exception('ID ALIAS MAPPER: alias refresh failed, trying again in %s seconds', const.ALIAS_REFRESH_TIME)
 
-    # Make Dictionaries
-    peer_ids = mk_id_dict(_config['ALIASES']['PATH'], _config['ALIASES']['PEER_FILE'])
-    if peer_ids:
-        logger.info('ID ALIAS MAPPER: peer_ids dictionary is available')
-
-    subscriber_ids = mk_id_dict(_config['ALIASES']['PATH'], _config['ALIASES']['SUBSCRIBER_FILE'])
-    if subscriber_ids:
-        logger.info('ID ALIAS MAPPER: subscriber_ids dictionary is available')
+#************************************************
+#     SYSTEM START, STOP AND RELOAD
+#************************************************
 
-    talkgroup_ids = mk_id_dict(_config['ALIASES']['PATH'], _config['ALIASES']['TGID_FILE'])
-    if talkgroup_ids:
-        logger.info('ID ALIAS MAPPER: talkgroup_ids dictionary is available')
+# Listening ports by system, so a system can be stopped again
+ports = {}
+
+# Start _system, using the application's class for its mode
+def start_system(_config, _system, _report, _obp_class=OPENBRIDGE, _hbp_class=HBSYSTEM):
+    if _config['SYSTEMS'][_system]['MODE'] == 'OPENBRIDGE':
+        systems[_system] = _obp_class(_system, _config, _report)
+    else:
+        systems[_system] = _hbp_class(_system, _config, _report)
+    ports[_system] = reactor.listenUDP(_config['SYSTEMS'][_system]['PORT'], systems[_system], interface=_config['SYSTEMS'][_system]['IP'])
+    logger.debug('%s instance created: %s, %s', _config['SYSTEMS'][_system]['MODE'], _system, systems[_system])
+
+# De-register and stop _system. Returns a Deferred that fires once its socket is closed
+def stop_system(_system):
+    logger.info('(%s) Stopping system', _system)
+    _stopping = systems.pop(_system)
+    _stopping.dereg()
+    _stopping.stopped()
+    return defer.maybeDeferred(ports.pop(_system).stopListening)
+
+# Per-system keys that hold running state rather than configuration
+SYSTEM_STATE = ('PEERS', 'STATS')
+
+# Changing one of these means stopping the system and starting it again. A
+# PEER sends its master nearly all of its configuration when it logs in, so a
+# PEER is restarted for a change to anything but its ACLs.
+SYSTEM_RESTART = ('MODE', 'IP', 'PORT')
+SYSTEM_ACLS = ('USE_ACL', 'SUB_ACL', 'TG1_ACL', 'TG2_ACL')
+
+# [GLOBAL] settings a system only reads when it starts: its socket writer and
+# the interval of its maintenance loop
+GLOBAL_RESTART = ('BATCH_TX', 'PING_TIME')
+
+# Keys whose values differ between two dictionaries
+def changed_keys(_old, _new, _ignore=()):
+    return sorted([_key for _key in set(_old) | set(_new) if _key not in _ignore and _old.get(_key) != _new.get(_key)])
+
+# What it takes to go from configuration _old to _new: {SECTION: [keys]} for
+# each top level section that changed, and SYSTEMS: {system: (ACTION, [keys])}
+# where ACTION is ADDED, REMOVED, RESTART or UPDATE. Systems that are disabled
+# in both are left out.
+def config_diff(_old, _new):
+    _diff = {}
+    for _section in ('GLOBAL', 'REPORTS', 'LOGGER', 'ALIASES'):
+        _keys = changed_keys(_old[_section], _new[_section])
+        if _keys:
+            _diff[_section] = _keys
+
+    _diff['SYSTEMS'] = {}
+    for _system in set(_old['SYSTEMS']) | set(_new['SYSTEMS']):
+        _was = _system in _old['SYSTEMS'] and _old['SYSTEMS'][_system]['ENABLED']
+        _is = _system in _new['SYSTEMS'] and _new['SYSTEMS'][_system]['ENABLED']
+        if _was and _is:
+            _keys = changed_keys(_old['SYSTEMS'][_system], _new['SYSTEMS'][_system], SYSTEM_STATE)
+            if not _keys:
+                continue
+            if set(_keys) & set(SYSTEM_RESTART) or (_new['SYSTEMS'][_system]['MODE'] == 'PEER' and set(_keys) - set(SYSTEM_ACLS)):
+                _diff['SYSTEMS'][_system] = ('RESTART', _keys)
+            else:
+                _diff['SYSTEMS'][_system] = ('UPDATE', _keys)
+        elif _is:
+            _diff['SYSTEMS'][_system] = ('ADDED', [])
+        elif _was:
+            _diff['SYSTEMS'][_system] = ('REMOVED', [])
+    return _diff
+
+# One line summary of a config_diff() for the log
+def describe_diff(_diff):
+    _changes = ['[{}] {}'.format(_section, ', '.join(_diff[_section])) for _section in sorted(_diff) if _section != 'SYSTEMS']
+    for _system, (_action, _keys) in sorted(_diff['SYSTEMS'].items()):
+        _changes.append('{} {}'.format(_system, _action) + (' ({})'.format(', '.join(_keys)) if _keys else ''))
+    return '; '.join(_changes) or 'no changes'
+
+# Read the configuration file again for a reload. Returns None, and the running
+# configuration stays as it is, if there's anything wrong with it.
+def reread_config(_config_file, _log_level=None):
+    try:
+        _new = hb_config.build_config(_config_file)
+    except (SystemExit, Exception) as _err:
+        logger.error('RELOAD: configuration not reloaded, keeping the running one -- %s', _err)
+        return None
+    if _log_level:
+        _new['LOGGER']['LOG_LEVEL'] = _log_level
+    return _new
+
+# Bring the running configuration _config up to date with _new without
+# dropping anything that hasn't changed. Changed settings are written into the
+# dictionaries the systems already hold, so they keep their peers, call state
+# and counters; only systems whose socket or registration changed are stopped
+# and started again (once every stopped socket has closed). Logging and the
+# reporting server are only set up at startup, so those changes wait for a
+# restart, as do GLOBAL_RESTART settings for systems already running.
+# Returns a Deferred that fires with the diff once every system is back up;
+# the diff and how long it all took are logged and kept in stats['RELOAD'].
+def reload_config(_config, _new, _report, _obp_class=OPENBRIDGE, _hbp_class=HBSYSTEM, _groups=()):
+    _start = time()
+    # Workers keep their shard and take on their share of any new systems
+    # (_groups are the new systems' bridges, as for start_workers())
+    if 'WORKER' in _config:
+        _index, _shards = _config['WORKER']
+        _enabled = [_system for _system in _new['SYSTEMS'] if _new['SYSTEMS'][_system]['ENABLED']]
+        worker_config(_new, _index, place_systems(_shards, _enabled, _groups))
+        _config['WORKER'] = _new['WORKER']
+
+    _diff = config_diff(_config, _new)
+    for _section in ('GLOBAL', 'ALIASES'):
+        _config[_section].update(_new[_section])
+    for _section in ('REPORTS', 'LOGGER'):
+        if _section in _diff:
+            logger.warning('RELOAD: changes to [%s] take effect at the next restart: %s', _section, ', '.join(_diff[_section]))
+    _global = [_key for _key in _diff.get('GLOBAL', []) if _key in GLOBAL_RESTART]
+    if _global:
+        logger.warning('RELOAD: changes to [GLOBAL] only take effect for systems started from now on: %s', ', '.join(_global))
+
+    _closed = []
+    for _system, (_action, _keys) in sorted(_diff['SYSTEMS'].items()):
+        if _action == 'UPDATE':
+            _settings = _config['SYSTEMS'][_system]
+            for _key in _keys:
+                if _key in _new['SYSTEMS'][_system]:
+                    _settings[_key] = _new['SYSTEMS'][_system][_key]
+                else:
+                    del _settings[_key]
+            systems[_system].config_updated()
+        elif _action in ('REMOVED', 'RESTART'):
+            _closed.append(stop_system(_system))
+            if _action == 'REMOVED':
+                stats.get('PEERS', {}).pop(_system, None)
+
+    # Anything not running now simply takes its new configuration
+    for _system in [_system for _system in _config['SYSTEMS'] if _system not in systems]:
+        if _system in _new['SYSTEMS']:
+            _config['SYSTEMS'][_system] = _new['SYSTEMS'][_system]
+        else:
+            del _config['SYSTEMS'][_system]
+    for _system in [_system for _system in _new['SYSTEMS'] if _system not in _config['SYSTEMS']]:
+        _config['SYSTEMS'][_system] = _new['SYSTEMS'][_system]
+
+    if 'GLOBAL' in _diff:
+        for _system in systems:
+            systems[_system].flush_acl_cache()
+
+    def start_systems(_result):
+        for _system, (_action, _keys) in sorted(_diff['SYSTEMS'].items()):
+            if _action in ('ADDED', 'RESTART'):
+                try:
+                    start_system(_config, _system, _report, _obp_class, _hbp_class)
+                except Exception as _err:
+                    # Disabled, so the next reload tries it again
+                    _config['SYSTEMS'][_system]['ENABLED'] = False
+                    logger.error('(%s) RELOAD: system could not be started -- %s', _system, _err)
+        stats['RELOAD'] = {'TIME': _start, 'DURATION': time() - _start, 'DIFF': _diff}
+        logger.info('RELOAD: configuration reloaded in %.1f ms -- %s', stats['RELOAD']['DURATION'] * 1000, describe_diff(_diff))
+        _report.send_config()
+        return _diff
+    return defer.DeferredList(_closed).addCallback(start_systems)
+
+# Run _reload in the reactor (not the signal handler) on every SIGHUP
+def reload_on_hup(_reload):
+    signal.signal(signal.SIGHUP, lambda _signal, _frame: reactor.callFromThread(_reload))
 
-    return peer_ids, subscriber_ids, talkgroup_ids
 
 #************************************************
 #      MAIN PROGRAM LOOP STARTS HERE
@@ -744,9 +1320,6 @@ def mk_aliases(_config):
 if __name__ == '__main__':
     # Python modules we need
     import argparse
-    import sys
-    import os
-    import signal
 
 
     # Change the current directory to the location of the application
@@ -756,6 +1329,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', action='store', dest='CONFIG_FILE', help='/full/path/to/config.file (usually hblink.cfg)')
     parser.add_argument('-l', '--logging', action='store', dest='LOG_LEVEL', help='Override config file logging level.')
+    parser.add_argument('-w', '--workers', action='store', dest='WORKERS', type=int, default=1, help='Split the systems across this many worker processes.')
+    parser.add_argument('--worker', action='store', dest='WORKER', type=int, help=argparse.SUPPRESS)
     cli_args = parser.parse_args()
 
     # Ensure we have a path for the config file, if one wasn't specified, then use the execution directory
@@ -785,6 +1360,12 @@ if __name__ == '__main__':
 
     peer_ids, subscriber_ids, talkgroup_ids = mk_aliases(CONFIG)
 
+    # Split the systems across worker processes -- from here on we are one of the workers
+    if cli_args.WORKER is not None:
+        join_workers(CONFIG, cli_args.WORKER, cli_args.WORKERS)
+    elif cli_args.WORKERS > 1:
+        start_workers(CONFIG, cli_args.WORKERS)
+
     # INITIALIZE THE REPORTING LOOP
     report_server = config_reports(CONFIG, reportFactory)    
 
@@ -792,11 +1373,13 @@ if __name__ == '__main__':
     logger.info('HBlink \'HBlink.py\' -- SYSTEM STARTING...')
     for system in CONFIG['SYSTEMS']:
         if CONFIG['SYSTEMS'][system]['ENABLED']:
-            if CONFIG['SYSTEMS'][system]['MODE'] == 'OPENBRIDGE':
-                systems[system] = OPENBRIDGE(system, CONFIG, report_server)
-            else:
-                systems[system] = HBSYSTEM(system, CONFIG, report_server)
-            reactor.listenUDP(CONFIG['SYSTEMS'][system]['PORT'], systems[system], interface=CONFIG['SYSTEMS'][system]['IP'])
-            logger.debug('%s instance created: %s, %s', CONFIG['SYSTEMS'][system]['MODE'], system, systems[system])
+            start_system(CONFIG, system, report_server)
+
+    # SIGHUP reloads the configuration file in place
+    def reload_handler():
+        _new = reread_config(cli_args.CONFIG_FILE, cli_args.LOG_LEVEL)
+        if _new:
+            reload_config(CONFIG, _new, report_server)
+    reload_on_hup(reload_handler)
  
     reactor.run()
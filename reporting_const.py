@@ -27,4 +27,5 @@ REPORT_OPCODES = {
     'BRIDGE_UPD': '\x05',
     'LINK_EVENT': '\x06',
     'BRDG_EVENT': '\x07',
+    'STATS_SND':  '\x08',
     }
\ No newline at end of file
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+#
+###############################################################################
+#   Copyright (C) 2018 Cortney T. Buffington, N0MJS <n0mjs@me.com>
+#
+#   This program is free software; you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation; either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program; if not, write to the Free Software Foundation,
+#   Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301  USA
+###############################################################################
+
+'''
+hb_parrot playback, on a task.Clock: recordings go back out 2s after the
+terminator and one frame every 60ms, several can play at once, and nothing
+else waits for them. Run with: trial tests
+'''
+
+import os
+
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from dmr_utils.utils import hex_str_3, hex_str_4
+
+import hb_config
+import hb_const as const
+import hb_parrot
+from hblink import Peer
+
+__author__     = 'Cortney T. Buffington, N0MJS'
+__copyright__  = 'Copyright (c) 2018 Cortney T. Buffington, N0MJS and the K0USY Group'
+__license__    = 'GNU GPLv3'
+__maintainer__ = 'Cort Buffington, N0MJS'
+__email__      = 'n0mjs@me.com'
+
+
+CONFIG_FILE = '''
+[GLOBAL]
+PATH: {PATH}/
+PING_TIME: 5
+MAX_MISSED: 3
+USE_ACL: True
+REG_ACL: PERMIT:ALL
+SUB_ACL: DENY:1
+TGID_TS1_ACL: PERMIT:ALL
+TGID_TS2_ACL: PERMIT:ALL
+
+[REPORTS]
+REPORT: False
+REPORT_INTERVAL: 60
+REPORT_PORT: 4321
+REPORT_CLIENTS: 127.0.0.1
+
+[LOGGER]
+LOG_FILE: /dev/null
+LOG_HANDLERS: null
+LOG_LEVEL: INFO
+LOG_NAME: HBlink
+
+[ALIASES]
+TRY_DOWNLOAD: False
+PATH: {PATH}/
+PEER_FILE: peer_ids.json
+SUBSCRIBER_FILE: subscriber_ids.json
+TGID_FILE: talkgroup_ids.json
+PEER_URL: https://www.radioid.net/static/rptrs.json
+SUBSCRIBER_URL: https://www.radioid.net/static/users.json
+STALE_DAYS: 7
+'''
+
+MASTER_STANZA = '''
+[{NAME}]
+MODE: MASTER
+ENABLED: True
+REPEAT: True
+MAX_PEERS: 10
+EXPORT_AMBE: False
+IP: 127.0.0.1
+PORT: {PORT}
+PASSPHRASE: passw0rd
+GROUP_HANGTIME: 5
+USE_ACL: True
+REG_ACL: PERMIT:ALL
+SUB_ACL: DENY:1
+TGID_TS1_ACL: PERMIT:ALL
+TGID_TS2_ACL: PERMIT:ALL
+'''
+
+FRAME_TIME = 0.06
+PLAYBACK_DELAY = 2
+
+
+# Stands in for the UDP transport: every datagram written, with the time on
+# the clock when it was
+class FakeTransport(object):
+    def __init__(self, _clock):
+        self.clock = _clock
+        self.written = []
+
+    def write(self, _packet, _sockaddr):
+        self.written.append((self.clock.seconds(), _packet, _sockaddr))
+
+
+# A voice call as HBP DMRD frames: header, _superframes of bursts A-F, terminator
+def voice_call(_peer_id, _rf_src, _tgid, _slot, _stream_id, _superframes=2):
+    _slot_bit = 0x80 if _slot == 2 else 0
+    _bits = [const.HBPF_DATA_SYNC << 4 | const.HBPF_SLT_VHEAD]
+    for _ in range(_superframes):
+        _bits += [const.HBPF_VOICE_SYNC << 4] + [const.HBPF_VOICE << 4 | _burst for _burst in range(1, 6)]
+    _bits.append(const.HBPF_DATA_SYNC << 4 | const.HBPF_SLT_VTERM)
+    return [''.join(['DMRD', chr(_seq), hex_str_3(_rf_src), hex_str_3(_tgid), _peer_id, chr(_frame_bits | _slot_bit), hex_str_4(_stream_id), chr(_seq) * 33, '\x00\x00'])
+            for _seq, _frame_bits in enumerate(_bits)]
+
+
+class PlaybackTest(unittest.TestCase):
+
+    def setUp(self):
+        _path = self.mktemp()
+        os.makedirs(_path)
+        _file = os.path.join(_path, 'hblink.cfg')
+        with open(_file, 'w') as _cfg:
+            _cfg.write(CONFIG_FILE.format(PATH=_path) + MASTER_STANZA.format(NAME='PARROT-1', PORT=54001) + MASTER_STANZA.format(NAME='PARROT-2', PORT=54002))
+        _config = hb_config.build_config(_file)
+
+        hb_parrot.ALIASES = ({}, {}, {})
+        self.clock = Clock()
+        self.systems = {}
+        for _name in ('PARROT-1', 'PARROT-2'):
+            _system = self.systems[_name] = hb_parrot.parrot(_name, _config, None)
+            _system.clock = self.clock
+            # What startProtocol() sets up, without starting the maintenance loop
+            _system.transport = FakeTransport(self.clock)
+            _system._write = _system.transport.write
+
+        # Two repeaters on each parrot, as (peer ID, address)
+        self.peers = {}
+        for _index, _name in enumerate(('PARROT-1', 'PARROT-2')):
+            for _n in range(2):
+                self.peers[(_name, _n)] = (hex_str_4(310000 + 10 * _index + _n), ('127.0.0.1', 62000 + 10 * _index + _n))
+                self.log_in(self.systems[_name], *self.peers[(_name, _n)])
+            self.systems[_name].update_peer_list()
+
+    # Put a repeater on a system as if it had just finished logging in
+    def log_in(self, _system, _peer_id, _sockaddr):
+        _peer = _system._peers[_peer_id] = Peer(_peer_id, _sockaddr)
+        _peer.CONNECTION = const.PEER_CONNECTED
+
+    def peer_id(self, _name, _n):
+        return self.peers[(_name, _n)][0]
+
+    def receive(self, _name, _n, _frames):
+        _peer_id, _sockaddr = self.peers[(_name, _n)]
+        for _frame in _frames:
+            self.systems[_name].datagramReceived(_frame, _sockaddr)
+
+    # Advance the clock to _until, stopping at each call's due time on the way,
+    # so everything runs (and is time stamped) exactly when it was scheduled
+    def run_until(self, _until):
+        while True:
+            _due = [_call.getTime() for _call in self.clock.getDelayedCalls() if _call.getTime() <= _until]
+            if not _due:
+                break
+            self.clock.advance(max(min(_due) - self.clock.seconds(), 0))
+        self.clock.advance(_until - self.clock.seconds())
+
+    # What a system sent to one of its repeaters, as (time, frame)
+    def sent(self, _name, _n):
+        _peer_id, _sockaddr = self.peers[(_name, _n)]
+        return [(_time, _packet) for _time, _packet, _to in self.systems[_name].transport.written if _to == _sockaddr]
+
+    # _call's stream played back to one of the system's repeaters, starting 2s
+    # after _ended. Returns the times it went out.
+    def assertPlayedBack(self, _name, _n, _call, _ended):
+        _stream_id = _call[0][16:20]
+        _sent = [(_time, _packet) for _time, _packet in self.sent(_name, _n) if _packet[16:20] == _stream_id and _time >= _ended + PLAYBACK_DELAY - 1e-9]
+        # Frames go back out to each repeater with its own peer ID
+        _peer_id = self.peer_id(_name, _n)
+        self.assertEqual([_packet for _time, _packet in _sent], [_frame[:11] + _peer_id + _frame[15:] for _frame in _call])
+        for _index, (_time, _packet) in enumerate(_sent):
+            self.assertAlmostEqual(_time, _ended + PLAYBACK_DELAY + _index * FRAME_TIME, places=6)
+        return [_time for _time, _packet in _sent]
+
+    def test_playback_timing(self):
+        _call = voice_call(self.peer_id('PARROT-1', 0), 3100001, 9990, 1, 1)
+        self.receive('PARROT-1', 0, _call)
+
+        # Repeated to the other repeater as it came in, nothing played back yet
+        self.assertEqual(len(self.sent('PARROT-1', 1)), len(_call))
+        self.assertEqual(self.sent('PARROT-1', 0), [])
+        self.run_until(PLAYBACK_DELAY - 0.001)
+        self.assertEqual(self.sent('PARROT-1', 0), [])
+
+        self.run_until(PLAYBACK_DELAY + len(_call) * FRAME_TIME + 1)
+        self.assertPlayedBack('PARROT-1', 0, _call, 0)
+        self.assertPlayedBack('PARROT-1', 1, _call, 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_concurrent_playback(self):
+        # Both slots on one parrot and a slot on the other, each ending 0.5s apart
+        _calls = [
+            ('PARROT-1', voice_call(self.peer_id('PARROT-1', 0), 3100001, 9990, 1, 1), 0),
+            ('PARROT-1', voice_call(self.peer_id('PARROT-1', 0), 3100002, 9990, 2, 2), 0.5),
+            ('PARROT-2', voice_call(self.peer_id('PARROT-2', 0), 3100003, 9990, 1, 3), 1.0)
+        ]
+        for _name, _call, _ended in _calls:
+            self.run_until(_ended)
+            self.receive(_name, 0, _call)
+        self.run_until(5)
+
+        # Each went back out on its own schedule, the three overlapping
+        _played = [self.assertPlayedBack(_name, 0, _call, _ended) for _name, _call, _ended in _calls]
+        self.assertLess(_played[1][0], _played[0][-1])
+        self.assertLess(_played[2][0], _played[1][-1])
+
+    def test_traffic_during_playback(self):
+        _call = voice_call(self.peer_id('PARROT-1', 0), 3100001, 9990, 1, 1)
+        self.receive('PARROT-1', 0, _call)
+        self.run_until(PLAYBACK_DELAY + 5 * FRAME_TIME)
+        self.assertTrue(self.clock.getDelayedCalls())
+
+        # A frame to the other parrot mid-playback is repeated straight away,
+        # with the clock where it is
+        _now = self.clock.seconds()
+        _frame = voice_call(self.peer_id('PARROT-2', 0), 3100002, 9990, 1, 2)[1]
+        self.receive('PARROT-2', 0, [_frame])
+        self.assertEqual(self.sent('PARROT-2', 1), [(_now, _frame[:11] + self.peer_id('PARROT-2', 1) + _frame[15:])])
+
+        # ...and the playback carries on as if nothing happened
+        self.run_until(PLAYBACK_DELAY + len(_call) * FRAME_TIME + 1)
+        self.assertPlayedBack('PARROT-1', 0, _call, 0)